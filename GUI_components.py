@@ -16,13 +16,44 @@ from shared.client_message import constructMessage, MessageType, messageToJson
 #Custom classes (styled in GUI.kv)
 
 #scrollable message container
+#when the message log is enabled, only the newest rows are kept while they are in view, and older messages are
+#paged back in from the log when scrolling to the top
 class Messages(RecycleView):
     def __init__(self, **kwargs):
         super(Messages, self).__init__(**kwargs)
         self.data = []
-
-    def addMessage(self, sender, msg):
-        self.data.append({'sender': sender, 'msg': msg})
+        #True once every logged message before the oldest row has been paged in
+        self.historyComplete = False
+        self.bind(scroll_y=self.onScroll)
+
+    #logPosition is the message's position in the message log, if it was logged
+    def addMessage(self, sender, msg, logPosition = None):
+        self.data.append({'sender': sender, 'msg': msg, 'logPosition': logPosition})
+        maxRows = App.get_running_app().historyRows
+        if maxRows > 0 and len(self.data) > maxRows and self.scroll_y <= 0:
+            self.data = self.data[-maxRows:]
+            self.historyComplete = False
+
+    def onScroll(self, instance, scrollY):
+        if scrollY >= 1 and not self.historyComplete:
+            self.loadOlder()
+
+    #pages in the messages logged before the oldest row that came from the log
+    #our own messages are shown before they are logged, so any shown above that row are replaced by their logged copies
+    def loadOlder(self):
+        loadHistory = App.get_running_app().historyLoader
+        if loadHistory == None:
+            return
+        logged = [index for index, row in enumerate(self.data) if row['logPosition'] != None]
+        if len(logged) == 0 and len(self.data) > 0:
+            return
+        rows = loadHistory(self.data[logged[0]]['logPosition'] if len(logged) > 0 else None)
+        if len(rows) == 0:
+            self.historyComplete = True
+            return
+        self.data = rows + self.data[logged[0] if len(logged) > 0 else 0:]
+        #keep the rows that were in view roughly where they were
+        self.scroll_y = 1 - len(rows) / len(self.data)
 
 #top of page errors
 class ErrorStatus(BoxLayout):
@@ -66,6 +97,8 @@ class GUI(App):
     def __init__(self, *args, **kwargs):
         super().__init__(**kwargs)
         Window.bind(on_request_close=self.cleanup)
+        self.historyLoader = None
+        self.historyRows = 0
     
     def cleanup(self, *args):
         App.stop(self)
@@ -74,6 +107,13 @@ class GUI(App):
     def setQueue(self, queue):
         self.queue = queue
 
+    #historyLoader(logPosition) returns the rows logged before logPosition (or the newest, if it is None)
+    #historyRows is the number of rows kept while the newest messages are in view, or 0 to keep every row
+    def setHistory(self, historyLoader, historyRows):
+        self.historyLoader = historyLoader
+        self.historyRows = historyRows
+        Clock.schedule_once(lambda dt: self.root.children[0].children[1].children[0].loadOlder(), 0.001)
+
     def dispatchToQueue(self, message):
         self.queue.put(message)
 
@@ -95,8 +135,8 @@ class GUI(App):
 #************************************************************
 #UI update methods, schedule events for the GUI thread to perform
 
-def textUpdateGUI(sender, message):
-    Clock.schedule_once(lambda dt: App.get_running_app().root.children[0].children[1].children[0].addMessage(sender, message), 0.001)
+def textUpdateGUI(sender, message, logPosition = None):
+    Clock.schedule_once(lambda dt: App.get_running_app().root.children[0].children[1].children[0].addMessage(sender, message, logPosition), 0.001)
 
 def statusUpdateGUI(status, isError):
     Clock.schedule_once(lambda dt: App.get_running_app().setStatusMessage(status, isError), 0.001)
@@ -0,0 +1,130 @@
+import os
+import sys
+import socket
+import struct
+import time
+from threading import Thread
+from queue import Queue
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from shared.network import buildNetworkEntry, continueRead, prependContentLengthHeader
+
+#Microbenchmark for the receive path (continueRead)
+#Streams length-prefixed frames over a local socket pair, and reports the throughput of the current
+#ReceiveBuffer based read loop against the previous implementation (bytes concatenation and fixed 2048 byte reads)
+#
+#usage: python benchmarks/receive_buffer.py
+
+#************************************************************
+#previous implementation, kept for comparison
+
+def legacyContinueRead(networkEntry, messageQueue):
+    headerSize = struct.calcsize('!l')
+    data = networkEntry['connection'].recv(2048)
+    if not data or len(data) == 0:
+        return True
+
+    networkEntry['legacyBuffer'] += data
+    while True:
+        if networkEntry['legacyContentLength'] == None:
+            if len(networkEntry['legacyBuffer']) >= headerSize:
+                networkEntry['legacyContentLength'] = struct.unpack('!l', networkEntry['legacyBuffer'][:headerSize])[0]
+                networkEntry['legacyBuffer'] = networkEntry['legacyBuffer'][headerSize:]
+            else:
+                return False
+
+        if networkEntry['legacyContentLength'] != None and (len(networkEntry['legacyBuffer']) >= networkEntry['legacyContentLength']):
+            message = networkEntry['legacyBuffer'][:networkEntry['legacyContentLength']]
+            networkEntry['legacyBuffer'] = networkEntry['legacyBuffer'][networkEntry['legacyContentLength']:]
+            networkEntry['legacyContentLength'] = None
+            messageQueue.put((networkEntry, message, False))
+        else:
+            return False
+
+
+#************************************************************
+#benchmark
+
+#consumes a frame the way the client's decodeFrame does, by copying it out of the buffer once
+def consumeFrame(networkEntry, frame):
+    return (len(bytes(frame)), None)
+
+
+def sendFrames(connection, frameSize, frameCount):
+    frame = prependContentLengthHeader(b'x' * frameSize)
+    for i in range(frameCount):
+        connection.sendall(frame)
+
+
+#returns throughput in MB/s of reading frameCount frames of frameSize bytes
+def measure(readFunction, frameSize, frameCount):
+    sender, receiver = socket.socketpair()
+    networkEntry = buildNetworkEntry(receiver)
+    networkEntry['legacyBuffer'] = b''
+    networkEntry['legacyContentLength'] = None
+    messageQueue = Queue()
+
+    senderThread = Thread(target=sendFrames, args=(sender, frameSize, frameCount))
+    start = time.perf_counter()
+    senderThread.start()
+    while messageQueue.qsize() < frameCount:
+        if readFunction(networkEntry, messageQueue):
+            break
+    elapsed = time.perf_counter() - start
+    senderThread.join()
+    sender.close()
+    receiver.close()
+    return frameSize * frameCount / elapsed / 1e6
+
+
+def main():
+    cases = [
+        ('small (200B)', 200, 100000),
+        ('medium (10KB)', 10000, 20000),
+        ('large (4MB)', 4 * 1024 * 1024, 20),
+    ]
+    print('{0:<16}{1:>16}{2:>16}'.format('frame size', 'previous MB/s', 'current MB/s'))
+    for name, frameSize, frameCount in cases:
+        legacy = measure(legacyContinueRead, frameSize, frameCount)
+        current = measure(lambda networkEntry, messageQueue: continueRead(networkEntry, messageQueue, consumeFrame), frameSize, frameCount)
+        print('{0:<16}{1:>16.1f}{2:>16.1f}'.format(name, legacy, current))
+
+main()
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
@@ -1,60 +1,86 @@
 from threading import Thread, Lock, Event
-from queue import Queue, Empty
 from concurrent.futures import ThreadPoolExecutor
 from shared.env_handler import loadArgsAndEnvClient, getPeerNames
-from shared.client_message import constructMessage, constructHello, constructHelloResponse, parseJsonMessage, messageToJson, MessageType
+from shared.client_message import constructMessage, constructHello, constructHelloResponse, constructLeaveNetwork, constructRejoin, constructDepartureAck, constructStabilityAck, constructIHave, constructGraft, constructPrune, constructDigest, constructNack, constructStateChunk, constructStateAck, constructStateRequest, parseJsonMessage, messageToJson, MessageType, ProtocolFeature
 from shared.server_message import RegistryMessageType, constructBasicMessage
-from shared.vector_clock import canDeliver, deliverMessage, handleMessageQueue, incrementVectorClock
-from shared.network import continueRead, readSingleMessage, silentFailureClose, sendToSingleAdr, buildNetworkEntry
+from shared.vector_clock import DynamicVectorClock, CausalBuffer, deliverMessage, incrementVectorClock, messageSequence
+from shared.delta_clock import DeltaClockEncoder, DeltaClockDecoder, getDeltaClockStatistics
+from shared.departure import DepartureTracker
+from shared.process_ids import ProcessIdTable, ProcessIdEncoder, ProcessIdDecoder
+from shared.stability import StabilityTracker
+from shared.dedup import SequenceDeduplicator, RecentSenders
+from shared.plumtree import PlumtreeLink, PlumtreeState
+from shared.anti_entropy import RetainedLog, AntiEntropyState, NackScheduler, isAhead
+from shared.state_transfer import TransferSender, TransferReceiver
+from shared.message_log import MessageLog
+from shared.snapshot import saveSnapshot, loadSnapshot, discardSnapshot
+from shared.pipeline import PipelineStage, stopWorker
+from shared.wakeup import Wakeup, seesConcurrentRegistration
+from shared.membership import MembershipTable
+from shared.ingest import IngestPool
+from shared.impairment import NetworkImpairment, ImpairmentProfile, loadProfiles, parseProfiles
+from shared.codec import jsonCodec, binaryCodec, codecForFrame, encodeMessage
+from shared.network import continueRead, readFrames, readSingleMessage, silentFailureClose, sendToSingleAdr, buildNetworkEntry, contentLengthHeader, PeerProtocol
 from GUI_components import GUI, textUpdateGUI, statusUpdateGUI, updateLivePeerCountGUI
 from kivy.lang import Builder
-from kivy.app import App
 import socket
+import asyncio
+import random
 import uuid
 import sys
 import time
 import selectors
-import copy
 import json
+import os
 
 #************************************************************
 #Worker threads
 
 #worker thread for accepting incoming connections
 #creates new network entries representing the connection
+#waits for connections indefinitely, and is woken by shutdownWakeup on shutdown
 def acceptWorker(serverSocket, peers):
-    serverSocket.settimeout(0.1)
+    serverSocket.setblocking(False)
+    acceptSelector = selectors.DefaultSelector()
+    acceptSelector.register(serverSocket, selectors.EVENT_READ, None)
+    acceptSelector.register(shutdownWakeup, selectors.EVENT_READ, None)
     while True:
+        acceptSelector.select()
         if shutdownFlag.is_set():
+            acceptSelector.close()
             return
         try:
             newConnection, adr = serverSocket.accept()
-        except socket.timeout:
+        except BlockingIOError:
             continue
         
         ip = adr[0]
         newConnection.setblocking(False)
         
-        with peersLock:
-            networkEntries[ip] = buildNetworkEntry(newConnection)
-            peers.append(ip)
-            updateLivePeerCountGUI(len(peers))
-        selector.register(newConnection, selectors.EVENT_READ, None)
+        networkEntry = buildNetworkEntry(newConnection, outboundHighWatermark, outboundLowWatermark)
+        peers.add(ip, networkEntry)
+        with networkEntry['lock']:
+            registerConnection(networkEntry)
 
 
 #worker thread for reading messages from connected sockets
 #will read from any socket with available bytes to read
+#also writes queued messages to sockets that have become writable (see queueForPeer)
+#waits on the selector indefinitely, and is woken by shutdownWakeup on shutdown (see shared/wakeup.py)
 def readWorker(messagesToHandle, peers):
     while True:
-        if shutdownFlag.is_set():
-            return
-
-        #safely take the next readable socket
+        #safely take the next ready socket
+        #the other read workers wait for selectorLock meanwhile, and each sees shutdownWakeup once it has the lock
         with selectorLock:
-            selectResult = selector.select(timeout=0.1)
-            if selectResult == []:
+            selectResult = selector.select()
+            if shutdownFlag.is_set():
+                return
+            ready = [(key.fileobj, events) for key, events in selectResult if key.fileobj is not shutdownWakeup and key.fileobj is not selectorWakeup]
+            if len(ready) < len(selectResult):
+                selectorWakeup.clear()
+            if len(ready) == 0:
                 continue
-            readableSocket = selectResult[0][0].fileobj
+            readableSocket, events = ready[0]
             selector.unregister(readableSocket)
             
         #avoid crash if socket has already closed
@@ -62,111 +88,395 @@ def readWorker(messagesToHandle, peers):
             peer = readableSocket.getpeername()[0]
         except socket.error:
             continue
-        networkEntry = networkEntries.get(peer, None)
+        networkEntry = peers.current().get(peer)
         if networkEntry == None:
             continue
 
-        #read available messages
+        frames = []
         with networkEntry['lock']:
-            readfailed = continueRead(networkEntry, messagesToHandle)
-
-        #add socket back to selector if read didn't error out
-        if readfailed:
+            failed = False
+            #write queued messages
+            if events & selectors.EVENT_WRITE:
+                try:
+                    networkEntry['outbound'].flush(readableSocket)
+                except socket.error as err:
+                    print('[ERR] Error writing to', readableSocket, err)
+                    failed = True
+
+            #read available messages
+            #with the ingest pool, frames are decoded once the link's lock is released (see ingestFrames)
+            if not failed and events & selectors.EVENT_READ:
+                if ingestPool == None:
+                    failed = continueRead(networkEntry, messagesToHandle, parseFrame)
+                else:
+                    frames = readFrames(networkEntry)
+                    failed = frames == None
+
+            #add socket back to selector if neither errored out
+            if not failed and not frames:
+                registerConnection(networkEntry)
+
+        #the socket is only added back to the selector once its frames are queued, so they stay in order
+        if not failed and frames:
+            ingestFrames(networkEntry, frames, messagesToHandle)
+            with networkEntry['lock']:
+                registerConnection(networkEntry)
+
+        if failed:
             handlePeerFailure(peer, peers)
-        else:
-            selector.register(readableSocket, selectors.EVENT_READ, None)
                 
 
 #worker thread for broadcasting enqueued messages
 #used for sending own messages, and for rebroadcasting messages from other peers
-def broadcastWorker(outgoingMessageQueue, receivedMessages, peers):
-    global processVectorClock 
-
-    #pass in queue once GUI is ready for binding
-    while True:
-        if App.get_running_app():
-            App.get_running_app().setQueue(outgoingMessageQueue)
-            #could do this somewhere else, but fuck it
-            with peersLock:
-                updateLivePeerCountGUI(len(peers))
-            break
-        time.sleep(0.005)
-    
-    #once UI is setup, begin handling broadcasts
+#the GUI is given the queue for our own messages when it's started (see main)
+def broadcastWorker(outgoingMessageQueue, peers):
     while True:
-        if shutdownFlag.is_set():
+        receivedMessage = outgoingMessageQueue.get()
+        if receivedMessage is stopWorker:
             return
-        try:
-            receivedMessage = outgoingMessageQueue.get(timeout=0.1)
-        except Empty:
+
+        started = time.perf_counter()
+
+        #messages being relayed are queued already parsed, along with the frame they were received in if it
+        #can be forwarded unchanged (see decodeFrame), and the link they were received on
+        #our own messages come back from the delivery worker this way too, once they have been stamped
+        if isinstance(receivedMessage, tuple):
+            parsedMessage, relayFrame, ingress = receivedMessage
+            broadcastToPeers(None, peers, parsedMessage, relayFrame, ingress)
+            sendStage.serviced(started)
             continue
         
         parsedMessage = parseJsonMessage(receivedMessage, [], False)
         if parsedMessage == None:
             return
         
-        #if message originates from UI, hydrate with local clock and processId
+        #if message originates from UI, the delivery worker hydrates it with our clock and processId (see stampMessage)
         #otherwise, retransmit without changes
         if parsedMessage['sender'] == None:
-            receivedMessages[parsedMessage['id']] = True
-            with vectorClockLock:
-                processVectorClock = incrementVectorClock(processVectorClock, processId)
-                outgoingMessage = messageToJson(constructMessage(MessageType.BROADCAST_MESSAGE, processVectorClock, parsedMessage['text'], processId, processIp))
+            deliveryStage.put(parsedMessage)
         else:
-            outgoingMessage = receivedMessage
-        broadcastToPeers(outgoingMessage, peers)
+            broadcastToPeers(receivedMessage, peers, parsedMessage)
+        sendStage.serviced(started)
 
 
 #worker thread for controlling message flow and responding to HELLO/HELLO_RESPONSE messages
 #passes off rebroadcast tasks to the broadcast worker
-def handlerWorker(messagesToHandle, receivedMessages, delayedMessages, outgoingMessageQueue, peers, preInitialisedReceivedMessages):
+def handlerWorker(messagesToHandle, receivedMessages, outgoingMessageQueue, peers, preInitialisedReceivedMessages):
     while True:
-        if shutdownFlag.is_set():
+        messageInfo = messagesToHandle.get()
+        if messageInfo is stopWorker:
             return
-        try:
-            messageInfo = messagesToHandle.get(timeout=0.1)
-        except Empty:
-            continue
+        started = time.perf_counter()
 
-        message = parseJsonMessage(messageInfo[1], [], True)
+        #frames are parsed by the read workers (see decodeFrame)
+        message = messageInfo[1]
         if message == None:
             print("[ERR] Got bad message")
             continue
 
         peerNetworkData = messageInfo[0]
 
-        #ADDITION FOR DEMONSTRATION
-        #NOT REQUIRED FOR APP TO FUNCTION
-        #SIMULATES NETWORK DELAY BY ADDING MESSAGES TO THE QUEUE AFTER 5 SECONDS HAVE PASSED
-        if int(env['ENABLE_NETWORK_DELAY']) == 1 and message['type'] == MessageType.BROADCAST_MESSAGE:
-            try:
-                if message['senderIp'] == env['THROTTLED_IP']:
-                    #if we haven't held the message back before, create a new thread
-                    #to re-add it back to messages after some time has passed
-                    if messageInfo[2] == False:
-                        with delayedMessageLock:
-                            if delayedMessages.get(message['id'], None) == None:
-                                delayedMessages[message['id']] = True
-                                print('[INFO] Delaying delivery of message: {0}'.format(message['text']))
-                                def delayedDeliveryCallback(messageInfo, messagesToHandle):
-                                    time.sleep(int(env['MOCK_NETWORK_DELAY']))
-                                    messagesToHandle.put((messageInfo[0], messageInfo[1], True))
-                                delayedDeliveryThread = Thread(target=delayedDeliveryCallback, args=(messageInfo, messagesToHandle,))
-                                delayedDeliveryThread.start()
-                        continue
-            except socket.error:
-                continue
-
         #handle messages
         if message['type'] == MessageType.HELLO:
             handleHello(peerNetworkData, message, peers, preInitialisedReceivedMessages)
         if message['type'] == MessageType.HELLO_RESPONSE:
-            handleHelloResponse(peerNetworkData, message, preInitialisedReceivedMessages)
+            handleHelloResponse(peerNetworkData, message, peers, preInitialisedReceivedMessages)
         if message['type'] == MessageType.BROADCAST_MESSAGE:
-            handleBroadcastMessage(message, receivedMessages, outgoingMessageQueue)
-        if message == None:
-            print('[ERR] Parse error'.format(id))
-            continue
+            handleBroadcastMessage(peerNetworkData, message, messageInfo[2], outgoingMessageQueue, peers, preInitialisedReceivedMessages)
+        if message['type'] == MessageType.LEAVE_NETWORK:
+            handleLeaveNetwork(message, receivedMessages, outgoingMessageQueue, peers)
+        if message['type'] == MessageType.DEPARTURE_ACK:
+            handleDepartureAck(message, receivedMessages, outgoingMessageQueue, peers)
+        if message['type'] == MessageType.REJOIN:
+            handleRejoin(message, receivedMessages, outgoingMessageQueue, peers)
+        if message['type'] == MessageType.STABILITY_ACK:
+            handleStabilityAck(message, outgoingMessageQueue)
+        if message['type'] == MessageType.IHAVE:
+            handleIHave(peerNetworkData, message)
+        if message['type'] == MessageType.GRAFT:
+            handleGraft(peerNetworkData, message)
+        if message['type'] == MessageType.PRUNE:
+            handlePrune(peerNetworkData)
+        if message['type'] == MessageType.DIGEST:
+            handleDigest(peerNetworkData, message)
+        if message['type'] == MessageType.NACK:
+            handleNack(peerNetworkData, message)
+        if message['type'] == MessageType.STATE_CHUNK:
+            handleStateChunk(peerNetworkData, message, peers)
+        if message['type'] == MessageType.STATE_ACK:
+            handleStateAck(peerNetworkData, message)
+        if message['type'] == MessageType.STATE_REQUEST:
+            handleStateRequest(peerNetworkData, message)
+        handleStage.serviced(started)
+
+
+#worker thread that owns causal delivery (see shared/pipeline.py)
+#handler workers pass it received broadcasts, and broadcast workers our own messages to stamp with our clock
+#takes the messages that are waiting in batches, under a single acquisition of vectorClockLock
+def deliveryWorker(outgoingMessageQueue, peers):
+    while True:
+        batch = deliveryStage.getBatch(deliveryBatchSize)
+        stopping = batch[-1] is stopWorker
+        if stopping:
+            batch.pop()
+            if len(batch) == 0:
+                return
+        started = time.perf_counter()
+
+        stamped = []
+        with vectorClockLock:
+            received = []
+            for message in batch:
+                if message['sender'] != None:
+                    #a process we retired that sends a new message is still alive (see isDuplicateBroadcast)
+                    if processVectorClock.isRetired(message['sender']):
+                        reinstateProcess(message['sender'], 0)
+                    received.append(message)
+                    continue
+                #our own message depends on everything delivered before it was sent, so received messages that were
+                #queued before it are delivered first
+                causalBuffer.addAll(processVectorClock, received, deliver)
+                received = []
+                stamped.append(stampMessage(message))
+            causalBuffer.addAll(processVectorClock, received, deliver)
+
+        for message in stamped:
+            #mark the message as received, so copies relayed back to us are ignored
+            broadcastDeduplicator.receive(processId, message['seq'])
+            if retainingBroadcasts:
+                retainedLog.remember(message, message['seq'])
+            outgoingMessageQueue.put((message, None, None))
+
+        #delivering messages from a departing process changes what we need to acknowledge
+        if len(departureTracker.departures) > 0:
+            acknowledgeDepartures(peers)
+        deliveryStage.serviced(started, len(batch))
+        if stopping:
+            return
+
+
+#hydrates a message from the UI with our clock and processId
+#called by the delivery worker, with vectorClockLock held
+def stampMessage(message):
+    global processVectorClock
+    processVectorClock = incrementVectorClock(processVectorClock, processId)
+    causalBuffer.release(processVectorClock, processId, processVectorClock.get(processId), deliver)
+    stamped = constructMessage(MessageType.BROADCAST_MESSAGE, processVectorClock.toList(), message['text'], processId, processIp)
+    #logged under the lock, so each sender's broadcasts are logged in sequence order
+    if messageLogEnabled:
+        messageLog.append(processId, stamped['seq'], messageToJson(stamped).encode('utf-8'))
+    return stamped
+
+#************************************************************
+#Asyncio I/O engine
+
+#worker thread running the event loop that does all of the socket IO when the asyncio engine is enabled
+#replaces the accept and read workers - each connection has its own PeerProtocol, so there is no selector shared
+#between threads, and sockets aren't unregistered and re-registered on every read
+#messages are still handled and broadcast by the handler and broadcast workers
+def ioLoopWorker(acceptSocket, messagesToHandle, peers):
+    asyncio.set_event_loop(ioLoop)
+    ioLoop.run_until_complete(serveConnections(acceptSocket, messagesToHandle, peers))
+
+
+#hands the connections made at startup to the event loop, then accepts incoming connections until shutdown
+#accepts until cancelled on shutdown (see stopServing)
+async def serveConnections(acceptSocket, messagesToHandle, peers):
+    acceptSocket.setblocking(False)
+    try:
+        for peer, networkEntry in peers.current().members:
+            await attachConnection(peer, networkEntry, messagesToHandle, peers)
+
+        while True:
+            newConnection, adr = await ioLoop.sock_accept(acceptSocket)
+            ip = adr[0]
+            networkEntry = buildNetworkEntry(newConnection, outboundHighWatermark, outboundLowWatermark)
+            peers.add(ip, networkEntry)
+            await attachConnection(ip, networkEntry, messagesToHandle, peers)
+    except asyncio.CancelledError:
+        pass
+
+    transports = [networkEntry['transport'] for peer, networkEntry in peers.current().members if networkEntry['transport'] != None]
+    for transport in transports:
+        transport.abort()
+
+
+#stops the event loop accepting connections, and closes them (see serveConnections)
+#runs on the event loop, scheduled by main on shutdown
+def stopServing():
+    for task in asyncio.all_tasks(ioLoop):
+        task.cancel()
+
+
+#wraps a connected socket in a PeerProtocol, and writes anything that was queued for the peer before it was attached
+async def attachConnection(peer, networkEntry, messagesToHandle, peers):
+    #peer failures announce departures and broadcast, so are handled off the event loop
+    def connectionLost(networkEntry):
+        if not shutdownFlag.is_set():
+            ioLoop.run_in_executor(None, handlePeerFailure, peer, peers)
+
+    try:
+        await ioLoop.connect_accepted_socket(lambda: PeerProtocol(networkEntry, messagesToHandle, parseFrame, connectionLost), networkEntry['connection'])
+    except OSError as err:
+        print('[ERR] Error attaching connection', networkEntry['connection'], err)
+        connectionLost(networkEntry)
+        return
+    flushToTransport(networkEntry)
+
+
+#hands a link's queued messages to its transport, which writes them as the socket allows
+#runs on the event loop, scheduled by queueForPeer
+def flushToTransport(networkEntry):
+    with networkEntry['lock']:
+        transport = networkEntry['transport']
+        if transport == None or transport.is_closing():
+            return
+        outbound = networkEntry['outbound']
+        wasCongested = outbound.congested
+        transport.writelines(outbound.takeAll())
+        outbound.congested = transport.get_protocol().writingPaused
+        noteCongestion(networkEntry, wasCongested)
+
+
+#************************************************************
+#Frame decoding
+
+#parses a frame read from a peer's connection
+#returns None if the parse failed, the frame is a broadcast we have already received, or it is held back by the impairment layer
+#runs on the read worker in the order frames arrived on the connection, as delta clocks
+#are relative to the previous message on the link and must be rebuilt in that order
+#(the same applies to the process numbers a peer sends when interning process ids)
+#returns the message, and the frame as (codec name, bytes) if it is a broadcast that can be relayed to other peers as is
+def decodeFrame(networkEntry, frame):
+    #frames say which codec they were encoded with, so both can be received on any link
+    #the frame is a view into the connection's receive buffer, so anything kept from it has to be copied
+    codec = codecForFrame(frame)
+    checked = False if linkImpaired(networkEntry) else checkEnvelope(networkEntry, codec, frame)
+    if checked == None:
+        return None
+    return applyLinkState(networkEntry, codec, frame, codec.decode(frame), checked)
+
+
+#most broadcasts are duplicates under flooding, so the envelope is checked before decoding the whole frame
+#returns None if the frame is a duplicate broadcast, True if it is a new broadcast, or False if it has to be decoded to tell
+#(frames carrying link state - a delta clock, or new process numbers - still have to be decoded)
+#must be called while holding the link's lock
+def checkEnvelope(networkEntry, codec, frame):
+    envelope = codec.peekEnvelope(frame)
+    if envelope == None:
+        return False
+    sender, sequence = envelope
+    if isinstance(sender, int) and networkEntry['idDecoder'] != None:
+        sender = networkEntry['idDecoder'].uuids.get(sender, sender)
+    if isinstance(sender, int):
+        return False
+    if isDuplicateBroadcast(networkEntry, sender, sequence, True):
+        noteRedundantBroadcast(networkEntry)
+        return None
+    return True
+
+
+#rebuilds a decoded message's delta clock and process ids from the link's state, and drops duplicate broadcasts
+#checked is True if the frame's envelope has already been checked for duplicates (see checkEnvelope)
+#returns the same as decodeFrame
+#must be called while holding the link's lock, in the order frames arrived on the link
+def applyLinkState(networkEntry, codec, frame, message, checked):
+    #a frame that doesn't depend on link state (a full clock of uuids) means the same thing on every link
+    relayFrame = None
+    if message != None and message['type'] == MessageType.BROADCAST_MESSAGE and isinstance(message['sender'], str) and 'clockDelta' not in message:
+        relayFrame = (codec.name, bytes(frame))
+    if message != None and isinstance(message.get('sender', None), int):
+        if networkEntry['idDecoder'] == None:
+            networkEntry['idDecoder'] = ProcessIdDecoder()
+        message = networkEntry['idDecoder'].decodeMessage(message)
+    if message != None and 'clockDelta' in message:
+        if networkEntry['clockDecoder'] == None:
+            networkEntry['clockDecoder'] = DeltaClockDecoder()
+        message['clock'] = networkEntry['clockDecoder'].decode(message.pop('clockDelta'))
+    if message == None:
+        print('[ERR] Got bad message')
+        return None
+
+    if message['type'] == MessageType.BROADCAST_MESSAGE:
+        #impaired broadcasts are checked for duplicates once they are released (see releaseImpaired)
+        if impairment != None and impairment.submit(networkEntry, message, relayFrame, len(frame)):
+            return None
+        if not checked and isDuplicateBroadcast(networkEntry, message['sender'], messageSequence(message), False):
+            noteRedundantBroadcast(networkEntry)
+            return None
+        if plumtreeEnabled:
+            noteTreeReceipt(networkEntry, message)
+    return (message, relayFrame)
+
+
+#decodes a frame (see decodeFrame), recording how long it took as the parse stage's service time
+def parseFrame(networkEntry, frame):
+    started = time.perf_counter()
+    decoded = decodeFrame(networkEntry, frame)
+    parseStage.serviced(started)
+    return decoded
+
+
+#decodes the frames read from a link in the ingest pool (see shared/ingest.py), and queues the messages to be handled
+#envelopes are checked before the frames are sent to the pool, and link state applied once they are decoded, both in
+#the order the frames arrived, while the link's lock is only released for the decode
+#the connection must be out of the selector, so no other read worker reads from it in the meantime
+def ingestFrames(networkEntry, frames, messagesToHandle):
+    started = time.perf_counter()
+    with networkEntry['lock']:
+        networkEntry['statistics']['received'] += len(frames)
+        checkedFrames = []
+        impaired = linkImpaired(networkEntry)
+        for frame in frames:
+            codec = codecForFrame(frame)
+            checked = False if impaired else checkEnvelope(networkEntry, codec, frame)
+            if checked != None:
+                checkedFrames.append((codec, frame, checked))
+
+    messages = ingestPool.decode([frame for codec, frame, checked in checkedFrames])
+
+    with networkEntry['lock']:
+        for (codec, frame, checked), message in zip(checkedFrames, messages):
+            decoded = applyLinkState(networkEntry, codec, frame, message, checked)
+            if decoded != None:
+                messagesToHandle.put((networkEntry, decoded[0], decoded[1]))
+    parseStage.serviced(started, len(frames))
+
+
+#returns True if broadcasts arriving on a link may be impaired (see shared/impairment.py)
+#their envelopes aren't checked for duplicates, as that records them as received before they are released
+#must be called while holding the link's lock
+def linkImpaired(networkEntry):
+    return impairment != None and impairment.impairsLink(networkEntry)
+
+
+#called from the impairment layer's thread as each held broadcast becomes due (see shared/impairment.py)
+#drops it if it is a duplicate, as applyLinkState would have, and queues it to be handled
+def releaseImpaired(networkEntry, message, relayFrame):
+    with networkEntry['lock']:
+        if isDuplicateBroadcast(networkEntry, message['sender'], messageSequence(message), False):
+            noteRedundantBroadcast(networkEntry)
+            return
+        if plumtreeEnabled:
+            noteTreeReceipt(networkEntry, message)
+    handleStage.put((networkEntry, message, relayFrame))
+
+
+#records a broadcast as received over a link
+#returns True if we have already received it, or its sender has been retired before sending it
+#(a retired process sending a newer message has come back, see handleBroadcastMessage)
+def isDuplicateBroadcast(networkEntry, sender, sequence, beforeDecode):
+    if seenTrackingEnabled:
+        recentSenders.record(sender, sequence, networkEntry)
+    retiredSequence = processVectorClock.retiredSequence(sender)
+    if (retiredSequence == None or sequence > retiredSequence) and broadcastDeduplicator.receive(sender, sequence):
+        with messageLock:
+            duplicateStatistics['received'] += 1
+        return False
+    with messageLock:
+        duplicateStatistics['beforeDecode' if beforeDecode else 'afterDecode'] += 1
+    return True
+
 
 #************************************************************
 #Message handlers
@@ -174,7 +484,6 @@ def handlerWorker(messagesToHandle, receivedMessages, delayedMessages, outgoingM
 #reply to hello messages with copy of own state
 def handleHello(networkEntry, message, peers, preInitialisedReceivedMessages):
     global processVectorClock
-    global processMessageQueue
 
     #allow other nodes to initialise by cloning a node with no peers
     #this allows the first connection to be made
@@ -190,14 +499,28 @@ def handleHello(networkEntry, message, peers, preInitialisedReceivedMessages):
     except socket.error:
         peer = None
 
+    networkEntry['processId'] = message['sender']
+    negotiateFeatures(networkEntry, message)
+
+    #a process restarting from a snapshot only needs what its snapshot clock doesn't cover (see shared/snapshot.py)
+    resuming = message.get('resume', None) != None
+    if resuming and initialisationComplete.is_set() and resumeProcess(networkEntry, message, peer, peers):
+        return
+
+    #add the new process to our clock, so that it's counted as a live process when retiring departed processes
+    #a resuming process we don't know joins as a new process instead, so its old uuid isn't added
+    if not resuming:
+        with vectorClockLock:
+            processVectorClock.merge([[message['sender'], 0]])
+
     #case where we provide clone data as an unconnected, uninitialized peer
     if (not initialisationComplete.is_set()) and initiallyUnconnected.is_set():
         with vectorClockLock:
             with preInitialisedLock:
-                emptyHelloResponse = messageToJson(constructHelloResponse(processId, processIp, processVectorClock, preInitialisedReceivedMessages))
+                emptyHelloResponse = messageToJson(constructHelloResponse(processId, processIp, processVectorClock.toList(), preInitialisedReceivedMessages, localFeatures()))
         
         with networkEntry['lock']:
-            if sendToSingleAdr(emptyHelloResponse, networkEntry['connection']):
+            if queueForPeer(networkEntry, emptyHelloResponse.encode('utf-8')):
                 handlePeerFailure(peer, peers)
                 print('[ERR] Failed to send clone data to peer. Remaining unitialised')
                 return
@@ -205,58 +528,157 @@ def handleHello(networkEntry, message, peers, preInitialisedReceivedMessages):
         #initialise after sending peer data
         with vectorClockLock:
             with preInitialisedLock:
-                processVectorClock = handleMessageQueue(processVectorClock, preInitialisedReceivedMessages, None, textUpdateGUI)
+                causalBuffer.addAll(processVectorClock, preInitialisedReceivedMessages, deliver)
         print('[INFO] Initialised with clock {0}'.format(processVectorClock))
         register()
         initialisationComplete.set()
         return
 
     #case where we provide clone data as an initialised node in the network
+    #the snapshot is taken under the lock, but encoded outside it, so deliveries aren't held up while it's encoded
+    with vectorClockLock:
+        departures = {departed: departure['lastSequence'] for departed, departure in departureTracker.departures.items()}
+        clock = processVectorClock.toList()
+        retired = processVectorClock.retiredList()
+        undeliveredMessages = causalBuffer.pendingMessages()
+    sendCloneData(networkEntry, peer, peers, clock, undeliveredMessages, retired, departures)
+
+
+#replies to a process restarting from a snapshot with the messages its snapshot clock doesn't cover, reinstating
+#its clock entry if it had been retired (see shared/snapshot.py)
+#returns False if we don't know the process, in which case it joins as a new process
+def resumeProcess(networkEntry, message, peer, peers):
+    resumed = message['sender']
+    resumeClock = DynamicVectorClock(message['resume'])
     with vectorClockLock:
-        helloResponse = messageToJson(constructHelloResponse(processId, processIp, processVectorClock, processMessageQueue))
+        if resumed not in processVectorClock and not processVectorClock.isRetired(resumed):
+            return False
+        reinstateProcess(resumed, resumeClock.get(resumed))
+        lastSequence = processVectorClock.get(resumed)
+        departures = {departed: departure['lastSequence'] for departed, departure in departureTracker.departures.items()}
+        clock = processVectorClock.toList()
+        retired = processVectorClock.retiredList()
+        undeliveredMessages = causalBuffer.pendingMessages()
+
+    #every other process reinstates it too, if they have retired it or are retiring it
+    broadcastToPeers(messageToJson(constructRejoin(processId, processIp, resumed, lastSequence)), peers)
+
+    #sender --> sequence --> the messages we can send that the snapshot clock doesn't cover
+    available = {}
+    for broadcast in undeliveredMessages + missedBroadcasts(message['resume'], 0):
+        sequence = messageSequence(broadcast)
+        if broadcast['sender'] != resumed and sequence > resumeClock.get(broadcast['sender']):
+            available.setdefault(broadcast['sender'], {})[sequence] = broadcast
+
+    #the clock the resuming process adopts: its snapshot clock, except for senders whose messages we no longer have
+    #all of, which it skips ahead to our entry for, the same as a process joining for the first time
+    adoptedClock = DynamicVectorClock(message['resume'])
+    for sender, counter in clock:
+        if sender == resumed:
+            continue
+        fromSequence = resumeClock.get(sender)
+        missing = any(sequence not in available.get(sender, {}) for sequence in range(fromSequence + 1, counter + 1))
+        adoptedClock.merge([[sender, counter if missing else fromSequence]])
+    messages = [broadcast for sender, broadcasts in available.items() for sequence, broadcast in broadcasts.items() if sequence > adoptedClock.get(sender)]
+    messages.sort(key=messageSequence)
+
+    print('[INFO] Process {0} resumed from a snapshot, sending it {1} messages'.format(resumed, len(messages)))
+    sendCloneData(networkEntry, peer, peers, adoptedClock.toList(), messages, retired, departures, lastSequence)
+    return True
+
+
+#sends a HELLO_RESPONSE with our state (or the state a resuming process adopts) to a process saying hello
+def sendCloneData(networkEntry, peer, peers, clock, undeliveredMessages, retired, departures, resumed = None):
+    #undelivered messages follow in chunks, once the peer has adopted the snapshot (see shared/state_transfer.py)
+    if ProtocolFeature.CHUNKED_STATE in networkEntry['features']:
+        transferId = str(uuid.uuid4())
+        transfer = {'id': transferId, 'chunks': transferSender.start(transferId, undeliveredMessages)}
+        helloResponse = messageToJson(constructHelloResponse(processId, processIp, clock, [], localFeatures(), retired, departures, transfer, resumed))
+    else:
+        helloResponse = messageToJson(constructHelloResponse(processId, processIp, clock, undeliveredMessages, localFeatures(), retired, departures, None, resumed))
 
     with networkEntry['lock']:
-        if sendToSingleAdr(helloResponse, networkEntry['connection']):
+        if queueForPeer(networkEntry, helloResponse.encode('utf-8')):
             handlePeerFailure(peer, peers)
             print('[ERR] Failed to send clone data to peer')
-            return
 
 
 #consume hello response to build initial peer state
 #once complete, process is an exact clone of another peer's previous state
-def handleHelloResponse(networkEntry, message, preInitialisedReceivedMessages):
+def handleHelloResponse(networkEntry, message, peers, preInitialisedReceivedMessages):
     global processVectorClock
-    global processMessageQueue
 
-    #discard message if we have already cloned a process
-    if initialisationComplete.is_set():
-        return
-    
+    #every peer we said hello to replies, so features are negotiated even if we have already initialised
+    networkEntry['processId'] = message['sender']
+    negotiateFeatures(networkEntry, message)
+    #the clock a resuming process adopts isn't the peer's own
+    if stabilityTrackingEnabled and message.get('resumed', None) == None:
+        stabilityTracker.observe(message['sender'], message['clock'])
 
     #join messages we captured prior to initialisation with the undelivered messages
     #received from the cloned processes
+    joinedAsNewProcess = False
     with vectorClockLock:
         with preInitialisedLock:
-            processMessageQueue = message['undeliveredMessages'] + preInitialisedReceivedMessages
-            joinedClock = message['clock'] + processVectorClock #entire received clock + our single clock entry
-            processVectorClock = handleMessageQueue(joinedClock, processMessageQueue, None, textUpdateGUI)
+            #discard message if we have already cloned a process
+            #checked under the lock, as several HELLO_RESPONSEs can be handled at once
+            if initialisationComplete.is_set():
+                return
+
+            #the peer doesn't know the process we were, so we have to join as a new one
+            if resumeSnapshot != None and message.get('resumed', None) == None:
+                startAsNewProcess()
+                joinedAsNewProcess = True
+
+            if resumeSnapshot != None:
+                #we keep our clock, only adopting the entries the peer couldn't send us every missing message for
+                for retiredEntry in message.get('retired', []):
+                    departed = retiredEntry[0] if isinstance(retiredEntry, list) else retiredEntry
+                    if not processVectorClock.isRetired(departed):
+                        retireProcess(departed)
+                processVectorClock.merge(message['clock'])
+                processVectorClock.set(processId, max(processVectorClock.get(processId), message['resumed']))
+                broadcastDeduplicator.advance(message['clock'])
+                undeliveredMessages = message['undeliveredMessages'] + resumeSnapshot['pending']
+            else:
+                #entire received clock + our single clock entry, without any processes the cloned process has retired
+                processVectorClock = DynamicVectorClock(message['clock'], message.get('retired', [])).merge(processVectorClock)
+                #we won't receive the messages the cloned process had already delivered
+                broadcastDeduplicator.advance(message['clock'])
+                undeliveredMessages = message['undeliveredMessages']
+            for departed, lastSequence in message.get('departures', {}).items():
+                departureTracker.announce(departed, lastSequence)
+            causalBuffer.addAll(processVectorClock, undeliveredMessages + preInitialisedReceivedMessages, deliver)
             print('[INFO] Initialised with clock {0}'.format(processVectorClock))
             register()
             initialisationComplete.set()
+
+    #peers add our new uuid to their clocks when we say hello with it
+    if joinedAsNewProcess:
+        sayHello(peers, None)
+
+    #ask for the first chunks of the peer's undelivered messages, if they follow the snapshot
+    transfer = message.get('transfer', None) or {'id': None, 'chunks': 0}
+    transferReceiver.start(transfer['id'], networkEntry, transfer['chunks'])
+    if transfer['chunks'] > 0:
+        sendStateAck(networkEntry, transfer['id'], 0)
+    else:
+        reportJoin()
+
+    #acknowledge any departures that were in progress when we cloned
+    acknowledgeDepartures(peers)
     
 
 #handle broadcast messages received from other processes
 #vector clock ensures causal delviery of received broadcasts
-def handleBroadcastMessage(message, receivedMessages, outgoingMessageQueue):
-    global processVectorClock
-    global processMessageQueue
+#relayFrame is the frame the message was received in, if it can be relayed as is (see decodeFrame)
+def handleBroadcastMessage(networkEntry, message, relayFrame, outgoingMessageQueue, peers, preInitialisedReceivedMessages):
 
-    #avoid double processing messages
-    with messageLock:
-        if message['id'] in receivedMessages:
-            return
-        #add to list of received messages
-        receivedMessages[message['id']] = True
+    #duplicates have already been dropped by the read workers (see decodeFrame)
+
+    #peers may graft the message from us, or be missing it (see handleGraft / handleDigest)
+    if retainingBroadcasts:
+        retainedLog.remember(message, messageSequence(message))
 
     #while our setup is incomplete, don't broadcast to peers, and don't attempt to deliver
     #simply enqueue and return - delivery will be handled once setup completes
@@ -266,18 +688,346 @@ def handleBroadcastMessage(message, receivedMessages, outgoingMessageQueue):
             return
 
     #broadcast to other peers (reliable broadcast, so each receipt will broadcast to all other known nodes)
-    jsonMessage = messageToJson(message)
-    outgoingMessageQueue.put(jsonMessage)
+    outgoingMessageQueue.put((message, relayFrame, networkEntry))
 
     #if this processId is the sender of the message, don't worry about delivering message
     if not message['sender'] == processId:
-        with vectorClockLock:
-            if canDeliver(processVectorClock, message):
-                processVectorClock = deliverMessage(processVectorClock, message, processId, textUpdateGUI)
-            else:
-                processMessageQueue.append(message)
+        #the sender had delivered everything in the message's clock when it sent the message
+        if stabilityTrackingEnabled:
+            stabilityTracker.observe(message['sender'], message['clock'])
+        #delivered by the delivery worker (see shared/pipeline.py)
+        deliveryStage.put(message)
+
+
+#handle announcements that a process has left the network
+#flooded through the network the same way as broadcasts
+def handleLeaveNetwork(message, receivedMessages, outgoingMessageQueue, peers):
+    if not markReceived(message, receivedMessages):
+        return
+    relayControlMessage(message, outgoingMessageQueue)
+
+    #other than our own leave message coming back to us, we can only be reported as departed if a peer lost its connection to us
+    #the rest of the network will retire our clock entry, so our future messages can't be ordered
+    if message['departed'] == processId:
+        if message['sender'] == processId or shutdownFlag.is_set():
+            return
+        #processes that can restart from a snapshot reinstate themselves instead (see shared/snapshot.py)
+        if snapshotRestartEnabled and initialisationComplete.is_set():
+            with vectorClockLock:
+                rejoinMessage = messageToJson(constructRejoin(processId, processIp, processId, processVectorClock.get(processId)))
+            print('[INFO] This process was reported as having left the network, rejoining')
+            broadcastToPeers(rejoinMessage, peers)
+            return
+        print('[ERR] This process was reported as having left the network. Restart to rejoin.')
+        statusUpdateGUI('REMOVED FROM NETWORK - RESTART TO REJOIN', True)
+        return
+
+    with vectorClockLock:
+        if processVectorClock.isRetired(message['departed']):
+            return
+        if departureTracker.announce(message['departed'], message['lastSequence']):
+            print('[INFO] Process {0} left the network'.format(message['departed']))
+    acknowledgeDepartures(peers)
+
+
+#handle announcements that a process reported as having left the network has come back
+#flooded through the network the same way as LEAVE_NETWORK
+def handleRejoin(message, receivedMessages, outgoingMessageQueue, peers):
+    if not markReceived(message, receivedMessages):
+        return
+    relayControlMessage(message, outgoingMessageQueue)
+    if message['rejoined'] == processId:
+        return
+
+    with vectorClockLock:
+        reinstateProcess(message['rejoined'], message['lastSequence'])
+        causalBuffer.rescan(processVectorClock, deliver)
+
+
+#handle acknowledgements of how many of a departed process's messages a process has delivered
+def handleDepartureAck(message, receivedMessages, outgoingMessageQueue, peers):
+    if not markReceived(message, receivedMessages):
+        return
+    relayControlMessage(message, outgoingMessageQueue)
+    if message['departed'] == processId:
+        return
+
+    with vectorClockLock:
+        if processVectorClock.isRetired(message['departed']):
+            return
+        departureTracker.acknowledge(message['departed'], message['sender'], message['delivered'])
+    retireDepartedProcesses()
+
+
+#handle periodic reports of which messages a process has delivered
+#only relayed if they tell us something new, which also stops the flood
+def handleStabilityAck(message, outgoingMessageQueue):
+    if message['sender'] == processId or processVectorClock.isRetired(message['sender']):
+        return
+    if stabilityTracker.observe(message['sender'], message['clock']):
+        relayControlMessage(message, outgoingMessageQueue)
+
+
+#handle announcements of broadcasts a peer using plumtree has received, but didn't push to us
+#broadcasts we haven't received are grafted from the peer if they don't arrive in time (see plumtreeWorker)
+def handleIHave(networkEntry, message):
+    if networkEntry['treeLink'] == None:
+        return
+    for sender, sequence in message['broadcasts']:
+        if not processVectorClock.isRetired(sender) and not broadcastDeduplicator.contains(sender, sequence):
+            plumtreeState.announced(sender, sequence, networkEntry)
+
+
+#handle requests for broadcasts a peer was announced but didn't receive
+#the link rejoins the broadcast tree, and the broadcasts are sent if we still have them
+def handleGraft(networkEntry, message):
+    treeLink = networkEntry['treeLink']
+    if treeLink == None:
+        return
+    #looked up before taking the link's lock, as they may be read from the message log
+    grafted = []
+    for sender, sequence in message['broadcasts'][:antiEntropyReplyLimit]:
+        broadcast = lookupBroadcast(sender, sequence)
+        if broadcast != None:
+            grafted.append(broadcast)
+    with networkEntry['lock']:
+        treeLink.eager = True
+        for broadcast in grafted:
+            #a failed write is picked up by the next read from the connection
+            if queueForPeer(networkEntry, encodeBroadcastForLink(networkEntry, broadcast)):
+                return
+
+
+#handle a peer using plumtree leaving the link out of its broadcast tree
+def handlePrune(networkEntry):
+    if networkEntry['treeLink'] == None:
+        return
+    with networkEntry['lock']:
+        networkEntry['treeLink'].eager = False
+
+
+#handle a peer's summary of the broadcasts it has delivered
+#sends the peer the broadcasts it has missed, and pulls any we have missed by replying with our own digest
+def handleDigest(networkEntry, message):
+    if not initialisationComplete.is_set():
+        return
+
+    #broadcasts received within the last interval are most likely still on their way to the peer
+    #a peer that is far behind is sent a batch per digest, and no more once its connection is congested, so its
+    #backlog is never all queued in memory at once
+    missing = missedBroadcasts(message['clock'], antiEntropyState.interval, antiEntropyReplyLimit)
+    served = 0
+    if len(missing) > 0:
+        with networkEntry['lock']:
+            for broadcast in missing:
+                if networkEntry['outbound'].congested:
+                    break
+                #a failed write is picked up by the next read from the connection
+                if queueForPeer(networkEntry, encodeBroadcastForLink(networkEntry, broadcast)):
+                    return
+                served += 1
+        with messageLock:
+            antiEntropyState.statistics['served'] += served
+
+    remoteClock = [entry for entry in message['clock'] if not processVectorClock.isRetired(entry[0])]
+    with vectorClockLock:
+        clock = processVectorClock.toList()
+    if isAhead(remoteClock, clock) and antiEntropyState.mayReply(message['sender']):
+        sendDigest(networkEntry, clock)
+        with messageLock:
+            antiEntropyState.statistics['replies'] += 1
+
+
+#handle a peer's request for broadcasts it is missing
+#retransmits the requested broadcasts we still have, at most antiEntropyReplyLimit of them
+def handleNack(networkEntry, message):
+    #ranges come from the peer, so they are clamped to the broadcasts we could have received, and the broadcasts are
+    #looked up before taking the link's lock, as they may be read from the message log
+    requested = []
+    for sender, first, last in message['ranges']:
+        if not isinstance(sender, str) or not isinstance(first, int) or not isinstance(last, int):
+            continue
+        last = min(last, broadcastDeduplicator.highest(sender), max(first, 1) + antiEntropyReplyLimit - len(requested) - 1)
+        for sequence in range(max(first, 1), last + 1):
+            broadcast = lookupBroadcast(sender, sequence)
+            if broadcast != None:
+                requested.append(broadcast)
+        if len(requested) >= antiEntropyReplyLimit:
+            break
+
+    retransmitted = 0
+    with networkEntry['lock']:
+        for broadcast in requested:
+            #a failed write is picked up by the next read from the connection
+            if queueForPeer(networkEntry, encodeBroadcastForLink(networkEntry, broadcast)):
+                return
+            retransmitted += 1
+    with messageLock:
+        nackScheduler.statistics['retransmitted'] += retransmitted
+
+
+#handle a chunk of the undelivered messages of the peer we initialised from
+#messages are added to the causal buffer as they arrive, so delivery starts before the transfer completes
+def handleStateChunk(networkEntry, message, peers):
+    if not initialisationComplete.is_set():
+        return
+    with vectorClockLock:
+        causalBuffer.addAll(processVectorClock, message['messages'], deliver)
+
+    received = transferReceiver.chunkHandled(message['transfer'], message['chunks'], len(message['messages']))
+    if received == None:
+        return
+    if received < message['chunks']:
+        sendStateAck(networkEntry, message['transfer'], received)
+    else:
+        reportJoin()
+
+    #delivering messages from a departing process changes what we need to acknowledge
+    if len(departureTracker.departures) > 0:
+        acknowledgeDepartures(peers)
+
+
+#handle a joining process acknowledging chunks of a state transfer, by sending it the chunks its window now allows
+def handleStateAck(networkEntry, message):
+    chunks, sendable = transferSender.acknowledge(message['transfer'], message['received'])
+    sendStateChunks(networkEntry, message['transfer'], chunks, sendable)
+
+
+#handle a joining process resuming a state transfer that was interrupted by its peer failing
+#sends the undelivered and retained messages its clock doesn't cover
+def handleStateRequest(networkEntry, message):
+    remoteClock = DynamicVectorClock(message['clock'])
+    with vectorClockLock:
+        undeliveredMessages = causalBuffer.pendingMessages()
+    messages = {}
+    for broadcast in undeliveredMessages + missedBroadcasts(message['clock'], 0):
+        if messageSequence(broadcast) > remoteClock.get(broadcast['sender']):
+            messages[broadcast['id']] = broadcast
+
+    chunks = transferSender.start(message['transfer'], list(messages.values()))
+    if chunks == 0:
+        #an empty chunk tells the joining process the transfer is complete
+        sendStateChunks(networkEntry, message['transfer'], 1, [(0, [])])
+        return
+    chunks, sendable = transferSender.acknowledge(message['transfer'], 0)
+    sendStateChunks(networkEntry, message['transfer'], chunks, sendable)
+
+
+#records a control message (LEAVE_NETWORK / DEPARTURE_ACK) as received
+#returns False if the message has already been received
+#broadcasts are deduplicated by sender and sequence number instead (see decodeFrame)
+def markReceived(message, receivedMessages):
+    with messageLock:
+        if message['id'] in receivedMessages:
+            return False
+        #add to list of received messages
+        receivedMessages[message['id']] = True
+        return True
+
+
+#rebroadcasts a control message (LEAVE_NETWORK / DEPARTURE_ACK) to our peers
+#our own messages have already been sent to every peer, so aren't rebroadcast when they come back to us
+def relayControlMessage(message, outgoingMessageQueue):
+    if message['sender'] != processId and initialisationComplete.is_set():
+        outgoingMessageQueue.put((message, None, None))
+
+
+#delivers a message to the UI and merges its clock into our own
+#only called by the causal buffer, with vectorClockLock held
+def deliver(message):
+    global processVectorClock
+    if not messageLogEnabled:
+        processVectorClock = deliverMessage(processVectorClock, message, processId, textUpdateGUI)
+        return
+
+    #the UI pages older messages in from the log, starting from the position of the oldest one it shows
+    position = messageLog.append(message['sender'], messageSequence(message), messageToJson(message).encode('utf-8'))
+    processVectorClock = deliverMessage(processVectorClock, message, processId, lambda sender, text: textUpdateGUI(sender, text, position))
+
+
+#************************************************************
+#Departure helpers
+
+#announces that departed has left the network, used when our connection to it fails
+def announceDeparture(departed, peers):
+    with vectorClockLock:
+        if processVectorClock.isRetired(departed):
+            return
+        lastSequence = processVectorClock.get(departed)
+        if not departureTracker.announce(departed, lastSequence):
+            return
+        leaveMessage = messageToJson(constructLeaveNetwork(processId, processIp, departed, lastSequence))
+
+    print('[INFO] Process {0} left the network'.format(departed))
+    broadcastToPeers(leaveMessage, peers)
+    acknowledgeDepartures(peers)
+
+
+#gracefully leaves the network, announcing how many messages we have sent
+def leaveNetwork(peers):
+    with vectorClockLock:
+        leaveMessage = messageToJson(constructLeaveNetwork(processId, processIp, processId, processVectorClock.get(processId)))
+    broadcastToPeers(leaveMessage, peers)
+
+
+#waits (up to timeout seconds) for every peer's queued messages to be written
+def drainOutboundQueues(peers, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        #with the asyncio engine, queued messages may also be waiting in the transport
+        if all(networkEntry['outbound'].isEmpty() and (networkEntry['transport'] == None or networkEntry['transport'].get_write_buffer_size() == 0)
+                for peer, networkEntry in peers.current().members):
+            return
+        time.sleep(0.01)
+
+
+#sends an ack for each departure whose delivered count has changed since we last acknowledged it
+def acknowledgeDepartures(peers):
+    if not initialisationComplete.is_set():
+        return
+    with vectorClockLock:
+        acks = departureTracker.pendingAcknowledgements(processVectorClock, processId)
+    for departed, delivered in acks:
+        broadcastToPeers(messageToJson(constructDepartureAck(processId, processIp, departed, delivered)), peers)
+    retireDepartedProcesses()
+
 
-            processVectorClock = handleMessageQueue(processVectorClock, processMessageQueue, message, textUpdateGUI)
+#retires the clock entries of departed processes once every live process has delivered all of their messages
+def retireDepartedProcesses():
+    with vectorClockLock:
+        retired = departureTracker.readyToRetire(processVectorClock)
+        for departed in retired:
+            retireProcess(departed)
+        if len(retired) > 0:
+            causalBuffer.rescan(processVectorClock, deliver)
+
+
+#drops a departed process's clock entry, and everything we keep about it
+#called with vectorClockLock held
+def retireProcess(departed):
+    processVectorClock.retire(departed)
+    departureTracker.complete(departed)
+    stabilityTracker.forget(departed)
+    broadcastDeduplicator.forget(departed)
+    plumtreeState.forget(departed)
+    retainedLog.forget(departed)
+    nackScheduler.forget(departed)
+    processIdTable.forget(departed)
+    print('[INFO] Retired clock entry for {0}, clock now has {1} entries'.format(departed, len(processVectorClock)))
+
+
+#adds a process that has come back (see shared/snapshot.py) back to our clock, at counter if we had retired it,
+#and stops retiring it if its departure was in progress
+#called with vectorClockLock held
+def reinstateProcess(rejoined, counter):
+    if processVectorClock.isRetired(rejoined):
+        processVectorClock.reinstate(rejoined, counter)
+        #messages it sent before it was retired have all been delivered
+        broadcastDeduplicator.advance([[rejoined, processVectorClock.get(rejoined)]])
+        print('[INFO] Process {0} rejoined the network, clock now has {1} entries'.format(rejoined, len(processVectorClock)))
+    elif departureTracker.isDeparting(rejoined):
+        print('[INFO] Process {0} rejoined the network'.format(rejoined))
+    departureTracker.complete(rejoined)
 
 
 #************************************************************
@@ -292,49 +1042,577 @@ def buildSenderSocket():
 
 
 #sends a single message to all peers
-def broadcastToPeers(message, peers):
-
-    #clone peer list so that multiple workers to broadcast different messages
-    #simultaneously (e.g. one thread retransmitting broadcast, one thread sending new message) 
-    with peersLock:
-        currentPeers = copy.deepcopy(peers)
-    
-    for peer in currentPeers:
-        networkEntry = networkEntries[peer]
-        if networkEntry == None or networkEntry['connection'] == None:
+#message is the json encoded message, and can be None if the parsed message is provided instead
+#if the parsed broadcast message is provided, it is re-encoded for peers that negotiated delta clocks, interned process ids, or the binary codec
+#relayFrame is the (codec name, bytes) frame a relayed message was received in, if it can be sent on unchanged (see decodeFrame)
+#ingress is the network entry of the link a relayed message was received on
+def broadcastToPeers(message, peers, parsedMessage = None, relayFrame = None, ingress = None):
+
+    #the membership is an immutable snapshot (see shared/membership.py), so it can be iterated while peers connect and fail
+    membership = peers.current()
+
+    #(header, payload) pairs, encoded and framed once per codec and shared by every peer that doesn't need its own encoding
+    payloads = {}
+    if message != None:
+        payloads[jsonCodec.name] = framePayload(message.encode('utf-8'))
+    if relayFrame != None:
+        payloads[relayFrame[0]] = framePayload(relayFrame[1])
+    isBroadcast = parsedMessage != None and parsedMessage['type'] == MessageType.BROADCAST_MESSAGE
+    isRelay = isBroadcast and parsedMessage['sender'] != processId
+    encodings = 0
+    skipped = {'skippedIngress': 0, 'skippedOrigin': 0, 'skippedSeen': 0}
+    seenBy = recentSenders.linksFor(parsedMessage['sender'], messageSequence(parsedMessage)) if isRelay and seenTrackingEnabled else []
+
+    for peer, networkEntry in membership.members:
+        if networkEntry['connection'] == None:
             continue
+
+        #a relayed broadcast isn't sent back to peers that already have it: the peer it arrived from, its sender,
+        #and (if tracked) peers that have sent us a copy
+        if isRelay:
+            skipReason = relaySkipReason(networkEntry, parsedMessage, ingress, seenBy)
+            if skipReason != None:
+                skipped[skipReason] += 1
+                continue
         
         with networkEntry['lock']:
-            sendFailed = sendToSingleAdr(message, networkEntry['connection'])
+            #links using plumtree are only pushed broadcasts while they are in the broadcast tree, otherwise (or while
+            #the link is congested) the broadcast is announced in the next IHAVE (see plumtreeWorker)
+            treeLink = networkEntry['treeLink']
+            if isBroadcast and treeLink != None and (not treeLink.eager or (isRelay and networkEntry['outbound'].congested)):
+                if treeLink.eager:
+                    outboundStatistics['skippedRelays'] += 1
+                treeLink.announcements.append([parsedMessage['sender'], messageSequence(parsedMessage)])
+                continue
+
+            #don't add to the backlog of a peer that can't keep up with messages it may also receive from its other peers
+            if isRelay and networkEntry['outbound'].congested:
+                outboundStatistics['skippedRelays'] += 1
+                continue
+
+            #only broadcasts are sent with the link's codec
+            codec = networkEntry['codec'] if isBroadcast and networkEntry['codec'] != None else jsonCodec
+
+            #delta clocks and process numbers depend on what was previously sent on the link, so encode under the link's lock
+            if isBroadcast and (networkEntry['clockEncoder'] != None or networkEntry['idEncoder'] != None):
+                sendFailed = queueForPeer(networkEntry, encodeMessage(codec, encodeForLink(networkEntry, parsedMessage)))
+                encodings += 1
+            else:
+                if codec.name not in payloads:
+                    payloads[codec.name] = framePayload(encodeMessage(codec, parsedMessage))
+                    encodings += 1
+                header, payload = payloads[codec.name]
+                sendFailed = queueForPeer(networkEntry, payload, header)
 
         if sendFailed:
             handlePeerFailure(peer, peers)
 
+    if isRelay:
+        with messageLock:
+            relayStatistics['relayed'] += 1
+            relayStatistics['encodings'] += encodings
+            for skipReason, count in skipped.items():
+                relayStatistics[skipReason] += count
+
+
+#returns the relayStatistics key for why a relayed broadcast doesn't need to be sent to a peer, or None if it does
+#seenBy is the list of links that have sent us the broadcast recently (see RecentSenders)
+def relaySkipReason(networkEntry, parsedMessage, ingress, seenBy):
+    if networkEntry is ingress:
+        return 'skippedIngress'
+    if networkEntry['processId'] == parsedMessage['sender']:
+        return 'skippedOrigin'
+    if any(seenLink is networkEntry for seenLink in seenBy):
+        return 'skippedSeen'
+    return None
+
+
+#returns the (header, payload) pair for an encoded message
+def framePayload(payload):
+    return (contentLengthHeader(payload), payload)
+
+
+#queues an encoded message (and its header, if already built) for a peer, and writes as much of the peer's queue as its socket will take
+#anything left over is written by the read workers once the socket becomes writable, so a slow peer never blocks the caller
+#returns True if the connection failed
+#must be called while holding the link's lock
+def queueForPeer(networkEntry, payload, header = None):
+    outbound = networkEntry['outbound']
+    wasCongested = outbound.congested
+    #if messages are already waiting, the socket is already being watched for writes
+    wasEmpty = outbound.isEmpty()
+    outbound.enqueue(payload, header)
+    networkEntry['statistics']['sent'] += 1
+    noteCongestion(networkEntry, wasCongested)
+    if not wasEmpty:
+        return False
+
+    #the event loop does all of the writing when the asyncio engine is enabled
+    if asyncioEngineEnabled:
+        ioLoop.call_soon_threadsafe(flushToTransport, networkEntry)
+        return False
+
+    try:
+        if not outbound.flush(networkEntry['connection']):
+            watchForWrites(networkEntry)
+    except socket.error as err:
+        print('[ERR] Error writing to', networkEntry['connection'], err)
+        return True
+    return False
+
+
+#records a link becoming congested
+#must be called while holding the link's lock
+def noteCongestion(networkEntry, wasCongested):
+    if networkEntry['outbound'].congested and not wasCongested:
+        outboundStatistics['congestionEvents'] += 1
+        print('[INFO] Connection to {0} is congested, holding back relayed messages'.format(networkEntry['processId']))
+
+
+#adds a connection to the selector, watching for writes if it has queued messages
+#must be called while holding the link's lock
+def registerConnection(networkEntry):
+    events = selectors.EVENT_READ
+    if not networkEntry['outbound'].isEmpty():
+        events |= selectors.EVENT_WRITE
+    selector.register(networkEntry['connection'], events, None)
+    selectorChanged()
+
+
+#starts watching a connection for writes
+#if the connection isn't in the selector, a read worker is handling it, and will re-register it with registerConnection
+#must be called while holding the link's lock
+def watchForWrites(networkEntry):
+    try:
+        selector.modify(networkEntry['connection'], selectors.EVENT_READ | selectors.EVENT_WRITE, None)
+    except KeyError:
+        return
+    selectorChanged()
+
+
+#wakes the read worker waiting on the selector, if it wouldn't otherwise see a change made to the selector while waiting
+def selectorChanged():
+    if not selectorSeesRegistrations:
+        selectorWakeup.set()
+
+
+#re-encodes a broadcast message using the link's negotiated encodings
+#must be called while holding the link's lock
+def encodeForLink(networkEntry, parsedMessage):
+    encodedMessage = parsedMessage
+    if networkEntry['clockEncoder'] != None:
+        encodedMessage = networkEntry['clockEncoder'].encodeMessage(encodedMessage)
+    if networkEntry['idEncoder'] != None:
+        encodedMessage = networkEntry['idEncoder'].encodeMessage(encodedMessage)
+    return encodedMessage
+
+
+#encodes a single broadcast for a link, with the link's codec and negotiated encodings
+#must be called while holding the link's lock
+def encodeBroadcastForLink(networkEntry, parsedMessage):
+    codec = networkEntry['codec'] if networkEntry['codec'] != None else jsonCodec
+    if networkEntry['clockEncoder'] != None or networkEntry['idEncoder'] != None:
+        parsedMessage = encodeForLink(networkEntry, parsedMessage)
+    return encodeMessage(codec, parsedMessage)
+
+
 #helper, used to update peer list and network info when a peer's connection fails
 #if peers fall to 0, triggers the display of a warning message
 def handlePeerFailure(peer, peers):
     print('[ERR] Connection with {0} failed. Removing from peer list'.format(peer))
-    with peersLock:
-        networkEntry = networkEntries.get(peer, None)
-        if networkEntry == None:
-            return
-        connection = networkEntry['connection']
-        del networkEntries[peer]
-        peers.remove(peer)
-        silentFailureClose(connection)
-        remainingPeers = len(peers)
-        updateLivePeerCountGUI(remainingPeers)
-
-        #If there was some point in time where we were not connected to any peers
-        #we might have missed all broadcasts of a message, so all messages that were causally linked to that message
-        #can never be delivered. It's important to flag to the user that we may be in that state
-        #so they know that it's possible they may never receive another message, and can decide to restart.
-        #
-        #In a real application, it would make sense to shut the app completely
-        #but as this is a demo, it's better to show we are able to detect this type of failure
-        if remainingPeers == 0:
-            statusUpdateGUI('NEW MESSAGES MAY NOT HAVE BEEN RECEIVED', True)
-            print('[INFO] Temporarily severed from all peers - future received messages may be undeliverable')
+    networkEntry, membership = peers.remove(peer)
+    if networkEntry == None:
+        return
+    departed = networkEntry['processId']
+    try:
+        selector.unregister(networkEntry['connection'])
+    except (KeyError, ValueError):
+        pass
+    closeConnection(networkEntry)
+
+    #If there was some point in time where we were not connected to any peers
+    #we might have missed all broadcasts of a message, so all messages that were causally linked to that message
+    #can never be delivered. It's important to flag to the user that we may be in that state
+    #so they know that it's possible they may never receive another message, and can decide to restart.
+    #
+    #In a real application, it would make sense to shut the app completely
+    #but as this is a demo, it's better to show we are able to detect this type of failure
+    if len(membership) == 0:
+        statusUpdateGUI('NEW MESSAGES MAY NOT HAVE BEEN RECEIVED', True)
+        print('[INFO] Temporarily severed from all peers - future received messages may be undeliverable')
+
+    #broadcasts the peer was relaying may have been lost with it, so check with the remaining peers
+    antiEntropyState.forgetPeer(departed)
+    antiEntropyState.touch()
+
+    #the rest of a state transfer from the peer has to come from another peer
+    if transferReceiver.isArrivingOver(networkEntry) and not shutdownFlag.is_set():
+        resumeStateTransfer(peers)
+
+    #the peer's process has left the network, gracefully or otherwise
+    #announce it so that its clock entry can eventually be retired
+    if departed != None and not shutdownFlag.is_set():
+        announceDeparture(departed, peers)
+
+
+#closes a peer's connection
+#a connection owned by the event loop has to be closed by the event loop
+def closeConnection(networkEntry):
+    if networkEntry['transport'] != None:
+        ioLoop.call_soon_threadsafe(networkEntry['transport'].abort)
+    else:
+        silentFailureClose(networkEntry['connection'])
+
+
+#************************************************************
+#Stability helpers
+
+#periodically acknowledges our clock, and updates the stable frontier
+def stabilityWorker(peers):
+    lastAcknowledged = None
+    while not shutdownFlag.wait(float(env.get('STABILITY_ACK_INTERVAL', 5))):
+        if not initialisationComplete.is_set():
+            continue
+
+        with vectorClockLock:
+            clock = processVectorClock.toList()
+            #departing processes no longer need anything, and stop acknowledging, so they don't hold the frontier back
+            members = [uuid for uuid, counter in clock if not departureTracker.isDeparting(uuid)]
+            stabilityTracker.observe(processId, clock)
+            stabilityTracker.updateFrontier(members)
+
+        if clock != lastAcknowledged:
+            broadcastToPeers(messageToJson(constructStabilityAck(processId, processIp, clock)), peers)
+            lastAcknowledged = clock
+
+
+#************************************************************
+#Plumtree helpers
+
+#periodically announces the broadcasts that weren't pushed over lazy links, grafts announced broadcasts that
+#haven't arrived in time, and forgets broadcasts that can no longer be grafted
+def plumtreeWorker(peers):
+    #announcements are batched, but sent often enough that a graft timeout covers a few of them
+    while not shutdownFlag.wait(plumtreeState.graftTimeout / 4):
+        for peer, networkEntry in peers.current().members:
+            with networkEntry['lock']:
+                treeLink = networkEntry['treeLink']
+                if treeLink == None or len(treeLink.announcements) == 0:
+                    continue
+                announcements = treeLink.announcements
+                treeLink.announcements = []
+                sendFailed = queueForPeer(networkEntry, messageToJson(constructIHave(processId, processIp, announcements)).encode('utf-8'))
+            with messageLock:
+                plumtreeState.statistics['announced'] += len(announcements)
+            if sendFailed:
+                handlePeerFailure(peer, peers)
+
+        #grafting a broadcast puts the announcing link (back) in the broadcast tree
+        #a link that failed in the meantime is skipped, and the broadcast grafted from the next peer that announced it
+        for networkEntry, broadcasts in plumtreeState.dueGrafts(peers.current().contains, broadcastDeduplicator.contains):
+            with networkEntry['lock']:
+                networkEntry['treeLink'].eager = True
+                queueForPeer(networkEntry, messageToJson(constructGraft(processId, processIp, broadcasts)).encode('utf-8'))
+            with messageLock:
+                plumtreeState.statistics['grafted'] += len(broadcasts)
+
+        evictRetainedBroadcasts()
+
+
+#records the arrival of a new broadcast over a link using plumtree
+#the link it arrived on is in the broadcast tree, and the broadcast no longer needs to be grafted
+#called by decodeFrame, with the link's lock held
+def noteTreeReceipt(networkEntry, message):
+    plumtreeState.received(message['sender'], messageSequence(message))
+    treeLink = networkEntry['treeLink']
+    if treeLink != None and not treeLink.eager:
+        treeLink.eager = True
+
+
+#records the arrival of a broadcast we already have
+#the link it arrived on is redundant, so a link using plumtree is left out of the broadcast tree, at both ends
+#called by decodeFrame, with the link's lock held
+def noteRedundantBroadcast(networkEntry):
+    treeLink = networkEntry['treeLink']
+    if treeLink == None or not treeLink.eager:
+        return
+    treeLink.eager = False
+    #a failed write is picked up by the next read from the connection
+    queueForPeer(networkEntry, messageToJson(constructPrune(processId, processIp)).encode('utf-8'))
+    with messageLock:
+        plumtreeState.statistics['pruned'] += 1
+
+
+#************************************************************
+#Anti-entropy helpers
+
+#periodically sends every peer a digest of the broadcasts we have delivered, while the node is active
+#(see shared/anti_entropy.py), and forgets broadcasts no peer can still need
+def antiEntropyWorker(peers):
+    while not shutdownFlag.wait(antiEntropyState.interval):
+        if not initialisationComplete.is_set():
+            continue
+        evictRetainedBroadcasts()
+
+        with vectorClockLock:
+            clock = processVectorClock.toList()
+            holding = causalBuffer.pendingDepth() > 0
+        if not antiEntropyState.isActive(clock, holding):
+            continue
+
+        for peer, networkEntry in peers.current().members:
+            #peers that are still connecting will be sent our state in their HELLO_RESPONSE
+            if networkEntry['processId'] != None and sendDigest(networkEntry, clock):
+                handlePeerFailure(peer, peers)
+
+
+#sends a peer a digest of our clock
+#returns True if the connection failed
+def sendDigest(networkEntry, clock):
+    payload = messageToJson(constructDigest(processId, processIp, clock)).encode('utf-8')
+    with networkEntry['lock']:
+        sendFailed = queueForPeer(networkEntry, payload)
+    with messageLock:
+        antiEntropyState.statistics['digests'] += 1
+        antiEntropyState.statistics['digestBytes'] += len(payload)
+    return sendFailed
+
+
+#periodically NACKs the broadcasts that have held messages back for longer than the NACK timeout
+def nackWorker(peers):
+    while not shutdownFlag.wait(nackScheduler.timeout / 4):
+        if not initialisationComplete.is_set():
+            continue
+        with vectorClockLock:
+            gaps = causalBuffer.gapsOlderThan(nackScheduler.timeout)
+            if len(gaps) == 0:
+                continue
+            delivered = dict(processVectorClock.toList())
+
+        for sender, first, last in nackScheduler.due(gaps, delivered):
+            if sendNack(sender, [[sender, first, last]], peers):
+                with messageLock:
+                    nackScheduler.statistics['nacked'] += last - first + 1
+
+
+#sends a NACK for broadcasts from sender to the sender itself (if it is a peer) and randomly chosen other peers
+#returns True if it was sent to any peer
+def sendNack(sender, ranges, peers):
+    candidates = peers.current().members
+    origin = [candidate for candidate in candidates if candidate[1]['processId'] == sender]
+    others = [candidate for candidate in candidates if candidate[1]['processId'] not in (sender, None)]
+    targets = (origin + random.sample(others, len(others)))[:nackScheduler.fanout]
+
+    payload = messageToJson(constructNack(processId, processIp, ranges)).encode('utf-8')
+    for peer, networkEntry in targets:
+        with networkEntry['lock']:
+            sendFailed = queueForPeer(networkEntry, payload)
+        if sendFailed:
+            handlePeerFailure(peer, peers)
+    with messageLock:
+        nackScheduler.statistics['nacks'] += len(targets)
+    return len(targets) > 0
+
+
+#forgets retained broadcasts that no peer can still need (see RetainedLog)
+#broadcasts in the message log are served from disk instead, so only those not delivered yet are kept in memory
+def evictRetainedBroadcasts():
+    if messageLogEnabled:
+        retainedLog.evict(messageLog.isLogged)
+    else:
+        retainedLog.evict(stabilityTracker.isStable if stabilityTrackingEnabled else None)
+
+
+#returns a broadcast we have kept for peers that miss it, from memory or the message log, or None
+def lookupBroadcast(sender, sequence):
+    broadcast = retainedLog.lookup(sender, sequence)
+    if broadcast == None and messageLogEnabled:
+        body = messageLog.lookup(sender, sequence)
+        if body != None:
+            broadcast = parseJsonMessage(body, [], True)
+    return broadcast
+
+
+#returns the broadcasts we have kept that a clock doesn't cover, in sequence order per sender
+#broadcasts received within the last age seconds are left out, and at most limit are returned (the oldest), if it is set
+def missedBroadcasts(clock, age, limit = None):
+    missing = {broadcast['id']: broadcast for broadcast in retainedLog.newerThan(clock, time.monotonic() - age, limit)}
+    if messageLogEnabled:
+        #the log outlives clock entries, so only broadcasts from current members are sent
+        isMember = lambda sender: sender in processVectorClock and not processVectorClock.isRetired(sender)
+        for body in messageLog.newerThan(clock, time.time() - age, isMember, limit):
+            broadcast = parseJsonMessage(body, [], True)
+            if broadcast != None:
+                missing.setdefault(broadcast['id'], broadcast)
+    return sorted(missing.values(), key=messageSequence)[:limit]
+
+
+#************************************************************
+#State transfer helpers
+
+#sends the (index, messages) chunks of a state transfer of chunks to a joining process
+def sendStateChunks(networkEntry, transferId, chunks, sendable):
+    for index, messages in sendable:
+        payload = messageToJson(constructStateChunk(processId, processIp, transferId, index, chunks, messages)).encode('utf-8')
+        with networkEntry['lock']:
+            #a failed write is picked up by the next read from the connection
+            if queueForPeer(networkEntry, payload):
+                return
+
+
+#acknowledges that we have handled received chunks of a state transfer
+def sendStateAck(networkEntry, transferId, received):
+    payload = messageToJson(constructStateAck(processId, processIp, transferId, received)).encode('utf-8')
+    with networkEntry['lock']:
+        #a failed write is picked up by the next read from the connection
+        queueForPeer(networkEntry, payload)
+
+
+#asks another peer for the rest of a state transfer, after the peer it was arriving from failed
+def resumeStateTransfer(peers):
+    candidates = [(peer, networkEntry) for peer, networkEntry in peers.current().members if ProtocolFeature.CHUNKED_STATE in networkEntry['features']]
+    if len(candidates) == 0:
+        #anything still missing is recovered by anti-entropy and NACKs, if they are enabled
+        print('[ERR] State transfer interrupted, and no peer can resume it')
+        transferReceiver.start(None, None, 0)
+        return
+
+    peer, networkEntry = random.choice(candidates)
+    transferId = str(uuid.uuid4())
+    transferReceiver.resume(transferId, networkEntry)
+    with vectorClockLock:
+        clock = processVectorClock.toList()
+    print('[INFO] Resuming state transfer from {0}'.format(peer))
+    payload = messageToJson(constructStateRequest(processId, processIp, transferId, clock)).encode('utf-8')
+    with networkEntry['lock']:
+        sendFailed = queueForPeer(networkEntry, payload)
+    if sendFailed:
+        handlePeerFailure(peer, peers)
+
+
+#prints how long joining the network took, once our state transfer has completed
+def reportJoin():
+    statistics = transferReceiver.statistics
+    if statistics['helloSent'] == None or statistics['completed'] == None:
+        return
+    print('[INFO] Joined the network in {0:.1f}ms: initialised from a snapshot after {1:.1f}ms, then received {2} undelivered messages in {3} chunks ({4} resumed transfers)'.format(
+        (statistics['completed'] - statistics['helloSent']) * 1000, (statistics['initialised'] - statistics['helloSent']) * 1000,
+        statistics['messages'], statistics['chunks'], statistics['resumed']))
+
+
+#************************************************************
+#Message log helpers
+
+#writes and fsyncs logged broadcasts in groups, every commit interval (see shared/message_log.py)
+def messageLogWorker():
+    while not shutdownFlag.wait(float(env.get('MESSAGE_LOG_COMMIT_INTERVAL', 0.05))):
+        messageLog.commit()
+
+
+#returns a page of the messages logged before position (or the newest, if position is None) as rows for the UI,
+#oldest first
+def loadHistory(position):
+    rows = []
+    for recordPosition, storedAt, body in messageLog.page(position, historyPageRows):
+        message = parseJsonMessage(body, [], True)
+        if message != None:
+            rows.append({'sender': 'You' if message['sender'] == processId else message['senderIp'], 'msg': message['text'], 'logPosition': recordPosition})
+    rows.reverse()
+    return rows
+
+
+#************************************************************
+#Pipeline helpers
+
+#periodically prints the queue depth and service times of each pipeline stage (see shared/pipeline.py)
+def pipelineStatisticsWorker():
+    while not shutdownFlag.wait(float(env['PIPELINE_STATISTICS_INTERVAL'])):
+        reportPipeline()
+
+
+#prints how many messages were exchanged with each peer we are still connected to (see shared/membership.py)
+def reportMembership(peers):
+    membership = peers.current()
+    print('[INFO] Membership version {0}, {1} peers'.format(membership.version, len(membership)))
+    for peer, networkEntry in membership.members:
+        statistics = networkEntry['statistics']
+        print('[INFO] Peer {0}: connected for {1:.1f}s, {2} messages sent, {3} received'.format(
+            peer, time.monotonic() - statistics['connected'], statistics['sent'], statistics['received']))
+
+
+#prints a summary of each pipeline stage
+def reportPipeline():
+    for stage in [parseStage, handleStage, deliveryStage, sendStage]:
+        print('[INFO] Pipeline stage {0}'.format(stage.report()))
+
+
+#************************************************************
+#Snapshot helpers
+
+#periodically saves a snapshot of our state to resume from if we restart (see shared/snapshot.py)
+def snapshotWorker():
+    while not shutdownFlag.wait(float(env.get('SNAPSHOT_INTERVAL', 10))):
+        if initialisationComplete.is_set():
+            takeSnapshot()
+
+
+#saves a snapshot of our process id, clock, held back messages and departures in progress
+#the snapshot is taken under the lock, but written outside it, so deliveries aren't held up by the write
+def takeSnapshot():
+    with vectorClockLock:
+        snapshot = {
+            'processId': processId,
+            'clock': processVectorClock.toList(),
+            'retired': processVectorClock.retiredList(),
+            'pending': causalBuffer.pendingMessages(),
+            'departures': {departed: departure['lastSequence'] for departed, departure in departureTracker.departures.items()},
+            #broadcasts logged from now on are replayed when resuming
+            'taken': time.time()
+        }
+    try:
+        saveSnapshot(snapshotPath, snapshot)
+    except OSError:
+        print('[ERR] Failed to save snapshot to {0}'.format(snapshotPath))
+
+
+#restores the state we saved before restarting, then replays the broadcasts we logged after the snapshot was taken
+#called before any messages are read, peers send the rest once we say hello
+def restoreSnapshot():
+    global processVectorClock
+    replayed = 0
+    with vectorClockLock:
+        processVectorClock = DynamicVectorClock(resumeSnapshot['clock'], resumeSnapshot['retired'])
+        if messageLogEnabled:
+            #the log is in delivery order, so each message can be merged as it is read
+            for body in messageLog.since(resumeSnapshot['taken']):
+                message = parseJsonMessage(body, [], True)
+                if message != None and messageSequence(message) > processVectorClock.get(message['sender']):
+                    processVectorClock = deliverMessage(processVectorClock, message, processId, lambda sender, text: None)
+                    replayed += 1
+
+        #we had received everything our clock covers, and the messages we were holding back
+        #(received messages that were still waiting to be handled when we stopped are sent again by peers)
+        broadcastDeduplicator.advance(processVectorClock.toList())
+        resumeSnapshot['pending'] = [message for message in resumeSnapshot['pending'] if messageSequence(message) > processVectorClock.get(message['sender'])]
+        for message in resumeSnapshot['pending']:
+            broadcastDeduplicator.receive(message['sender'], messageSequence(message))
+        for departed, lastSequence in resumeSnapshot['departures'].items():
+            departureTracker.announce(departed, lastSequence)
+    print('[INFO] Resuming as {0} from a snapshot with clock {1} ({2} logged broadcasts replayed, {3} held back)'.format(
+        processId, processVectorClock, replayed, len(resumeSnapshot['pending'])))
+
+
+#gives up on a snapshot the network doesn't know about (e.g. it has been restarted since), starting over with a new uuid
+#called with vectorClockLock and preInitialisedLock held, before initialising
+def startAsNewProcess():
+    global processId, processVectorClock, broadcastDeduplicator, departureTracker, resumeSnapshot
+    print('[INFO] Can\'t resume as process {0}, joining as a new process'.format(processId))
+    processId = str(uuid.uuid4())
+    processVectorClock = DynamicVectorClock([[processId, 0]])
+    broadcastDeduplicator = SequenceDeduplicator()
+    departureTracker = DepartureTracker()
+    resumeSnapshot = None
+    discardSnapshot(snapshotPath)
 
 
 #************************************************************
@@ -365,39 +1643,74 @@ def register():
 
 
 #helper, enqueues the node's initial HELLO message
+#a process restarting from a snapshot says hello with its clock, so peers only send it what it's missing
 def sayHello(peers, outgoingMessageQueue):
-    helloMessage = messageToJson(constructHello(processId, processIp))
+    with vectorClockLock:
+        resume = processVectorClock.toList() if resumeSnapshot != None else None
+    helloMessage = messageToJson(constructHello(processId, processIp, localFeatures(), resume))
+    transferReceiver.statistics['helloSent'] = time.monotonic()
     #directly broadcast rather than adding to send queue, as the p2p send worker won't start until hello is complete
     broadcastToPeers(helloMessage, peers)
 
 
+#returns the optional protocol features this node supports, based on .env
+def localFeatures():
+    features = []
+    if int(env.get('ENABLE_DELTA_CLOCKS', 0)) == 1:
+        features.append(ProtocolFeature.DELTA_CLOCK)
+    if int(env.get('ENABLE_INTERNED_IDS', 0)) == 1:
+        features.append(ProtocolFeature.INTERNED_IDS)
+    if int(env.get('ENABLE_BINARY_CODEC', 0)) == 1:
+        features.append(ProtocolFeature.BINARY_CODEC)
+    if plumtreeEnabled:
+        features.append(ProtocolFeature.PLUMTREE)
+    if chunkedStateEnabled:
+        features.append(ProtocolFeature.CHUNKED_STATE)
+    return features
+
+
+#enables any optional features that both ends of a link support, based on a HELLO/HELLO_RESPONSE from the peer
+def negotiateFeatures(networkEntry, message):
+    sharedFeatures = set(localFeatures()) & set(message.get('features', []))
+    with networkEntry['lock']:
+        networkEntry['features'] = sharedFeatures
+        if ProtocolFeature.DELTA_CLOCK in sharedFeatures and networkEntry['clockEncoder'] == None:
+            networkEntry['clockEncoder'] = DeltaClockEncoder()
+        if ProtocolFeature.INTERNED_IDS in sharedFeatures and networkEntry['idEncoder'] == None:
+            networkEntry['idEncoder'] = ProcessIdEncoder(processIdTable)
+        if ProtocolFeature.BINARY_CODEC in sharedFeatures:
+            networkEntry['codec'] = binaryCodec
+        if ProtocolFeature.PLUMTREE in sharedFeatures and networkEntry['treeLink'] == None:
+            networkEntry['treeLink'] = PlumtreeLink()
+
+
 #************************************************************
 #App
 
 #handles param setup and starts threads / gui
 def main():
 
+    #the ingest pool's worker processes are forked, so they are started before any threads or connections (see shared/ingest.py)
+    if ingestPool != None:
+        ingestPool.start()
+
     #setup shared fields
 
     #messages that have been read from a socket and need to be handled
-    #[(networkEntry, message, hasAlreadyBeenHeldBack)]
-    #hasAlreadyBeenHeldBack is only used for simulating network delay
-    messagesToHandle = Queue()
+    #[(networkEntry, message, relayFrame)]
+    messagesToHandle = handleStage
 
     #messages that need to be broadcast
     #[(message, isRetransmitting)]
-    outgoingMessageQueue = Queue()
+    outgoingMessageQueue = sendStage
     
-    #message ids that we've already received
+    #ids of control messages that we've already received (broadcasts are deduplicated by broadcastDeduplicator)
     receivedMessages = {}
 
     #initial message collector, stores messages that arrive before HELLO_RESPONSE arrives
     #ensures no messages are missed even if the channel is not FIFO
     preInitialisedReceivedMessages = []
 
-    #ids of messages whose receipt we've delayed (only used for simulating network delay)
-    delayedMessages = {}
-
     #get peers from peer server or command line based on params
     #room for extension - add new peers at runtime based on received messages, so network is more fault tolerant
     if int(env['ENABLE_PEER_SERVER']) == 1:
@@ -435,14 +1748,19 @@ def main():
         unconnectedPeers = getPeerNames()
     
     #establish connections
-    peers = []
+    #the peers we are connected to, published as immutable versions as they connect and fail (see shared/membership.py)
+    peers = MembershipTable()
+    peers.subscribe(lambda membership, event: updateLivePeerCountGUI(len(membership)))
     for peer in unconnectedPeers:
         p2pSocket = buildSenderSocket()
         try:
             p2pSocket.connect((peer, int(env['PROTOCOL_PORT'])))
-            networkEntries[peer] = buildNetworkEntry(p2pSocket)
-            peers.append(peer)
-            selector.register(p2pSocket, selectors.EVENT_READ, None)
+            #writes are queued (see queueForPeer), so the socket never needs to block once connected
+            p2pSocket.setblocking(False)
+            peers.add(peer, buildNetworkEntry(p2pSocket, outboundHighWatermark, outboundLowWatermark))
+            #the event loop takes the socket over once it starts (see serveConnections)
+            if not asyncioEngineEnabled:
+                selector.register(p2pSocket, selectors.EVENT_READ, None)
         except socket.error:
             print('[ERR] Could not establish connection for peer {0}'.format(peer))
             print('[INFO] Removing it from the startup peer list')
@@ -453,27 +1771,72 @@ def main():
             register()
         print('[INFO] Starting with no peers - waiting for at least one peer to establish connection...')
         initiallyUnconnected.set()
+
+    #without peers there's nobody to resume with, so we start a new network as a new process
+    if resumeSnapshot != None and len(peers) == 0:
+        with vectorClockLock:
+            with preInitialisedLock:
+                startAsNewProcess()
+    elif resumeSnapshot != None:
+        restoreSnapshot()
     
     #create worker threads
     broadcastWorkers = []
     handlerWorkers = []
     readWorkers = []
     for i in range(int(env['CLIENT_WORKER_THREADS'])):
-        broadcastWorkers.append(Thread(target=broadcastWorker, args=(outgoingMessageQueue, receivedMessages, peers)))
+        broadcastWorkers.append(Thread(target=broadcastWorker, args=(outgoingMessageQueue, peers)))
         handlerWorkers.append(Thread(target=handlerWorker, args=(messagesToHandle, receivedMessages, 
-            delayedMessages, outgoingMessageQueue, peers, preInitialisedReceivedMessages)))
-        readWorkers.append(Thread(target=readWorker, args=(messagesToHandle, peers, )))
-    for i in range(int(env['CLIENT_WORKER_THREADS'])):
-        broadcastWorkers[i].start()
-        handlerWorkers[i].start()
-        readWorkers[i].start()
+            outgoingMessageQueue, peers, preInitialisedReceivedMessages)))
+        #the event loop does all of the reading when the asyncio engine is enabled
+        if not asyncioEngineEnabled:
+            readWorkers.append(Thread(target=readWorker, args=(messagesToHandle, peers, )))
+    for worker in broadcastWorkers + handlerWorkers + readWorkers:
+        worker.start()
+    deliveryThread = Thread(target=deliveryWorker, args=(outgoingMessageQueue, peers))
+    deliveryThread.start()
+    impairmentThread = None
+    if impairment != None:
+        impairmentThread = Thread(target=impairment.run)
+        impairmentThread.start()
+    pipelineStatisticsThread = None
+    if float(env.get('PIPELINE_STATISTICS_INTERVAL', 0)) > 0:
+        pipelineStatisticsThread = Thread(target=pipelineStatisticsWorker)
+        pipelineStatisticsThread.start()
+    stabilityThread = None
+    if stabilityTrackingEnabled:
+        stabilityThread = Thread(target=stabilityWorker, args=(peers, ))
+        stabilityThread.start()
+    plumtreeThread = None
+    if plumtreeEnabled:
+        plumtreeThread = Thread(target=plumtreeWorker, args=(peers, ))
+        plumtreeThread.start()
+    antiEntropyThread = None
+    if antiEntropyEnabled:
+        antiEntropyThread = Thread(target=antiEntropyWorker, args=(peers, ))
+        antiEntropyThread.start()
+    nackThread = None
+    if nacksEnabled:
+        nackThread = Thread(target=nackWorker, args=(peers, ))
+        nackThread.start()
+    messageLogThread = None
+    if messageLogEnabled:
+        messageLogThread = Thread(target=messageLogWorker)
+        messageLogThread.start()
+    snapshotThread = None
+    if snapshotRestartEnabled:
+        snapshotThread = Thread(target=snapshotWorker)
+        snapshotThread.start()
 
     #setup listener
     acceptSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     acceptSocket.bind((env['CLIENT_LISTEN_IP'], int(env['PROTOCOL_PORT'])))
     acceptSocket.listen()
     print('[INFO] Client listening at {0} on port {1}'.format(env['CLIENT_LISTEN_IP'], env['PROTOCOL_PORT']))
-    acceptThread = Thread(target=acceptWorker, args=(acceptSocket, peers))
+    if asyncioEngineEnabled:
+        acceptThread = Thread(target=ioLoopWorker, args=(acceptSocket, messagesToHandle, peers))
+    else:
+        acceptThread = Thread(target=acceptWorker, args=(acceptSocket, peers))
     acceptThread.start()
 
 
@@ -483,26 +1846,119 @@ def main():
         print('[INFO] Connecting to the network, please wait...')
 
     #don't start the GUI until hello completes
-    while not initialisationComplete.is_set():
-        time.sleep(0.1)
+    initialisationComplete.wait()
 
     #start GUI from template file
+    #our own messages are passed from the GUI to the broadcast workers, to be stamped by the delivery worker
     Builder.load_file('GUI.kv')
-    GUI(title='CHAT CLIENT [{0}]'.format(env['CLIENT_LISTEN_IP'])).run()
-
-    print('[INFO] GUI closed, terminating threads...')
+    gui = GUI(title='CHAT CLIENT [{0}]'.format(env['CLIENT_LISTEN_IP']))
+    gui.setQueue(outgoingMessageQueue)
+    if messageLogEnabled:
+        gui.setHistory(loadHistory, int(env.get('MESSAGE_HISTORY_ROWS', 200)))
+    updateLivePeerCountGUI(len(peers))
+    gui.run()
+
+    print('[INFO] GUI closed, leaving network...')
+    leaveNetwork(peers)
+    drainOutboundQueues(peers, 1)
+
+    print('[INFO] Terminating threads...')
     shutdownFlag.set()
+    #wake every worker, so none of them have to poll for shutdown
+    shutdownWakeup.set()
+    if impairment != None:
+        heldBroadcasts = impairment.held()
+        impairment.stop()
+        impairmentThread.join()
+    sendStage.stop(len(broadcastWorkers))
+    handleStage.stop(len(handlerWorkers))
+    deliveryStage.stop(1)
+    if asyncioEngineEnabled:
+        ioLoop.call_soon_threadsafe(stopServing)
     for worker in broadcastWorkers:
         worker.join()
     print('[INFO] Joined broadcasters...')
     for worker in readWorkers:
         worker.join()
     print('[INFO] Joined readers...')
+    if ingestPool != None:
+        ingestPool.close()
     for worker in handlerWorkers:
         worker.join()
     print('[INFO] Joined handlers...')
+    deliveryThread.join()
+    if pipelineStatisticsThread != None:
+        pipelineStatisticsThread.join()
+    if stabilityThread != None:
+        stabilityThread.join()
+    if plumtreeThread != None:
+        plumtreeThread.join()
+    if antiEntropyThread != None:
+        antiEntropyThread.join()
+    if nackThread != None:
+        nackThread.join()
     acceptThread.join()
     silentFailureClose(acceptSocket)
+    if messageLogThread != None:
+        messageLogThread.join()
+    if snapshotThread != None:
+        snapshotThread.join()
+        #the final snapshot, with everything we delivered before leaving
+        if initialisationComplete.is_set():
+            takeSnapshot()
+
+    deltaMessages, fullClockBytes, deltaClockBytes = getDeltaClockStatistics()
+    if deltaMessages > 0:
+        print('[INFO] Delta clocks: {0} messages, {1:.1f} clock bytes/message instead of {2:.1f} ({3:.1f}% reduction)'.format(
+            deltaMessages, deltaClockBytes / deltaMessages, fullClockBytes / deltaMessages, 100 * (1 - deltaClockBytes / max(fullClockBytes, 1))))
+    if outboundStatistics['congestionEvents'] > 0:
+        print('[INFO] Peer connections became congested {0} times, {1} relayed messages held back'.format(
+            outboundStatistics['congestionEvents'], outboundStatistics['skippedRelays']))
+    if relayStatistics['relayed'] > 0:
+        print('[INFO] Relayed {0} broadcasts with {1} encodings ({2:.2f} per broadcast, to {3} peers)'.format(
+            relayStatistics['relayed'], relayStatistics['encodings'], relayStatistics['encodings'] / relayStatistics['relayed'], len(peers)))
+        print('[INFO] Relays skipped for peers that already had the broadcast: {0} to the peer it came from, {1} to its sender, {2} to peers that had sent it to us'.format(
+            relayStatistics['skippedIngress'], relayStatistics['skippedOrigin'], relayStatistics['skippedSeen']))
+    trackedSenders, outOfOrder = broadcastDeduplicator.size()
+    print('[INFO] Duplicate broadcasts dropped: {0} before decoding, {1} after. Tracking {2} senders, {3} out of order sequence numbers'.format(
+        duplicateStatistics['beforeDecode'], duplicateStatistics['afterDecode'], trackedSenders, outOfOrder))
+    redundant = duplicateStatistics['beforeDecode'] + duplicateStatistics['afterDecode']
+    print('[INFO] Received {0} broadcasts and {1} redundant copies ({2:.2f} redundant receptions per broadcast)'.format(
+        duplicateStatistics['received'], redundant, redundant / max(duplicateStatistics['received'], 1)))
+    if plumtreeEnabled:
+        print('[INFO] Plumtree: announced {0} broadcasts, grafted {1}, pruned {2} links. {3} broadcasts announced but not received'.format(
+            plumtreeState.statistics['announced'], plumtreeState.statistics['grafted'], plumtreeState.statistics['pruned'], plumtreeState.size()))
+    if antiEntropyEnabled:
+        print('[INFO] Anti-entropy: sent {0} digests ({1} bytes), {2} digest replies, sent {3} missed broadcasts to peers. Keeping {4} broadcasts'.format(
+            antiEntropyState.statistics['digests'], antiEntropyState.statistics['digestBytes'], antiEntropyState.statistics['replies'],
+            antiEntropyState.statistics['served'], retainedLog.size()))
+    if nacksEnabled:
+        print('[INFO] NACKs: sent {0} NACKs for {1} missing broadcasts, retransmitted {2} broadcasts to peers'.format(
+            nackScheduler.statistics['nacks'], nackScheduler.statistics['nacked'], nackScheduler.statistics['retransmitted']))
+    reportJoin()
+    if messageLogEnabled:
+        segments, records, logBytes = messageLog.size()
+        print('[INFO] Message log: appended {0} broadcasts ({1} bytes) in {2} group commits, {3} recovered at startup. Keeping {4} broadcasts in {5} segments ({6} bytes)'.format(
+            messageLog.statistics['appended'], messageLog.statistics['bytes'], messageLog.statistics['commits'], messageLog.statistics['recovered'],
+            records, segments, logBytes))
+        messageLog.close()
+    with vectorClockLock:
+        medianBlocked = causalBuffer.blockedTimePercentile(50)
+        p99Blocked = causalBuffer.blockedTimePercentile(99)
+        blockedCount = len(causalBuffer.blockedTimes)
+    if blockedCount > 0:
+        print('[INFO] {0} messages were held back before delivery, blocked time p50 {1:.1f}ms, p99 {2:.1f}ms'.format(
+            blockedCount, medianBlocked * 1000, p99Blocked * 1000))
+    if ingestPool != None:
+        print('[INFO] Ingest pool: decoded {0} frames in {1} batches on {2} processes, {3} frames in small batches decoded by the read workers'.format(
+            ingestPool.statistics['frames'], ingestPool.statistics['batches'], ingestPool.processes, ingestPool.statistics['inline']))
+    if impairment != None:
+        print('[INFO] Network impairment: {0} broadcasts impaired, {1} lost, {2} duplicated, {3} reordered. Mean added delay {4:.1f}ms, at most {5} held at once, {6} still held at exit'.format(
+            impairment.statistics['impaired'], impairment.statistics['lost'], impairment.statistics['duplicated'], impairment.statistics['reordered'],
+            1000 * impairment.statistics['delay'] / max(impairment.statistics['impaired'] - impairment.statistics['lost'] + impairment.statistics['duplicated'], 1),
+            impairment.statistics['maxHeld'], heldBroadcasts))
+    reportMembership(peers)
+    reportPipeline()
     print('[INFO] All threads closed... exiting...')
     
 #print helper
@@ -520,17 +1976,33 @@ print('App configuration (.env + argv):', json.dumps(dict(env), indent=4))
 #************************************************************
 #state
 
-#maps a peer --> object containing peer socket, socket lock, current message size, read buffer
-networkEntries = {}
-
-#read socket selector
+#socket selector, used to find sockets that are readable (or writable, if they have queued messages)
 selector = selectors.DefaultSelector()
+#the read workers wait on the selector indefinitely (see shared/wakeup.py)
+#shutdownWakeup wakes them on shutdown, and selectorWakeup when sockets are registered with a selector that
+#doesn't see registrations made while it is being waited on
+shutdownWakeup = Wakeup()
+selectorWakeup = Wakeup()
+selectorSeesRegistrations = seesConcurrentRegistration(selector)
+selector.register(shutdownWakeup, selectors.EVENT_READ, None)
+selector.register(selectorWakeup, selectors.EVENT_READ, None)
+
+#use a single asyncio event loop for all socket IO, instead of the accept and read workers and the selector
+asyncioEngineEnabled = int(env.get('ENABLE_ASYNCIO_ENGINE', 0)) == 1
+ioLoop = asyncio.new_event_loop() if asyncioEngineEnabled else None
+
+#queued bytes above which a peer's connection is congested, and below which it recovers
+outboundHighWatermark = int(env.get('OUTBOUND_HIGH_WATERMARK', 4194304))
+outboundLowWatermark = int(env.get('OUTBOUND_LOW_WATERMARK', 1048576))
+#times a peer's connection became congested, and relayed messages not queued for congested peers
+outboundStatistics = {'congestionEvents': 0, 'skippedRelays': 0}
+#broadcasts relayed to our peers, and the number of times they had to be encoded to do so
+relayStatistics = {'relayed': 0, 'encodings': 0, 'skippedIngress': 0, 'skippedOrigin': 0, 'skippedSeen': 0}
 
 #************************************************************
 #global locks for thread synchronisation
 
 #p2p state locks
-peersLock = Lock() #lock for peers list
 messageLock = Lock() #lock for received message dict
 preInitialisedLock = Lock() #lock for pre-initialisation message queue
 
@@ -540,8 +2012,6 @@ selectorLock = Lock()
 #lock for incrementing and reading vector clock
 vectorClockLock = Lock()
 
-#lock for accessing delayed message dict - only used for simulating network delay
-delayedMessageLock = Lock()
 
 #************************************************************
 #events
@@ -560,11 +2030,85 @@ initiallyUnconnected = Event()
 #vector clock and causal message queue
 
 processIp = env['CLIENT_LISTEN_IP']
-processId = str(uuid.uuid4())
+#processes restart as the process they were, from a snapshot of their state (see shared/snapshot.py)
+snapshotRestartEnabled = int(env.get('ENABLE_SNAPSHOT_RESTART', 0)) == 1
+snapshotPath = os.path.join(env.get('SNAPSHOT_DIR', 'snapshots'), processIp + '.json')
+resumeSnapshot = loadSnapshot(snapshotPath) if snapshotRestartEnabled else None
+processId = resumeSnapshot['processId'] if resumeSnapshot != None else str(uuid.uuid4())
 # This process's vector clock - initialised with a UUID e.g.
 # [ [FAKE-UUID-EXAMPLE-STRING, 0] ]
-processVectorClock = [[processId, 0]]
-processMessageQueue = []
+processVectorClock = DynamicVectorClock([[processId, 0]])
+# Messages that have been received but can't be delivered yet
+causalBuffer = CausalBuffer(int(env.get('ENABLE_VECTORISED_DELIVERY', 0)) == 1)
+#matrix clock, tracks which messages every live process has delivered
+stabilityTracker = StabilityTracker()
+stabilityTrackingEnabled = int(env.get('ENABLE_STABILITY_TRACKING', 0)) == 1
+#per-sender watermarks of the broadcasts we've received
+broadcastDeduplicator = SequenceDeduplicator()
+#new broadcasts received, and duplicate broadcasts dropped from just their envelope, and after fully decoding them
+duplicateStatistics = {'received': 0, 'beforeDecode': 0, 'afterDecode': 0}
+#which peers have recently sent us each broadcast, so relays can skip them
+seenTrackingEnabled = int(env.get('ENABLE_SEEN_TRACKING', 0)) == 1
+recentSenders = RecentSenders(float(env.get('SEEN_TRACKING_WINDOW', 2)))
+#broadcasts are pushed along a spanning tree, and only announced over the remaining links using plumtree (see shared/plumtree.py)
+plumtreeEnabled = int(env.get('ENABLE_PLUMTREE', 0)) == 1
+plumtreeState = PlumtreeState(float(env.get('PLUMTREE_GRAFT_TIMEOUT', 0.5)))
+#peers periodically exchange digests of the broadcasts they've delivered, and send each other any that were missed
+antiEntropyEnabled = int(env.get('ENABLE_ANTI_ENTROPY', 0)) == 1
+antiEntropyState = AntiEntropyState(float(env.get('ANTI_ENTROPY_INTERVAL', 2)))
+#the most missed broadcasts sent in reply to a single digest, NACK or GRAFT
+antiEntropyReplyLimit = int(env.get('ANTI_ENTROPY_REPLY_LIMIT', 256))
+#messages held back on a missing broadcast for longer than the timeout NACK it from peers
+nacksEnabled = int(env.get('ENABLE_NACKS', 0)) == 1
+nackScheduler = NackScheduler(float(env.get('NACK_TIMEOUT', 1)), int(env.get('NACK_FANOUT', 2)))
+#recent broadcasts, kept for plumtree grafts, anti-entropy and NACKs
+retainingBroadcasts = plumtreeEnabled or antiEntropyEnabled or nacksEnabled
+retainedLog = RetainedLog()
+#joining processes receive our undelivered messages in flow controlled chunks after a snapshot (see shared/state_transfer.py)
+chunkedStateEnabled = int(env.get('ENABLE_CHUNKED_STATE_TRANSFER', 0)) == 1
+transferSender = TransferSender(int(env.get('STATE_CHUNK_BYTES', 262144)), int(env.get('STATE_TRANSFER_WINDOW', 4)))
+transferReceiver = TransferReceiver()
+#delivered broadcasts are logged to disk, and served from there to peers that missed them (see shared/message_log.py)
+messageLogEnabled = int(env.get('ENABLE_MESSAGE_LOG', 0)) == 1
+messageLog = None
+if messageLogEnabled:
+    messageLog = MessageLog(os.path.join(env.get('MESSAGE_LOG_DIR', 'message_log'), processIp), int(env.get('MESSAGE_LOG_SEGMENT_BYTES', 16777216)),
+        int(env.get('MESSAGE_LOG_SEGMENTS', 8)), int(env.get('MESSAGE_LOG_FSYNC', 0)) == 1)
+#messages paged into the UI at a time, when scrolling back through the log
+historyPageRows = 50
+#node-wide process id numbering, shared by every link that interns process ids
+processIdTable = ProcessIdTable()
+# Processes that have left the network, but whose clock entries haven't been retired yet
+departureTracker = DepartureTracker()
+#frames are parsed and messages handled in parallel, but delivered by a single worker (see shared/pipeline.py)
+parseStage = PipelineStage('parse', False)
+handleStage = PipelineStage('handle')
+deliveryStage = PipelineStage('deliver')
+sendStage = PipelineStage('send')
+#the most messages the delivery worker takes under one acquisition of vectorClockLock
+deliveryBatchSize = int(env.get('DELIVERY_BATCH_SIZE', 64))
+#frames read by the read workers are decoded in a pool of worker processes, so decoding isn't bound by the GIL (see shared/ingest.py)
+#the asyncio engine decodes frames on its event loop instead
+ingestPool = None
+if int(env.get('ENABLE_INGEST_POOL', 0)) == 1 and not asyncioEngineEnabled:
+    ingestPool = IngestPool(int(env.get('INGEST_PROCESSES', 0)), int(env.get('INGEST_MINIMUM_BATCH', 4)))
+#received broadcasts can be delayed, dropped, duplicated and reordered per link, to test under bad network conditions (see shared/impairment.py)
+#ENABLE_NETWORK_DELAY holds back broadcasts sent by THROTTLED_IP for MOCK_NETWORK_DELAY seconds
+impairment = None
+if int(env.get('ENABLE_NETWORK_IMPAIRMENT', 0)) == 1 or int(env['ENABLE_NETWORK_DELAY']) == 1:
+    defaultProfile, peerProfiles, senderProfiles = None, {}, {}
+    if int(env.get('ENABLE_NETWORK_IMPAIRMENT', 0)) == 1:
+        if env.get('IMPAIRMENT_FILE', None):
+            defaultProfile, peerProfiles, senderProfiles = loadProfiles(env['IMPAIRMENT_FILE'])
+        else:
+            if env.get('IMPAIRMENT_DEFAULT', None):
+                defaultProfile = ImpairmentProfile.parse(env['IMPAIRMENT_DEFAULT'])
+            peerProfiles = parseProfiles(env.get('IMPAIRMENT_PEERS', None) or '')
+            senderProfiles = parseProfiles(env.get('IMPAIRMENT_SENDERS', None) or '')
+    if int(env['ENABLE_NETWORK_DELAY']) == 1:
+        senderProfiles[env['THROTTLED_IP']] = ImpairmentProfile(latency=env['MOCK_NETWORK_DELAY'], distribution='constant')
+    seed = int(env['IMPAIRMENT_SEED']) if env.get('IMPAIRMENT_SEED', None) else None
+    impairment = NetworkImpairment(defaultProfile, peerProfiles, senderProfiles, releaseImpaired, float(env.get('IMPAIRMENT_TICK', 0.001)), seed)
 
 
 main()
@@ -0,0 +1,202 @@
+from threading import Lock
+import time
+
+#Anti-entropy (digest sync) for missed broadcasts
+#
+#Reliable broadcast only recovers a broadcast that some peer relays to us. One that every peer skipped (e.g. while
+#our connection was congested), or that was lost along with a failed peer, is never received, and every later
+#message that depends on it is held in the causal buffer forever.
+#
+#To recover them, nodes periodically send their peers a digest: their vector clock, which (as delivery is causal)
+#is the highest contiguous sequence number delivered from each sender, so it is O(members) however many messages
+#have been sent. A peer that receives a digest sends back every broadcast in its retained log that the digest
+#doesn't cover, and if the digest covers broadcasts the peer hasn't delivered, replies with its own digest so the
+#sender does the same for it. Broadcasts received within the last interval are left out of responses, as they
+#are most likely still on their way.
+#
+#Digests are only sent while the node is active - its clock changed within the last two intervals, or it is
+#holding messages it can't deliver - so an idle network exchanges nothing. Replies are limited to one per peer
+#per interval.
+#
+#Digests recover missed broadcasts within a few intervals. For lower latency, a node holding a message back on a
+#specific missing broadcast for longer than the NACK timeout sends a NACK for exactly the missing range of that
+#sender's sequence numbers to a few peers (the sender first, if it is a peer), which retransmit them from their logs.
+
+#time (in seconds) broadcasts are kept when stability tracking is disabled
+retentionTime = 60
+
+#************************************************************
+#retained log
+
+#recent broadcasts, kept so they can be sent to peers that missed them (by anti-entropy, or plumtree grafts)
+#broadcasts are kept until they are stable (every live process has delivered them, see shared/stability.py) or,
+#without stability tracking, for retentionTime seconds
+class RetainedLog:
+    def __init__(self):
+        #(sender, seq) --> (broadcast, time stored)
+        self.broadcasts = {}
+        self.lock = Lock()
+
+    def remember(self, message, sequence):
+        with self.lock:
+            self.broadcasts[(message['sender'], sequence)] = (message, time.monotonic())
+
+    #returns the broadcast, or None if it isn't being kept
+    def lookup(self, sender, sequence):
+        with self.lock:
+            stored = self.broadcasts.get((sender, sequence), None)
+        return stored[0] if stored != None else None
+
+    #returns the broadcasts that a clock (a list of [uuid, counter] pairs) doesn't cover, in sequence order per sender
+    #broadcasts stored after storedBefore are left out, and at most limit are returned (the oldest), if it is set
+    def newerThan(self, clock, storedBefore, limit = None):
+        counters = dict(clock)
+        with self.lock:
+            missing = [(broadcastId, stored[0]) for broadcastId, stored in self.broadcasts.items()
+                if broadcastId[1] > counters.get(broadcastId[0], 0) and stored[1] < storedBefore]
+        missing.sort(key=lambda entry: entry[0][1])
+        return [message for broadcastId, message in missing[:limit]]
+
+    #forgets broadcasts that no peer can still need
+    #isStable(sender, seq) tells if every live process has delivered a broadcast, and is None if stability isn't tracked
+    def evict(self, isStable):
+        cutoff = time.monotonic() - retentionTime
+        with self.lock:
+            for broadcastId, stored in list(self.broadcasts.items()):
+                if (isStable(*broadcastId) if isStable != None else stored[1] < cutoff):
+                    del self.broadcasts[broadcastId]
+
+    #drops everything kept for a retired process
+    def forget(self, sender):
+        with self.lock:
+            for broadcastId in [broadcastId for broadcastId in self.broadcasts if broadcastId[0] == sender]:
+                del self.broadcasts[broadcastId]
+
+    def size(self):
+        with self.lock:
+            return len(self.broadcasts)
+
+
+#************************************************************
+#digest scheduling
+
+class AntiEntropyState:
+    def __init__(self, interval):
+        self.interval = interval
+        self.lastClock = None
+        #when our clock last changed (or something else made the node active)
+        self.lastChange = time.monotonic()
+        #peer --> when we last replied to its digest with our own
+        self.lastReplies = {}
+        self.lock = Lock()
+        #digests sent and their size, digests sent in reply to a peer's, and broadcasts sent to peers that had missed them
+        self.statistics = {'digests': 0, 'digestBytes': 0, 'replies': 0, 'served': 0}
+
+    #returns True if digests should be sent this round
+    #clock is our current clock, and holding is True if messages are waiting in the causal buffer
+    def isActive(self, clock, holding):
+        now = time.monotonic()
+        with self.lock:
+            if clock != self.lastClock:
+                self.lastClock = clock
+                self.lastChange = now
+            return holding or now - self.lastChange <= 2 * self.interval
+
+    #makes the node send digests for the next two intervals, e.g. after losing a peer
+    def touch(self):
+        with self.lock:
+            self.lastChange = time.monotonic()
+
+    #returns True if we may reply to a peer's digest with our own, at most once per interval
+    def mayReply(self, peer):
+        now = time.monotonic()
+        with self.lock:
+            if now - self.lastReplies.get(peer, 0) < self.interval:
+                return False
+            self.lastReplies[peer] = now
+            return True
+
+    #forgets the reply times of peers we are no longer connected to
+    def forgetPeer(self, peer):
+        with self.lock:
+            self.lastReplies.pop(peer, None)
+
+
+#************************************************************
+#gap NACKs
+
+class NackScheduler:
+    def __init__(self, timeout, fanout):
+        self.timeout = timeout
+        #number of peers each NACK is sent to
+        self.fanout = fanout
+        #sender --> (highest sequence number NACKed, when)
+        self.lastNacks = {}
+        self.lock = Lock()
+        #NACKed sequence numbers, NACKs sent, and broadcasts retransmitted in response to peers' NACKs
+        self.statistics = {'nacked': 0, 'nacks': 0, 'retransmitted': 0}
+
+    #returns the [sender, first, last] ranges that should be NACKed now
+    #gaps maps senders to the highest sequence number a blocked message needs from them (see CausalBuffer.gapsOlderThan),
+    #and delivered maps them to the highest sequence number we have delivered
+    #a range isn't NACKed again until the timeout has passed, unless it has grown
+    def due(self, gaps, delivered):
+        now = time.monotonic()
+        ranges = []
+        with self.lock:
+            for sender, last in gaps.items():
+                previous = self.lastNacks.get(sender, None)
+                if previous != None and previous[0] >= last and now - previous[1] < self.timeout:
+                    continue
+                self.lastNacks[sender] = (last, now)
+                ranges.append([sender, delivered.get(sender, 0) + 1, last])
+        return ranges
+
+    #drops the NACK history of a retired process
+    def forget(self, sender):
+        with self.lock:
+            self.lastNacks.pop(sender, None)
+
+
+#returns True if a remote clock (a list of [uuid, counter] pairs) covers broadcasts our clock doesn't
+def isAhead(remoteClock, localClock):
+    counters = dict(localClock)
+    return any(counter > counters.get(sender, 0) for sender, counter in remoteClock)
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
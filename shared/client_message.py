@@ -2,6 +2,13 @@ from enum import IntEnum
 import json
 import copy
 import uuid
+import re
+
+#optional faster json backend, used instead of the json module if it is installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 #************************************************************
 #message types for p2p communication
@@ -10,39 +17,95 @@ class MessageType(IntEnum):
     HELLO = 1
     HELLO_RESPONSE = 2
     LEAVE_NETWORK = 3
+    DEPARTURE_ACK = 4
+    STABILITY_ACK = 5
+    IHAVE = 6
+    GRAFT = 7
+    PRUNE = 8
+    DIGEST = 9
+    NACK = 10
+    STATE_CHUNK = 11
+    STATE_ACK = 12
+    STATE_REQUEST = 13
+    REJOIN = 14
+
+#optional protocol features, advertised in HELLO/HELLO_RESPONSE
+#a feature is only used on a link if both ends advertised it
+class ProtocolFeature:
+    DELTA_CLOCK = 'deltaClock'
+    INTERNED_IDS = 'internedIds'
+    BINARY_CODEC = 'binaryCodec'
+    PLUMTREE = 'plumtree'
+    CHUNKED_STATE = 'chunkedState'
 
 #************************************************************
 #message helpers
 
 #returns json encoded copy of message
 def messageToJson(message):
+    if orjson != None:
+        try:
+            return orjson.dumps(message).decode('utf-8')
+        except TypeError:
+            #e.g. non-string keys, which the json module converts to strings
+            pass
     return json.dumps(message)
 
 #parses message and returns dictionary representing message content
+#message can be a str, or utf-8 encoded bytes (or a memoryview of them, if orjson is installed)
 #returns None if parse failed
+#with useClientDefaults, the message must have an int type and the fields required for that type (requiredFields is ignored)
 def parseJsonMessage(message, requiredFields, useClientDefaults = False):
     try:
-        parsedMessage = json.loads(message)
+        parsedMessage = orjson.loads(message) if orjson != None else json.loads(message)
     except:
         return None
+    if not isinstance(parsedMessage, dict):
+        return None
 
     if useClientDefaults:
+        #frames come straight from peers, so the type is checked before it is matched on
+        if not isinstance(parsedMessage.get('type', None), int):
+            print('Message was missing required field type')
+            return None
         match parsedMessage['type']:
             case MessageType.BROADCAST_MESSAGE:
-                requiredFields = ['id', 'sender', 'senderIp', 'type', 'clock', 'text']
+                #the clock is checked below, as links using delta clocks send 'clockDelta' instead
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'text']
             case MessageType.HELLO:
                 requiredFields = ['id', 'sender', 'senderIp', 'type']
             case MessageType.HELLO_RESPONSE:
                 requiredFields = ['id', 'sender', 'senderIp', 'type', 'clock', 'undeliveredMessages']
             case MessageType.LEAVE_NETWORK:
-                requiredFields = []
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'departed', 'lastSequence']
+            case MessageType.DEPARTURE_ACK:
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'departed', 'delivered']
+            case MessageType.STABILITY_ACK | MessageType.DIGEST:
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'clock']
+            case MessageType.IHAVE | MessageType.GRAFT:
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'broadcasts']
+            case MessageType.NACK:
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'ranges']
+            case MessageType.STATE_CHUNK:
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'transfer', 'index', 'chunks', 'messages']
+            case MessageType.STATE_ACK:
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'transfer', 'received']
+            case MessageType.STATE_REQUEST:
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'transfer', 'clock']
+            case MessageType.REJOIN:
+                requiredFields = ['id', 'sender', 'senderIp', 'type', 'rejoined', 'lastSequence']
+            case MessageType.PRUNE:
+                requiredFields = ['id', 'sender', 'senderIp', 'type']
             case _:
                 requiredFields = []
-    else:
-        for required in requiredFields:
-            if required not in parsedMessage:
-                print('Message was missing required field {0}'.format(required))
-                return None
+
+    for required in requiredFields:
+        if required not in parsedMessage:
+            print('Message was missing required field {0}'.format(required))
+            return None
+    if useClientDefaults and parsedMessage['type'] == MessageType.BROADCAST_MESSAGE and 'clock' not in parsedMessage and 'clockDelta' not in parsedMessage:
+        print('Message was missing required field clock')
+        return None
 
     return parsedMessage
 
@@ -50,17 +113,24 @@ def parseJsonMessage(message, requiredFields, useClientDefaults = False):
 #************************************************************
 #message constructors
 
-def constructHello(sender, senderIp):
+#resume is the clock of the snapshot a restarting process resumes from, if it is resuming (see shared/snapshot.py)
+def constructHello(sender, senderIp, features = None, resume = None):
     messageId = str(uuid.uuid4())
     return {
         'id': messageId,
         'sender': sender,
         'senderIp': senderIp,
-        'type': MessageType.HELLO
+        'type': MessageType.HELLO,
+        'features': features or [],
+        'resume': resume
     }
 
 
-def constructHelloResponse(sender, senderIp, clock, undeliveredMessages):
+#retired lists processes whose clock entries have been retired, departures maps departing processes to their announced last sequence
+#transfer is {'id', 'chunks'} if the undelivered messages follow in STATE_CHUNKs instead (see shared/state_transfer.py)
+#resumed is the sequence number a process resuming from a snapshot has reached as far as the sender knows, if the
+#undelivered messages are only those its snapshot clock doesn't cover
+def constructHelloResponse(sender, senderIp, clock, undeliveredMessages, features = None, retired = None, departures = None, transfer = None, resumed = None):
     messageId = str(uuid.uuid4())
     return {
         'id': messageId,
@@ -68,22 +138,215 @@ def constructHelloResponse(sender, senderIp, clock, undeliveredMessages):
         'senderIp': senderIp,
         'type': MessageType.HELLO_RESPONSE,
         'clock': clock,
-        'undeliveredMessages': undeliveredMessages
+        'undeliveredMessages': undeliveredMessages,
+        'features': features or [],
+        'retired': retired or [],
+        'departures': departures or {},
+        'transfer': transfer,
+        'resumed': resumed
+    }
+
+
+#announces that departed has left the network, after sending lastSequence messages (as far as the sender knows)
+def constructLeaveNetwork(sender, senderIp, departed, lastSequence):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.LEAVE_NETWORK,
+        'departed': departed,
+        'lastSequence': lastSequence
+    }
+
+
+#announces that rejoined, which may have been reported as having left, has resumed after sending lastSequence messages
+def constructRejoin(sender, senderIp, rejoined, lastSequence):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.REJOIN,
+        'rejoined': rejoined,
+        'lastSequence': lastSequence
+    }
+
+
+#acknowledges that the sender has delivered departed's messages up to (and including) delivered
+def constructDepartureAck(sender, senderIp, departed, delivered):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.DEPARTURE_ACK,
+        'departed': departed,
+        'delivered': delivered
     }
 
 
+#reports the sender's current clock, so other processes can tell which messages it has delivered
+def constructStabilityAck(sender, senderIp, clock):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.STABILITY_ACK,
+        'clock': clock
+    }
+
+
+#summarises the broadcasts the sender has delivered (its clock), so a peer can send it any it has missed
+#only sent to peers, and never relayed (see shared/anti_entropy.py)
+def constructDigest(sender, senderIp, clock):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.DIGEST,
+        'clock': clock
+    }
+
+
+#asks a peer to retransmit broadcasts the sender is missing, as [sender, first, last] ranges of sequence numbers
+#only sent to peers, and never relayed (see shared/anti_entropy.py)
+def constructNack(sender, senderIp, ranges):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.NACK,
+        'ranges': ranges
+    }
+
+
+#STATE_CHUNK, STATE_ACK and STATE_REQUEST make up chunked state transfers (see shared/state_transfer.py)
+
+#carries chunk index (of chunks) of a state transfer's undelivered messages
+def constructStateChunk(sender, senderIp, transfer, index, chunks, messages):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.STATE_CHUNK,
+        'transfer': transfer,
+        'index': index,
+        'chunks': chunks,
+        'messages': messages
+    }
+
+
+#acknowledges that the sender has handled received chunks of a state transfer
+def constructStateAck(sender, senderIp, transfer, received):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.STATE_ACK,
+        'transfer': transfer,
+        'received': received
+    }
+
+
+#asks a peer to resume an interrupted state transfer, with the messages it has that the sender's clock doesn't cover
+def constructStateRequest(sender, senderIp, transfer, clock):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.STATE_REQUEST,
+        'transfer': transfer,
+        'clock': clock
+    }
+
+
+#IHAVE, GRAFT and PRUNE are only sent over links using plumtree (see shared/plumtree.py), and aren't relayed
+#broadcasts is a list of [sender, seq] ids
+
+#announces broadcasts the sender has received, but didn't push over the link
+def constructIHave(sender, senderIp, broadcasts):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.IHAVE,
+        'broadcasts': broadcasts
+    }
+
+
+#asks for announced broadcasts the sender hasn't received, and for future broadcasts to be pushed over the link
+def constructGraft(sender, senderIp, broadcasts):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.GRAFT,
+        'broadcasts': broadcasts
+    }
+
+
+#asks for broadcasts to only be announced over the link, as the sender is receiving them over another one
+def constructPrune(sender, senderIp):
+    messageId = str(uuid.uuid4())
+    return {
+        'id': messageId,
+        'sender': sender,
+        'senderIp': senderIp,
+        'type': MessageType.PRUNE
+    }
+
+
+#type, sender and seq (the sender's entry in the clock) come first, so duplicates can be spotted from the
+#start of the frame without decoding it (see peekBroadcastEnvelope)
 def constructMessage(messageType, clock, message, sender, senderIp):
     messageId = str(uuid.uuid4())
     return {
         'type': messageType,
+        'sender': sender,
+        'seq': clockEntry(clock, sender),
         'clock': clock or {},
         'text': message,
-        'sender': sender,
         'senderIp': senderIp,
         'id': messageId
     }
 
 
+#returns the counter for process in a list of [uuid, counter] pairs
+def clockEntry(clock, process):
+    for entryProcess, counter in clock or []:
+        if entryProcess == process:
+            return counter
+    return 0
+
+
+#************************************************************
+#envelope helpers
+
+#matches the start of a broadcast built by constructMessage (json.dumps and orjson both keep the field order,
+#but only json.dumps puts spaces after separators)
+#the sender is a uuid string, or an integer on links that intern process ids
+broadcastEnvelope = re.compile(rb'^\{"type": ?' + str(int(MessageType.BROADCAST_MESSAGE)).encode('utf-8') + rb', ?"sender": ?(?:"([^"\\]*)"|(\d+)), ?"seq": ?(\d+)[,}]')
+
+#returns (sender, seq) for a utf-8 encoded json broadcast without parsing the rest of it, or None if the message doesn't
+#start with a broadcast envelope. sender is an int if the sender's process id was interned
+def peekBroadcastEnvelope(message):
+    match = broadcastEnvelope.match(message)
+    if match == None:
+        return None
+    if match.group(1) != None:
+        return (match.group(1).decode('utf-8'), int(match.group(3)))
+    return (int(match.group(2)), int(match.group(3)))
+
+
 
 '''
 Bibliography
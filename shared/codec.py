@@ -0,0 +1,300 @@
+from shared.client_message import MessageType, messageToJson, parseJsonMessage, peekBroadcastEnvelope, orjson
+from shared.vector_clock import messageSequence
+import struct
+import sys
+import re
+
+#Wire codecs
+#
+#Every message can be sent as json. On links where both peers advertise the feature in HELLO/HELLO_RESPONSE,
+#broadcasts are sent in a compact binary format instead:
+#
+#|SIZE          |DESCRIPTION
+#|3 bytes       |header: binaryMagic, flags (see below), message type
+#|process id    |sender
+#|varint        |seq
+#|varint        |number of clock entries, followed by that many (process id, varint counter) pairs
+#|string        |text
+#|string        |senderIp
+#|16 bytes      |id (uuid)
+#|varint        |only if processIdsFlag: number of process number announcements, followed by that many (varint, 16 byte uuid) pairs
+#
+#process ids are varints on links that intern process ids (internedFlag), and 16 byte uuids otherwise
+#strings are a varint byte length followed by utf-8 encoded text
+#varints are unsigned LEB128 (7 bits per byte, least significant first, high bit set on all but the last byte)
+#
+#Frames are self describing - json frames always start with '{', and binary frames with binaryMagic - so a peer
+#can decode either codec on any link, and only the sender needs to know what was negotiated. Messages the binary
+#format can't represent (control messages, anything with ids that aren't uuids, or a delta clock without 'seq') are
+#sent as json.
+
+#************************************************************
+#json codec
+
+#frames carrying link state (see shared/delta_clock.py and shared/process_ids.py) must always be decoded in full
+jsonLinkStateFields = re.compile(rb'"clockDelta"|"processIds"')
+
+class JsonCodec:
+    name = 'json'
+
+    #returns the utf-8 encoded message
+    def encode(self, message):
+        return messageToJson(message).encode('utf-8')
+
+    #returns the message in a frame, or None if it couldn't be decoded
+    def decode(self, frame):
+        if orjson == None:
+            try:
+                frame = str(frame, 'utf-8')
+            except UnicodeDecodeError:
+                return None
+        return parseJsonMessage(frame, [], True)
+
+    #returns (sender, seq) for a broadcast frame without decoding the rest of it, or None if the frame isn't a
+    #broadcast or carries link state
+    def peekEnvelope(self, frame):
+        if jsonLinkStateFields.search(frame) != None:
+            return None
+        return peekBroadcastEnvelope(frame)
+
+
+#************************************************************
+#binary codec
+
+#first byte of every binary frame (json frames start with '{')
+binaryMagic = 0xB1
+binaryHeader = struct.Struct('!BBB')
+
+#header flags
+deltaClockFlag = 1 #the clock is a delta clock ('clockDelta')
+internedFlag = 2 #the sender and clock entries are process numbers
+processIdsFlag = 4 #the frame announces process numbers ('processIds')
+
+#fields the binary format can represent, anything else is sent as json
+binaryBroadcastFields = frozenset(['type', 'sender', 'seq', 'clock', 'clockDelta', 'text', 'senderIp', 'id', 'processIds'])
+
+uuidPattern = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+def encodeVarint(output, value):
+    while value >= 0x80:
+        output.append((value & 0x7F) | 0x80)
+        value >>= 7
+    output.append(value)
+
+#returns (value, offset of the next field)
+def decodeVarint(data, offset):
+    byte = data[offset]
+    if byte < 0x80:
+        return byte, offset + 1
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        offset += 1
+        byte = data[offset]
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset + 1
+        shift += 7
+
+#raises ValueError if value isn't a lowercase uuid, which wouldn't survive the round trip
+def encodeUuid(output, value):
+    if uuidPattern.fullmatch(value) == None:
+        raise ValueError('not a uuid')
+    output += bytes.fromhex(value.replace('-', ''))
+
+def decodeUuid(data, offset):
+    digits = bytes(data[offset:offset + 16]).hex()
+    if len(digits) != 32:
+        raise ValueError('truncated uuid')
+    return '{0}-{1}-{2}-{3}-{4}'.format(digits[:8], digits[8:12], digits[12:16], digits[16:20], digits[20:]), offset + 16
+
+#process ids appear in every clock, so their conversions are cached (unlike message ids, which are only seen once)
+#there is one entry per process seen this session, and decoded process ids are shared strings, like interned ones
+processIdBytes = {}
+processIdStrings = {}
+
+def encodeProcessId(output, value):
+    encoded = processIdBytes.get(value, None)
+    if encoded == None:
+        encodedUuid = bytearray()
+        encodeUuid(encodedUuid, value)
+        encoded = bytes(encodedUuid)
+        processIdBytes[value] = encoded
+        processIdStrings[encoded] = sys.intern(value)
+    output += encoded
+
+def decodeProcessId(data, offset):
+    encoded = bytes(data[offset:offset + 16])
+    value = processIdStrings.get(encoded, None)
+    if value == None:
+        value, offset = decodeUuid(data, offset)
+        value = sys.intern(value)
+        processIdStrings[encoded] = value
+        processIdBytes[value] = encoded
+        return value, offset
+    return value, offset + 16
+
+def encodeString(output, value):
+    encoded = value.encode('utf-8')
+    encodeVarint(output, len(encoded))
+    output += encoded
+
+def decodeString(data, offset):
+    length, offset = decodeVarint(data, offset)
+    if offset + length > len(data):
+        raise ValueError('truncated string')
+    return str(data[offset:offset + length], 'utf-8'), offset + length
+
+
+class BinaryCodec:
+    name = 'binary'
+
+    #returns the encoded message as a bytearray, or None if the binary format can't represent it
+    def encode(self, message):
+        if message.get('type', None) != MessageType.BROADCAST_MESSAGE or not binaryBroadcastFields.issuperset(message):
+            return None
+
+        interned = isinstance(message['sender'], int)
+        clockField = 'clockDelta' if 'clockDelta' in message else 'clock'
+        #broadcasts from peers that don't send 'seq' carry it in their clock, which a delta clock may leave out
+        if 'seq' not in message and clockField == 'clockDelta':
+            return None
+        flags = 0
+        if clockField == 'clockDelta':
+            flags |= deltaClockFlag
+        if interned:
+            flags |= internedFlag
+        if 'processIds' in message:
+            flags |= processIdsFlag
+
+        output = bytearray(binaryHeader.pack(binaryMagic, flags, MessageType.BROADCAST_MESSAGE))
+        try:
+            encodeProcess = encodeVarint if interned else encodeProcessId
+            encodeProcess(output, message['sender'])
+            encodeVarint(output, messageSequence(message))
+            clock = message[clockField]
+            encodeVarint(output, len(clock))
+            for process, counter in clock:
+                encodeProcess(output, process)
+                encodeVarint(output, counter)
+            encodeString(output, message['text'])
+            encodeString(output, message['senderIp'])
+            encodeUuid(output, message['id'])
+            if 'processIds' in message:
+                encodeVarint(output, len(message['processIds']))
+                for processNumber, process in message['processIds']:
+                    encodeVarint(output, processNumber)
+                    encodeProcessId(output, process)
+        except (ValueError, TypeError, AttributeError):
+            return None
+        return output
+
+    #returns the message in a frame, with the same fields (in the same order) json decoding would give, or None if it couldn't be decoded
+    def decode(self, frame):
+        #indexing bytes is faster than indexing the memoryview into the receive buffer
+        frame = bytes(frame)
+        try:
+            magic, flags, messageType = binaryHeader.unpack_from(frame, 0)
+            #only broadcasts are sent in the binary format
+            if messageType != MessageType.BROADCAST_MESSAGE:
+                return None
+            decodeProcess = decodeVarint if flags & internedFlag else decodeProcessId
+            sender, offset = decodeProcess(frame, binaryHeader.size)
+            sequence, offset = decodeVarint(frame, offset)
+            entries, offset = decodeVarint(frame, offset)
+            clock = []
+            for i in range(entries):
+                process, offset = decodeProcess(frame, offset)
+                counter, offset = decodeVarint(frame, offset)
+                clock.append([process, counter])
+            text, offset = decodeString(frame, offset)
+            senderIp, offset = decodeString(frame, offset)
+            messageId, offset = decodeUuid(frame, offset)
+
+            message = {'type': messageType, 'sender': sender, 'seq': sequence}
+            message['clockDelta' if flags & deltaClockFlag else 'clock'] = clock
+            message['text'] = text
+            message['senderIp'] = senderIp
+            message['id'] = messageId
+            if flags & processIdsFlag:
+                processIds = []
+                announcements, offset = decodeVarint(frame, offset)
+                for i in range(announcements):
+                    processNumber, offset = decodeVarint(frame, offset)
+                    process, offset = decodeProcessId(frame, offset)
+                    processIds.append([processNumber, process])
+                message['processIds'] = processIds
+        except (ValueError, IndexError, struct.error, UnicodeDecodeError):
+            return None
+        return message
+
+    #returns (sender, seq) for a broadcast frame without decoding the rest of it, or None if the frame carries link state
+    def peekEnvelope(self, frame):
+        try:
+            magic, flags, messageType = binaryHeader.unpack_from(frame, 0)
+            if messageType != MessageType.BROADCAST_MESSAGE or flags & (deltaClockFlag | processIdsFlag):
+                return None
+            decodeProcess = decodeVarint if flags & internedFlag else decodeProcessId
+            sender, offset = decodeProcess(frame, binaryHeader.size)
+            sequence, offset = decodeVarint(frame, offset)
+        except (ValueError, IndexError, struct.error):
+            return None
+        return (sender, sequence)
+
+
+#************************************************************
+#codec helpers
+
+jsonCodec = JsonCodec()
+binaryCodec = BinaryCodec()
+
+#returns the codec a frame was encoded with
+def codecForFrame(frame):
+    if len(frame) > 0 and frame[0] == binaryMagic:
+        return binaryCodec
+    return jsonCodec
+
+#encodes message with codec, falling back to json for messages the codec can't represent
+def encodeMessage(codec, message):
+    encoded = codec.encode(message)
+    if encoded == None:
+        return jsonCodec.encode(message)
+    return encoded
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
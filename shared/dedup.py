@@ -0,0 +1,162 @@
+from threading import Lock
+import time
+
+#Duplicate detection for flooded broadcasts
+#
+#Every broadcast carries its sender and its sequence number for that sender (the sender's entry in the message's
+#clock, also sent as 'seq'), so duplicates can be detected without remembering message ids. For each sender we keep
+#the highest sequence number below which everything has been received (the watermark), and the set of sequence
+#numbers received above it. Messages from a sender arrive almost in order over FIFO links, so the set stays small,
+#and memory is proportional to the number of live senders rather than the number of messages ever received.
+
+#************************************************************
+#sequence deduplicator
+
+class SequenceDeduplicator:
+    def __init__(self):
+        #sender --> every sequence number <= this has been received
+        self.watermarks = {}
+        #sender --> sequence numbers above the watermark that have been received
+        self.outOfOrder = {}
+        self.lock = Lock()
+
+    #records a message as received
+    #returns False if it has already been received
+    def receive(self, sender, sequence):
+        with self.lock:
+            watermark = self.watermarks.get(sender, 0)
+            received = self.outOfOrder.get(sender, None)
+            if sequence <= watermark or (received != None and sequence in received):
+                return False
+
+            if sequence != watermark + 1:
+                self.outOfOrder.setdefault(sender, set()).add(sequence)
+                return True
+
+            #close any gap the message filled
+            watermark = sequence
+            while received and watermark + 1 in received:
+                watermark += 1
+                received.remove(watermark)
+            if received != None and len(received) == 0:
+                del self.outOfOrder[sender]
+            self.watermarks[sender] = watermark
+            return True
+
+    #returns True if a message has been received, without recording it
+    def contains(self, sender, sequence):
+        with self.lock:
+            received = self.outOfOrder.get(sender, None)
+            return sequence <= self.watermarks.get(sender, 0) or (received != None and sequence in received)
+
+    #returns the highest sequence number received from sender
+    def highest(self, sender):
+        with self.lock:
+            received = self.outOfOrder.get(sender, None)
+            return max(received) if received else self.watermarks.get(sender, 0)
+
+    #raises the watermarks to the counters in clock (a list of [uuid, counter] pairs)
+    #used after cloning another process's state, as messages the clone had already received will never reach us
+    def advance(self, clock):
+        with self.lock:
+            for sender, counter in clock:
+                if counter <= self.watermarks.get(sender, 0):
+                    continue
+                watermark = counter
+                received = self.outOfOrder.pop(sender, set())
+                while watermark + 1 in received:
+                    watermark += 1
+                received = set(sequence for sequence in received if sequence > watermark)
+                if len(received) > 0:
+                    self.outOfOrder[sender] = received
+                self.watermarks[sender] = watermark
+
+    #drops the state for a sender whose clock entry has been retired
+    def forget(self, sender):
+        with self.lock:
+            self.watermarks.pop(sender, None)
+            self.outOfOrder.pop(sender, None)
+
+    #number of senders tracked, and the number of sequence numbers held above their watermarks
+    def size(self):
+        with self.lock:
+            return len(self.watermarks), sum(len(received) for received in self.outOfOrder.values())
+
+
+#************************************************************
+#recent senders
+
+#remembers which links have sent us each broadcast over the last window seconds, so relays can skip peers that
+#already have it (including the copies dropped as duplicates, which would otherwise be forgotten)
+#links are opaque (network entries), and compared by identity
+class RecentSenders:
+    def __init__(self, window):
+        self.window = window
+        #(sender, seq) --> [time first received, links that sent it], oldest first
+        self.seen = {}
+        self.lock = Lock()
+
+    #records that link sent us a broadcast
+    def record(self, sender, sequence, link):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.seen.get((sender, sequence), None)
+            if entry == None:
+                self.expire(now)
+                self.seen[(sender, sequence)] = [now, [link]]
+            elif not any(seenLink is link for seenLink in entry[1]):
+                entry[1].append(link)
+
+    #returns the links that have sent us a broadcast within the window
+    def linksFor(self, sender, sequence):
+        with self.lock:
+            entry = self.seen.get((sender, sequence), None)
+            return list(entry[1]) if entry != None else []
+
+    #drops broadcasts first received before the window
+    #must be called while holding the lock
+    def expire(self, now):
+        cutoff = now - self.window
+        while len(self.seen) > 0:
+            oldest = next(iter(self.seen))
+            if self.seen[oldest][0] >= cutoff:
+                return
+            del self.seen[oldest]
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
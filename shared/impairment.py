@@ -0,0 +1,352 @@
+from threading import Condition
+import random
+import socket
+import json
+import math
+import time
+
+#Network impairment emulator
+#
+#For load testing, received broadcasts can be put through a per-link impairment profile before they are handled:
+#
+#- latency: a base delay (seconds), plus jitter drawn from a distribution: 'constant' (no jitter), 'uniform' (within
+#  +/- jitter), 'normal' (jitter is the standard deviation) or 'exponential' (jitter is the mean)
+#- loss: the probability a broadcast is dropped
+#- duplicate: the probability a broadcast arrives twice, each copy delayed independently
+#- reorder: the probability a broadcast skips the latency, overtaking any that are still held back (like netem)
+#- bandwidth: the bytes per second the link can carry, broadcasts queue behind each other to be sent (0 is unlimited)
+#
+#Profiles apply to the link a broadcast arrives on, unless there is one for the address of its sender, so every
+#copy of a sender's broadcasts can be held back whichever peer relays them (this is how ENABLE_NETWORK_DELAY works).
+#
+#Broadcasts are impaired once their link state (delta clocks, process numbers) has been applied, as that depends on
+#the order frames arrived on the link, but before they are checked for duplicates (see applyLinkState in client.py).
+#So a copy relayed over a faster link is handled first, a lost broadcast can still arrive from another peer, and
+#duplicated copies are dropped like any other. Only broadcasts are impaired, the protocol has no recovery for lost
+#control messages.
+#
+#Held broadcasts are kept in a hierarchical timer wheel (Varghese and Lauck), served by a single thread. Adding a
+#broadcast and releasing it are O(1), whatever the number held, and the thread only wakes when something is due
+#(or once per rotation of the first wheel, when timers cascade down from the wheels above).
+
+#************************************************************
+#profiles
+
+distributions = ['constant', 'uniform', 'normal', 'exponential']
+
+class ImpairmentProfile:
+    def __init__(self, latency = 0, jitter = 0, distribution = 'uniform', loss = 0, duplicate = 0, reorder = 0, bandwidth = 0):
+        if distribution not in distributions:
+            raise ValueError('unknown latency distribution {0}'.format(distribution))
+        self.latency = float(latency)
+        self.jitter = float(jitter)
+        self.distribution = distribution
+        self.loss = float(loss)
+        self.duplicate = float(duplicate)
+        self.reorder = float(reorder)
+        self.bandwidth = float(bandwidth)
+
+    #builds a profile from 'name=value' pairs separated by commas, e.g. 'latency=0.05,jitter=0.01,loss=0.01'
+    @staticmethod
+    def parse(spec):
+        settings = {}
+        for setting in spec.split(','):
+            if setting.strip() == '':
+                continue
+            name, value = setting.split('=', 1)
+            settings[name.strip()] = value.strip()
+        return ImpairmentProfile(**settings)
+
+    #returns a delay drawn from the profile's latency distribution, in seconds
+    def sampleLatency(self, generator):
+        if self.distribution == 'constant' or self.jitter == 0:
+            jitter = 0
+        elif self.distribution == 'uniform':
+            jitter = generator.uniform(-self.jitter, self.jitter)
+        elif self.distribution == 'normal':
+            jitter = generator.gauss(0, self.jitter)
+        else:
+            jitter = generator.expovariate(1 / self.jitter)
+        return max(self.latency + jitter, 0)
+
+
+#returns (default profile, peer address --> profile, sender address --> profile) from a json file of the form
+#{"default": {...}, "peers": {"127.0.0.2": {...}}, "senders": {"127.0.0.1": {...}}}, where each profile is an object
+#of ImpairmentProfile's settings
+def loadProfiles(path):
+    with open(path) as profileFile:
+        config = json.load(profileFile)
+    default = ImpairmentProfile(**config['default']) if config.get('default', None) != None else None
+    peers = {peer: ImpairmentProfile(**settings) for peer, settings in config.get('peers', {}).items()}
+    senders = {sender: ImpairmentProfile(**settings) for sender, settings in config.get('senders', {}).items()}
+    return default, peers, senders
+
+
+#returns address --> profile from 'address:profile' entries separated by semicolons (see ImpairmentProfile.parse)
+#e.g. '127.0.0.2:latency=0.2;127.0.0.3:loss=0.1,bandwidth=100000'
+def parseProfiles(spec):
+    profiles = {}
+    for entry in spec.split(';'):
+        if entry.strip() == '':
+            continue
+        address, profile = entry.split(':', 1)
+        profiles[address.strip()] = ImpairmentProfile.parse(profile)
+    return profiles
+
+
+#************************************************************
+#timer wheel
+
+#hierarchical timer wheel, times are in ticks of tick seconds since the wheel was created
+#each level has 2^slotBits slots, a timer goes in the lowest level whose range covers how far away it is, and moves
+#down a level (cascades) each time the level below completes a rotation, until it fires from the first level
+#timers further away than the top level covers are clamped to its range (2^(slotBits * levels) ticks)
+#not thread safe, see NetworkImpairment
+class TimerWheel:
+    def __init__(self, tick, slotBits = 6, levels = 4):
+        self.tick = tick
+        self.slotBits = slotBits
+        self.mask = (1 << slotBits) - 1
+        self.levels = levels
+        self.wheels = [[[] for slot in range(1 << slotBits)] for level in range(levels)]
+        self.origin = time.monotonic()
+        #every timer due before this tick has fired
+        self.current = 0
+        self.size = 0
+
+    #returns the tick it is now
+    def now(self):
+        return int((time.monotonic() - self.origin) / self.tick)
+
+    #adds a timer for item, due in delay seconds
+    #returns the tick it is due at
+    def add(self, delay, item):
+        now = self.now()
+        #the wheel isn't advanced while it is empty, so it catches up here, before the timer is placed relative to it
+        if self.size == 0:
+            self.current = max(self.current, now)
+        due = max(now + math.ceil(delay / self.tick), self.current)
+        self.insert(due, item)
+        self.size += 1
+        return due
+
+    def insert(self, due, item):
+        due = max(due, self.current)
+        offset = due - self.current
+        for level in range(self.levels):
+            if offset < 1 << (self.slotBits * (level + 1)):
+                break
+        else:
+            due = self.current + (1 << (self.slotBits * self.levels)) - 1
+        self.wheels[level][(due >> (self.slotBits * level)) & self.mask].append((due, item))
+
+    #moves the timers in a slot down to the level below
+    def cascade(self, level, index):
+        timers = self.wheels[level][index]
+        self.wheels[level][index] = []
+        for due, item in timers:
+            self.insert(due, item)
+
+    #fires every timer due up to and including tick, skipping over empty slots of the first level (it stops at
+    #least once per rotation, to cascade), so the work done doesn't grow with the time since the last call
+    #returns their items, in the order they were due
+    def advance(self, tick):
+        fired = []
+        while self.current <= tick:
+            if self.size == 0:
+                self.current = tick + 1
+                break
+            index = self.current & self.mask
+            #the first level has completed a rotation, so the next slot of each level above that has also completed
+            #a rotation comes down
+            level = 1
+            while index == 0 and level < self.levels:
+                index = (self.current >> (self.slotBits * level)) & self.mask
+                self.cascade(level, index)
+                level += 1
+            slot = self.wheels[0][self.current & self.mask]
+            if len(slot) > 0:
+                self.wheels[0][self.current & self.mask] = []
+                self.size -= len(slot)
+                fired.extend(item for due, item in slot)
+            self.current += 1
+            nextTick = self.nextTick()
+            self.current = tick + 1 if nextTick == None else min(nextTick, tick + 1)
+        return fired
+
+    #returns the tick advance next needs to be called at, or None if there are no timers
+    #that is the next timer in the first level's current rotation, or the end of the rotation if it has none, when
+    #timers cascade down from the levels above
+    def nextTick(self):
+        if self.size == 0:
+            return None
+        index = self.current & self.mask
+        #a rotation starts at the current tick, and the timers due in it haven't cascaded down yet
+        if index == 0:
+            return self.current
+        for offset in range(len(self.wheels[0]) - index):
+            if len(self.wheels[0][index + offset]) > 0:
+                return self.current + offset
+        return self.current + len(self.wheels[0]) - index
+
+    #returns how long to wait until tick, in seconds
+    def secondsUntil(self, tick):
+        return max(self.origin + tick * self.tick - time.monotonic(), 0)
+
+
+#************************************************************
+#impairment layer
+
+#per-link impairment state, kept in the link's network entry (see shared/network.py)
+#each link draws from its own generator, so with a seed a link's impairments only depend on the broadcasts it
+#receives, not on how the read workers serving other links are scheduled
+class LinkImpairment:
+    def __init__(self, profile, generator):
+        self.profile = profile
+        self.generator = generator
+        #when the link will have sent everything queued on it so far (time.monotonic()), if its bandwidth is capped
+        self.busyUntil = 0
+
+
+#holds broadcasts back according to their link's profile, and calls release(networkEntry, message, relayFrame) from its
+#own thread as each one becomes due
+class NetworkImpairment:
+    #default is the profile for links without one of their own (None to leave them unimpaired)
+    #peers and senders map peer addresses and broadcast senders' addresses to profiles
+    def __init__(self, default, peers, senders, release, tick = 0.001, seed = None):
+        self.default = default
+        self.peers = peers
+        self.senders = senders
+        self.release = release
+        self.seed = seed
+        self.wheel = TimerWheel(tick)
+        self.condition = Condition()
+        #the tick the scheduler thread will next wake at, or None if it is waiting to be notified
+        self.wakeTick = None
+        self.stopped = False
+        self.statistics = {'impaired': 0, 'lost': 0, 'duplicated': 0, 'reordered': 0, 'delay': 0, 'maxHeld': 0}
+
+    #returns True if broadcasts arriving on a link may be impaired, so have to be passed to submit before checking for duplicates
+    def impairsLink(self, networkEntry):
+        return len(self.senders) > 0 or self.linkState(networkEntry).profile != None
+
+    #returns the link's impairment state, resolving its profile from the peer's address the first time
+    def linkState(self, networkEntry):
+        state = networkEntry['impairment']
+        if state == None:
+            try:
+                peer = networkEntry['connection'].getpeername()[0]
+            except (socket.error, AttributeError):
+                peer = None
+            generator = random.Random('{0}:{1}'.format(self.seed, peer)) if self.seed != None else random.Random()
+            state = LinkImpairment(self.peers.get(peer, self.default), generator)
+            networkEntry['impairment'] = state
+        return state
+
+    #holds a broadcast back according to its profile, size is the size of the frame it arrived in (in bytes)
+    #returns False if it isn't impaired, and should be handled now
+    #must be called while holding the link's lock, which guards the link's state (read workers serving other links
+    #call it at the same time)
+    def submit(self, networkEntry, message, relayFrame, size):
+        state = self.linkState(networkEntry)
+        profile = self.senders.get(message.get('senderIp', None), state.profile)
+        if profile == None:
+            return False
+
+        generator = state.generator
+        if generator.random() < profile.loss:
+            with self.condition:
+                self.statistics['impaired'] += 1
+                self.statistics['lost'] += 1
+            return True
+
+        now = time.monotonic()
+        sent = now
+        if profile.bandwidth > 0:
+            sent = max(now, state.busyUntil) + size / profile.bandwidth
+            state.busyUntil = sent
+        copies = 2 if generator.random() < profile.duplicate else 1
+        delays = []
+        for copy in range(copies):
+            if generator.random() < profile.reorder:
+                delays.append((sent - now, True))
+            else:
+                delays.append((sent - now + profile.sampleLatency(generator), False))
+
+        with self.condition:
+            self.statistics['impaired'] += 1
+            self.statistics['duplicated'] += copies - 1
+            for delay, reordered in delays:
+                self.statistics['reordered'] += reordered
+                self.statistics['delay'] += delay
+                due = self.wheel.add(delay, (networkEntry, message, relayFrame))
+                #the scheduler thread only needs waking if this is due before it would otherwise wake
+                if self.wakeTick == None or due < self.wakeTick:
+                    self.condition.notify()
+            self.statistics['maxHeld'] = max(self.statistics['maxHeld'], self.wheel.size)
+        return True
+
+    #scheduler thread, releases held broadcasts as they become due
+    def run(self):
+        while True:
+            with self.condition:
+                while True:
+                    if self.stopped:
+                        return
+                    fired = self.wheel.advance(self.wheel.now())
+                    if len(fired) > 0:
+                        self.wakeTick = self.wheel.current
+                        break
+                    self.wakeTick = self.wheel.nextTick()
+                    self.condition.wait(None if self.wakeTick == None else self.wheel.secondsUntil(self.wakeTick))
+            for networkEntry, message, relayFrame in fired:
+                self.release(networkEntry, message, relayFrame)
+
+    #stops the scheduler thread, broadcasts still held are dropped
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    #returns the number of broadcasts held
+    def held(self):
+        with self.condition:
+            return self.wheel.size
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
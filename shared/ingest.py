@@ -0,0 +1,118 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
+from shared.codec import codecForFrame
+import multiprocessing
+import marshal
+import os
+
+#Multi-process ingest stage
+#
+#Read workers decode frames one link at a time, but decoding (json.loads/the binary codec, and validating the fields
+#of the result) holds the GIL, so under bursts more read threads don't decode any faster. With the ingest pool, the
+#frames a read worker takes from a connection are decoded in worker processes instead, and the read worker (and the
+#GIL) is free while it waits for the result.
+#
+#Only the codec runs in the pool. Everything that depends on the link's state - duplicate checks on the envelope,
+#delta clocks and process numbers - is applied by the read worker before and after, in the order frames arrived
+#(see ingestFrames in client.py), so per-connection ordering is unchanged: a connection is only read by one worker
+#at a time, and its frames are handed back in order as a single batch.
+#
+#Decoded messages are plain dicts, lists, strings and ints, so they are sent back to the read worker as a single marshalled
+#batch, which takes about a third of the time to load that the frames take to decode (and less than pickling them).
+#Batches smaller than minimumBatch aren't worth the round trip, and are decoded by the read worker.
+#
+#Workers are forked from the client, so the pool must be started before the client starts any threads (a forked
+#child only gets a copy of the thread that forked it, and any lock held by another thread stays locked forever).
+#The client can't be spawned instead, as spawned workers re-run the main script.
+
+#decodes and validates a batch of frames in a worker process (see parseJsonMessage and BinaryCodec.decode)
+#returns the decoded messages in the same order, with None for frames that couldn't be decoded or are malformed
+def decodeFrames(frames):
+    return [codecForFrame(frame).decode(frame) for frame in frames]
+
+#decodes a batch of frames in a worker process, returning the decoded messages marshalled (see decodeFrames)
+def decodeFramesMarshalled(frames):
+    return marshal.dumps(decodeFrames(frames))
+
+
+#a pool of worker processes that decodes batches of frames
+#decode can be called by several read workers at once, and each waits for its own batch
+class IngestPool:
+    #processes is the number of worker processes, or 0 for one per core
+    def __init__(self, processes, minimumBatch):
+        self.processes = processes if processes > 0 else (os.cpu_count() or 1)
+        self.minimumBatch = minimumBatch
+        self.executor = None
+        self.lock = Lock()
+        #batches and frames decoded by the workers, and frames decoded by the read workers (as their batch was too small)
+        self.statistics = {'batches': 0, 'frames': 0, 'inline': 0}
+
+    #forks the worker processes, see above for why this must be called before any threads are started
+    def start(self):
+        self.executor = ProcessPoolExecutor(self.processes, multiprocessing.get_context('fork'))
+        #workers are forked when the first batch is submitted, so submit an empty one now
+        self.executor.submit(decodeFrames, []).result()
+
+    #returns the decoded messages for a list of frames (bytes), in the same order, with None for frames that
+    #couldn't be decoded
+    #if a worker process dies, the pool can't be used again, and every batch is decoded by the read workers
+    def decode(self, frames):
+        executor = self.executor
+        if executor != None and len(frames) >= self.minimumBatch:
+            try:
+                decoded = marshal.loads(executor.submit(decodeFramesMarshalled, frames).result())
+            except BrokenProcessPool:
+                print('[ERR] Ingest pool worker died, decoding frames in the read workers instead')
+                self.executor = None
+                decoded = None
+            if decoded != None:
+                with self.lock:
+                    self.statistics['batches'] += 1
+                    self.statistics['frames'] += len(frames)
+                return decoded
+        with self.lock:
+            self.statistics['inline'] += len(frames)
+        return decodeFrames(frames)
+
+    def close(self):
+        if self.executor != None:
+            self.executor.shutdown()
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
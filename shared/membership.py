@@ -0,0 +1,136 @@
+from threading import Lock
+from collections import deque
+
+#Copy-on-write peer membership
+#
+#Every broadcast used to copy the peer list under a lock, then look each peer's network entry up in a dict that the
+#accept worker and peer failures change concurrently. Membership is now published as immutable, versioned snapshots:
+#readers take the current snapshot with a single attribute read and iterate it without any lock, and writers (peers
+#connecting and failing, which is rare) build a new snapshot under the table's lock and publish it.
+#
+#A snapshot maps each peer's address to its network entry (see shared/network.py), which holds the peer's connection
+#and per-link state and statistics. The entries themselves are still mutable, and guarded by their own locks.
+#
+#Each change is also recorded as an event (version, kind, peer), where kind is 'join' or 'leave'. Listeners are called
+#with each event as it is published, in version order, and recent events can be read back with changesSince.
+
+#number of recent membership events kept for changesSince
+eventHistory = 1024
+
+#a published version of the membership, never changed once published
+class Membership:
+    def __init__(self, version, entries):
+        self.version = version
+        #peer address --> network entry
+        self.entries = entries
+        #(peer, network entry) pairs, in the order peers joined
+        self.members = tuple(entries.items())
+        #ids of the network entries, so links can be checked for membership in O(1)
+        self.entryIds = frozenset(id(networkEntry) for networkEntry in entries.values())
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, peer):
+        return self.entries.get(peer, None)
+
+    #returns True if networkEntry is the entry of a member (rather than of a peer that has since failed or reconnected)
+    def contains(self, networkEntry):
+        return id(networkEntry) in self.entryIds
+
+
+class MembershipTable:
+    def __init__(self):
+        self.membership = Membership(0, {})
+        #serialises writers, readers never take it
+        self.lock = Lock()
+        self.events = deque(maxlen=eventHistory)
+        self.listeners = []
+
+    #returns the current version of the membership
+    def current(self):
+        return self.membership
+
+    def __len__(self):
+        return len(self.membership)
+
+    #calls listener(membership, event) with the new version and event each time the membership changes
+    #listeners are called while the change is published, so must be quick and must not change the membership
+    def subscribe(self, listener):
+        with self.lock:
+            self.listeners.append(listener)
+
+    #adds a peer, replacing the entry of a previous connection with it
+    #returns the new version of the membership
+    def add(self, peer, networkEntry):
+        with self.lock:
+            entries = dict(self.membership.entries)
+            entries.pop(peer, None)
+            entries[peer] = networkEntry
+            return self.publish(entries, 'join', peer)
+
+    #removes a peer
+    #returns (its network entry, the new version of the membership), or (None, the current version) if it isn't a member
+    def remove(self, peer):
+        with self.lock:
+            networkEntry = self.membership.get(peer)
+            if networkEntry == None:
+                return None, self.membership
+            entries = dict(self.membership.entries)
+            del entries[peer]
+            return networkEntry, self.publish(entries, 'leave', peer)
+
+    #returns the events published after version, oldest first, or None if some of them are no longer kept
+    def changesSince(self, version):
+        with self.lock:
+            if version < self.membership.version - len(self.events):
+                return None
+            return [event for event in self.events if event[0] > version]
+
+    #must be called while holding the table's lock
+    def publish(self, entries, kind, peer):
+        membership = Membership(self.membership.version + 1, entries)
+        self.membership = membership
+        event = (membership.version, kind, peer)
+        self.events.append(event)
+        for listener in self.listeners:
+            listener(membership, event)
+        return membership
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
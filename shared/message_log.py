@@ -0,0 +1,399 @@
+from threading import Lock
+import mmap
+import os
+import struct
+import time
+import uuid
+import zlib
+
+#Append-only on-disk log of delivered broadcasts
+#
+#Each node logs the broadcasts it delivers (and its own) to a directory of numbered segment files, so that its
+#history survives a restart, and broadcasts that peers have missed can be served from disk instead of being kept in
+#memory. A record is the broadcast's encoded message (which carries its clock) with a header and a trailer:
+#
+#   sender uuid (16 bytes), sequence number (8), body length (4), crc32 of the body (4), time stored (8), body,
+#   record length (4)
+#
+#the trailing length lets history be paged backwards from any record. Each segment has an index file alongside it,
+#an open addressed hash table of (sender uuid, sequence number) --> record offset that is memory mapped rather than
+#held in memory, so a broadcast is found in a probe or two however long the log gets.
+#
+#Appends are queued in memory, and written and fsynced in groups every commit interval (group commit), so delivery
+#never waits on the disk. A crash loses at most the last interval's broadcasts, which peers can send us again.
+#Once the active segment reaches its size or record limit a new one is started, and only the newest few are kept.
+#
+#On startup, the index of each sealed segment is used as is, and the active segment is scanned to drop any torn
+#record at its end and rebuild its index.
+
+recordHeader = struct.Struct('!16sQLLd')
+recordTrailer = struct.Struct('!L')
+indexSlot = struct.Struct('!16sQQ')
+#each segment's index has at least this many slots per record it can hold, so its table is never more than half full
+indexSlotsPerRecord = 2
+#average record size assumed when limiting the records in a segment (and so sizing its index)
+indexedRecordBytes = 256
+
+#************************************************************
+#segments
+
+#a segment file and its index
+class Segment:
+    #rebuild discards the segment's index and rebuilds it by scanning the segment, truncating any torn record at its end
+    def __init__(self, directory, number, maxRecords, rebuild):
+        self.number = number
+        self.path = os.path.join(directory, '{0:08d}.log'.format(number))
+        self.indexPath = os.path.join(directory, '{0:08d}.idx'.format(number))
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND)
+        self.size = os.fstat(self.fd).st_size
+        self.count = 0
+        #sender --> [lowest, highest] sequence number in the segment
+        self.ranges = {}
+
+        indexFd = os.open(self.indexPath, os.O_RDWR | os.O_CREAT)
+        try:
+            rebuild = rebuild or os.fstat(indexFd).st_size == 0
+            if rebuild:
+                os.ftruncate(indexFd, 0)
+                os.ftruncate(indexFd, (1 << (indexSlotsPerRecord * maxRecords - 1).bit_length()) * indexSlot.size)
+            self.capacity = os.fstat(indexFd).st_size // indexSlot.size
+            self.index = mmap.mmap(indexFd, self.capacity * indexSlot.size)
+        finally:
+            os.close(indexFd)
+
+        if rebuild:
+            self.scan()
+        else:
+            self.loadIndex()
+
+    def slotFor(self, senderBytes, sequence):
+        return (int.from_bytes(senderBytes[:8], 'big') ^ (sequence * 0x9E3779B97F4A7C15)) & (self.capacity - 1)
+
+    #adds a record to the index, and the sequence number ranges
+    def insert(self, senderBytes, sequence, offset):
+        slot = self.slotFor(senderBytes, sequence)
+        while True:
+            slotSender, slotSequence, slotOffset = indexSlot.unpack_from(self.index, slot * indexSlot.size)
+            if slotSequence == 0 or (slotSequence == sequence and slotSender == senderBytes):
+                break
+            slot = (slot + 1) & (self.capacity - 1)
+        indexSlot.pack_into(self.index, slot * indexSlot.size, senderBytes, sequence, offset)
+        if slotSequence == 0:
+            self.count += 1
+        self.noteSequence(str(uuid.UUID(bytes=senderBytes)), sequence)
+
+    def noteSequence(self, sender, sequence):
+        seqRange = self.ranges.get(sender, None)
+        if seqRange == None:
+            self.ranges[sender] = [sequence, sequence]
+        else:
+            seqRange[0] = min(seqRange[0], sequence)
+            seqRange[1] = max(seqRange[1], sequence)
+
+    #returns the offset of a record, or None if it isn't in the segment
+    def find(self, senderBytes, sequence):
+        slot = self.slotFor(senderBytes, sequence)
+        while True:
+            slotSender, slotSequence, slotOffset = indexSlot.unpack_from(self.index, slot * indexSlot.size)
+            if slotSequence == 0:
+                return None
+            if slotSequence == sequence and slotSender == senderBytes:
+                return slotOffset
+            slot = (slot + 1) & (self.capacity - 1)
+
+    #returns True if the segment's index has room for another record
+    def hasRoom(self, maxRecords):
+        return self.count < min(maxRecords, self.capacity // indexSlotsPerRecord)
+
+    #rebuilds the sequence number ranges from a sealed segment's index
+    def loadIndex(self):
+        for senderBytes, sequence, offset in struct.iter_unpack(indexSlot.format, self.index):
+            if sequence != 0:
+                self.count += 1
+                self.noteSequence(str(uuid.UUID(bytes=senderBytes)), sequence)
+
+    #indexes every intact record in the segment, and truncates the segment after the last one
+    def scan(self):
+        data = os.pread(self.fd, self.size, 0)
+        offset = 0
+        while offset + recordHeader.size + recordTrailer.size <= len(data):
+            senderBytes, sequence, length, checksum, storedAt = recordHeader.unpack_from(data, offset)
+            end = offset + recordHeader.size + length + recordTrailer.size
+            if end > len(data) or zlib.crc32(data[offset + recordHeader.size:end - recordTrailer.size]) != checksum:
+                break
+            #records without a sequence number can't be indexed (see MessageLog.append), but are kept for paging
+            if sequence != 0:
+                self.insert(senderBytes, sequence, offset)
+            offset = end
+        if offset < self.size:
+            os.ftruncate(self.fd, offset)
+            self.size = offset
+
+    #returns (time stored, body) of the record at offset
+    def read(self, offset):
+        senderBytes, sequence, length, checksum, storedAt = recordHeader.unpack(os.pread(self.fd, recordHeader.size, offset))
+        return (storedAt, os.pread(self.fd, length, offset + recordHeader.size))
+
+    #returns the offset of the record that ends at offset
+    def recordBefore(self, offset):
+        return offset - recordTrailer.unpack(os.pread(self.fd, recordTrailer.size, offset - recordTrailer.size))[0]
+
+    def write(self, data):
+        data = memoryview(data)
+        while len(data) > 0:
+            data = data[os.write(self.fd, data):]
+
+    #makes the segment and its index durable, once it is no longer appended to
+    def seal(self):
+        os.fsync(self.fd)
+        self.index.flush()
+
+    def close(self):
+        self.index.close()
+        os.close(self.fd)
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
+        os.remove(self.indexPath)
+
+
+#************************************************************
+#log
+
+class MessageLog:
+    #keeps the newest segmentCount segments of up to segmentBytes each in directory
+    #fsync is False to leave writing commits back to disk to the OS
+    def __init__(self, directory, segmentBytes, segmentCount, fsync):
+        self.segmentBytes = segmentBytes
+        self.segmentCount = max(2, segmentCount)
+        self.maxRecords = max(1024, segmentBytes // indexedRecordBytes)
+        self.fsync = fsync
+        self.directory = directory
+        self.lock = Lock()
+        #records appended but not written yet: (segment number, offset, record, sender uuid bytes, sequence number)
+        self.pending = []
+        #True if records have been written since the last fsync
+        self.unsynced = False
+        #sender --> highest sequence number logged, as each sender's broadcasts are logged in order
+        self.latest = {}
+        #broadcasts and bytes appended, group commits, and records found on disk at startup
+        self.statistics = {'appended': 0, 'bytes': 0, 'commits': 0, 'recovered': 0}
+
+        os.makedirs(directory, exist_ok=True)
+        numbers = sorted(int(name[:-4]) for name in os.listdir(directory) if name.endswith('.log') and name[:-4].isdigit())
+        #oldest first, the last segment is the one being appended to
+        self.segments = [Segment(directory, number, self.maxRecords, number == numbers[-1]) for number in numbers]
+        if len(self.segments) == 0:
+            self.segments.append(Segment(directory, 1, self.maxRecords, True))
+        for segment in self.segments:
+            self.statistics['recovered'] += segment.count
+            for sender, seqRange in segment.ranges.items():
+                self.latest[sender] = max(seqRange[1], self.latest.get(sender, 0))
+
+        #segment number, offset and record count the next record is appended at, counting pending records
+        active = self.segments[-1]
+        self.tail = [active.number, active.size, active.count if active.hasRoom(self.maxRecords) else self.maxRecords]
+
+    #queues a broadcast to be written, returning its [segment number, offset] position in the log
+    #returns None if the broadcast can't be logged: sequence numbers start at 1, as 0 marks an empty index slot
+    def append(self, sender, sequence, body):
+        if sequence < 1:
+            return None
+        senderBytes = uuid.UUID(sender).bytes
+        record = recordHeader.pack(senderBytes, sequence, len(body), zlib.crc32(body), time.time()) + body
+        record += recordTrailer.pack(len(record) + recordTrailer.size)
+        with self.lock:
+            number, offset, count = self.tail
+            if count >= self.maxRecords or (offset > 0 and offset + len(record) > self.segmentBytes):
+                number, offset, count = number + 1, 0, 0
+            self.tail = [number, offset + len(record), count + 1]
+            self.pending.append((number, offset, record, senderBytes, sequence))
+            self.latest[sender] = max(sequence, self.latest.get(sender, 0))
+            self.statistics['appended'] += 1
+            self.statistics['bytes'] += len(record)
+        return [number, offset]
+
+    #writes and fsyncs everything appended since the last commit
+    def commit(self):
+        with self.lock:
+            self.writePending()
+            if not self.unsynced:
+                return
+            self.unsynced = False
+            self.statistics['commits'] += 1
+            fd = self.segments[-1].fd
+        if self.fsync:
+            try:
+                os.fsync(fd)
+            except OSError:
+                #the segment was sealed (and synced) and removed in the meantime
+                pass
+
+    #writes pending records to their segments, in one write per segment
+    #called with the lock held, before anything is read from the segments
+    def writePending(self):
+        if len(self.pending) == 0:
+            return
+        group = []
+        for pendingRecord in self.pending:
+            if pendingRecord[0] != self.segments[-1].number:
+                self.writeGroup(group)
+                group = []
+                self.startSegment(pendingRecord[0])
+            group.append(pendingRecord)
+        self.writeGroup(group)
+        self.pending = []
+        self.unsynced = True
+
+    def writeGroup(self, group):
+        if len(group) == 0:
+            return
+        active = self.segments[-1]
+        active.write(b''.join(record for number, offset, record, senderBytes, sequence in group))
+        for number, offset, record, senderBytes, sequence in group:
+            active.insert(senderBytes, sequence, offset)
+        active.size = group[-1][1] + len(group[-1][2])
+
+    #seals the active segment and starts appending to a new one, removing the oldest if there are too many
+    def startSegment(self, number):
+        self.segments[-1].seal()
+        self.segments.append(Segment(self.directory, number, self.maxRecords, True))
+        while len(self.segments) > self.segmentCount:
+            self.segments.pop(0).remove()
+
+    #returns True if a broadcast has been logged
+    def isLogged(self, sender, sequence):
+        with self.lock:
+            return sequence <= self.latest.get(sender, 0)
+
+    #returns the body of a logged broadcast, or None if it isn't in the log (any more)
+    def lookup(self, sender, sequence):
+        senderBytes = uuid.UUID(sender).bytes
+        with self.lock:
+            self.writePending()
+            for segment in reversed(self.segments):
+                seqRange = segment.ranges.get(sender, None)
+                if seqRange == None or sequence < seqRange[0] or sequence > seqRange[1]:
+                    continue
+                offset = segment.find(senderBytes, sequence)
+                if offset != None:
+                    return segment.read(offset)[1]
+        return None
+
+    #returns the bodies of the logged broadcasts that a clock (a list of [uuid, counter] pairs) doesn't cover, in
+    #sequence order per sender, from senders isLive(sender) accepts
+    #broadcasts stored after storedBefore (wall clock time) are left out
+    #if limit is set, at most limit broadcasts are returned, the oldest of each sender first, so a peer that is far
+    #behind can be sent them a batch at a time
+    def newerThan(self, clock, storedBefore, isLive, limit = None):
+        counters = dict(clock)
+        missing = []
+        #sender --> broadcasts found, at most limit are read from each sender
+        found = {}
+        with self.lock:
+            self.writePending()
+            for segment in self.segments:
+                for sender, seqRange in segment.ranges.items():
+                    if seqRange[1] <= counters.get(sender, 0) or not isLive(sender):
+                        continue
+                    senderBytes = uuid.UUID(sender).bytes
+                    for sequence in range(max(seqRange[0], counters.get(sender, 0) + 1), seqRange[1] + 1):
+                        if limit != None and found.get(sender, 0) >= limit:
+                            break
+                        offset = segment.find(senderBytes, sequence)
+                        if offset == None:
+                            continue
+                        storedAt, body = segment.read(offset)
+                        if storedAt < storedBefore:
+                            missing.append((sequence, body))
+                            found[sender] = found.get(sender, 0) + 1
+        missing.sort(key=lambda entry: entry[0])
+        return [body for sequence, body in missing[:limit]]
+
+    #returns up to count of the records logged before position (or the newest, if position is None), newest first
+    #as ([segment number, offset], time stored, body), where the last record's position continues paging backwards
+    def page(self, position, count):
+        records = []
+        with self.lock:
+            self.writePending()
+            segments = {segment.number: segment for segment in self.segments}
+            number, offset = position if position != None else (self.segments[-1].number, self.segments[-1].size)
+            while len(records) < count and number in segments:
+                if offset == 0:
+                    number -= 1
+                    offset = segments[number].size if number in segments else 0
+                    continue
+                offset = segments[number].recordBefore(offset)
+                storedAt, body = segments[number].read(offset)
+                records.append(([number, offset], storedAt, body))
+        return records
+
+    #returns the bodies of the records stored at or after storedAfter (wall clock time), in the order they were logged
+    def since(self, storedAfter):
+        bodies = []
+        position = None
+        while True:
+            records = self.page(position, 100)
+            for recordPosition, storedAt, body in records:
+                if storedAt < storedAfter:
+                    bodies.reverse()
+                    return bodies
+                bodies.append(body)
+            if len(records) == 0:
+                bodies.reverse()
+                return bodies
+            position = records[-1][0]
+
+    #returns the number of segments, records and bytes on disk
+    def size(self):
+        with self.lock:
+            return (len(self.segments), sum(segment.count for segment in self.segments), sum(segment.size for segment in self.segments))
+
+    #commits anything pending, and closes the log
+    def close(self):
+        self.commit()
+        with self.lock:
+            if self.fsync:
+                self.segments[-1].seal()
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
@@ -1,6 +1,9 @@
 import struct
 import socket
+import time
+import asyncio
 from threading import Lock
+from collections import deque
 
 
 #All messages sent by the system follow the following format:
@@ -15,31 +18,226 @@ from threading import Lock
 
 #attaches a fixed width size header to start of message 
 def prependContentLengthHeader(encodedMessage):
-    contentLength = len(encodedMessage)
-    #preprend fixed-width standardized long to message
-    fixedWidthHeader = struct.pack('!l', contentLength)
-    return fixedWidthHeader + encodedMessage
+    return contentLengthHeader(encodedMessage) + encodedMessage
+
+
+#returns the fixed width size header for a message, without attaching it
+def contentLengthHeader(encodedMessage):
+    #fixed-width standardized long
+    return struct.pack('!l', len(encodedMessage))
 
 
 #encodes message using utf-8, then attaches header
+#only used on blocking sockets (p2p connections queue their messages, see OutboundQueue)
 def sendWithHeaderAndEncoding(connection, message):
     encoded = message.encode('utf-8')
     withHeader = prependContentLengthHeader(encoded)
-    return connection.send(withHeader)
+    return connection.sendall(withHeader)
+
+
+
+#************************************************************
+#receive buffer
+
+#smallest and largest amount of data requested from a socket per read
+minimumReadSize = 2048
+maximumReadSize = 1048576
+
+#per-connection receive buffer
+#data is read straight into a bytearray with recv_into, and complete messages are handed out as memoryviews
+#into it, so message content isn't copied between the socket and the message handler
+#the read size adapts to the traffic on the connection: it doubles while reads fill the space offered,
+#and halves while they use less than a quarter of it, and a read is never smaller than the rest of
+#the message currently being received (up to maximumReadSize)
+class ReceiveBuffer:
+    def __init__(self):
+        self.data = bytearray(minimumReadSize * 2)
+        #unconsumed data is self.data[start:end]
+        self.start = 0
+        self.end = 0
+        self.readSize = minimumReadSize
+        #size of the space offered to the current read
+        self.requested = minimumReadSize
+        #length of the message currently being received, once its header has been read
+        self.contentLength = None
+
+    #reads whatever is available from connection into the buffer
+    #returns the number of bytes read (0 if the connection closed), socket errors are raised to the caller
+    def receive(self, connection):
+        with self.readBuffer() as view:
+            received = connection.recv_into(view, len(view))
+        self.commitRead(received)
+        return received
+
+    #returns a view of the space the next read should be written to
+    #the view must be released before the buffer is used again, and the read recorded with commitRead
+    def readBuffer(self):
+        self.requested = self.readSize
+        if self.contentLength != None:
+            remaining = struct.calcsize('!l') + self.contentLength - (self.end - self.start)
+            self.requested = max(self.requested, min(remaining, maximumReadSize))
+        self.reserve(self.requested)
+        return memoryview(self.data)[self.end:self.end + self.requested]
+
+    #records that received bytes were written into the view returned by readBuffer
+    def commitRead(self, received):
+        self.end += received
+        if received == self.requested:
+            self.readSize = min(self.readSize * 2, maximumReadSize)
+        elif received < self.requested // 4:
+            self.readSize = max(self.readSize // 2, minimumReadSize)
+
+    #makes room for size more bytes after the unconsumed data
+    #moves the unconsumed data to the start of the buffer, and grows the buffer if that isn't enough
+    def reserve(self, size):
+        if len(self.data) - self.end >= size:
+            return
+        unconsumed = self.end - self.start
+        if self.start > 0:
+            self.data[:unconsumed] = self.data[self.start:self.end]
+            self.start = 0
+            self.end = unconsumed
+        if len(self.data) - self.end < size:
+            self.data.extend(bytes(max(size - (len(self.data) - self.end), len(self.data))))
+
+    #yields each complete message in the buffer as a memoryview
+    #each view is released once the consumer moves on, so it must be copied if it needs to be kept
+    def messages(self):
+        headerSize = struct.calcsize('!l')
+        while True:
+            if self.contentLength == None:
+                if self.end - self.start < headerSize:
+                    break
+                self.contentLength = struct.unpack_from('!l', self.data, self.start)[0]
+            if self.end - self.start < headerSize + self.contentLength:
+                break
 
+            messageStart = self.start + headerSize
+            messageEnd = messageStart + self.contentLength
+            self.start = messageEnd
+            self.contentLength = None
+            with memoryview(self.data) as view:
+                with view[messageStart:messageEnd] as message:
+                    yield message
+
+        #reset to the start of the buffer whenever it's emptied, so it rarely has to be compacted
+        #and let go of the memory used by any very large messages
+        if self.start == self.end:
+            self.start = 0
+            self.end = 0
+            if len(self.data) > maximumReadSize * 2:
+                self.data = bytearray(minimumReadSize * 2)
+
+
+#************************************************************
+#outbound queue
+
+#maximum number of buffers written by a single sendmsg call
+maximumBuffersPerSend = 64
+
+#per-connection queue of messages waiting to be written to a non-blocking socket
+#messages are queued as a header and a payload, so the same encoded payload can be queued for several peers
+#without copying it, and flush writes as many queued buffers as the socket will take with a single sendmsg
+#
+#the queue is congested once more than highWatermark bytes are waiting, and stays congested until
+#it drains to lowWatermark bytes, so callers can hold back optional traffic from peers that can't keep up
+class OutboundQueue:
+    def __init__(self, highWatermark, lowWatermark):
+        self.buffers = deque()
+        #bytes of the first buffer that have already been sent
+        self.offset = 0
+        self.queuedBytes = 0
+        self.highWatermark = highWatermark
+        self.lowWatermark = lowWatermark
+        self.congested = False
+
+    def isEmpty(self):
+        return len(self.buffers) == 0
+
+    #queues an encoded message
+    #the message's header can be passed in if it has already been built (e.g. for a message queued for several peers)
+    def enqueue(self, payload, header = None):
+        if header == None:
+            header = contentLengthHeader(payload)
+        self.buffers.append(header)
+        self.buffers.append(payload)
+        self.queuedBytes += len(header) + len(payload)
+        if self.queuedBytes > self.highWatermark:
+            self.congested = True
+
+    #writes queued messages until the queue is empty or the socket can't take any more
+    #returns True if the queue was emptied, socket errors (other than the socket being full) are raised to the caller
+    def flush(self, connection):
+        while len(self.buffers) > 0:
+            buffers = [self.buffers[i] for i in range(min(len(self.buffers), maximumBuffersPerSend))]
+            buffers[0] = memoryview(buffers[0])[self.offset:]
+            try:
+                if hasattr(connection, 'sendmsg'):
+                    sent = connection.sendmsg(buffers)
+                else:
+                    sent = connection.send(buffers[0])
+            except (BlockingIOError, socket.timeout):
+                break
+            self.consume(sent)
+
+        if self.queuedBytes <= self.lowWatermark:
+            self.congested = False
+        return len(self.buffers) == 0
+
+    #removes every queued buffer, for writing somewhere else (used by the asyncio engine, see PeerProtocol)
+    #congestion is then tracked by whatever the buffers were handed to
+    def takeAll(self):
+        buffers = list(self.buffers)
+        if self.offset > 0:
+            buffers[0] = memoryview(buffers[0])[self.offset:]
+        self.buffers.clear()
+        self.offset = 0
+        self.queuedBytes = 0
+        return buffers
+
+    #removes sent bytes from the front of the queue
+    def consume(self, sent):
+        self.queuedBytes -= sent
+        while sent > 0:
+            remaining = len(self.buffers[0]) - self.offset
+            if sent < remaining:
+                self.offset += sent
+                return
+            sent -= remaining
+            self.buffers.popleft()
+            self.offset = 0
 
 
 #************************************************************
 #network IO helpers
 
-#reads a fixed block of data from a peer's connection and adds any complete messages to the message queue
+#reads a block of data from a peer's connection and adds any complete messages to the message queue
 #not guaranteed to read a complete message - may need multiple invocations to build up the full message
+#if provided, decodeFrame(networkEntry, message) is applied to each message (in the order they were read) before it is queued
+#it is passed a memoryview into the receive buffer, and must copy anything it wants to keep
+#it returns the decoded message and anything it kept from the frame (queued alongside the message), or None to drop the message
 #returns True if an error occurred during the read attempt, False otherwise
-def continueRead(networkEntry, messageQueue):
-    headerSize = struct.calcsize('!l')
+def continueRead(networkEntry, messageQueue, decodeFrame = None):
+    if receiveBlock(networkEntry):
+        return True
+    queueMessages(networkEntry, messageQueue, decodeFrame)
+    return False
+
+
+#reads a block of data from a peer's connection, like continueRead, but returns the complete messages instead of queueing them
+#messages are copied out of the receive buffer as bytes, in the order they were read
+#returns None if an error occurred during the read attempt
+def readFrames(networkEntry):
+    if receiveBlock(networkEntry):
+        return None
+    return [bytes(frame) for frame in networkEntry['buffer'].messages()]
 
+
+#reads whatever is available from a peer's connection into its receive buffer
+#returns True if an error occurred during the read attempt, False otherwise
+def receiveBlock(networkEntry):
     try:
-        data = networkEntry['connection'].recv(2048)
+        received = networkEntry['buffer'].receive(networkEntry['connection'])
     except socket.error as err:
 
         #nothing in socket currently available to read (nonblocking socket)
@@ -51,36 +249,26 @@ def continueRead(networkEntry, messageQueue):
             print('[ERR] Error reading from', networkEntry['connection'], err)
             return True
 
-    if not data or len(data) == 0:
-        return True
-    
-    networkEntry['buffer'] += data
-    
-    #handle complete messages until no FULLY COMPLETE messages remain
-    #partial messages may still be in the buffer
-    while True:
-        if networkEntry['contentLength'] == None:
-            #if we have read enough data to know the message length, extract it
-            if len(networkEntry['buffer']) >= headerSize:
-                networkEntry['contentLength'] = struct.unpack('!l', networkEntry['buffer'][:headerSize])[0]
-                networkEntry['buffer'] = networkEntry['buffer'][headerSize:]
-            #if haven't received enough data to know the message length, return
-            else:
-                return False
-
-        #read complete message and remove it from the buffer if possible
-        if networkEntry['contentLength'] != None and (len(networkEntry['buffer']) >= networkEntry['contentLength']):
-            message = networkEntry['buffer'][:networkEntry['contentLength']]
-            networkEntry['buffer'] = networkEntry['buffer'][networkEntry['contentLength']:]
-            networkEntry['contentLength'] = None
-
-            #associate message with sender
-            messageWithPeer = (networkEntry, message, False)
-            messageQueue.put(messageWithPeer)
-
-        #if no complete messages are present, return
+    return received == 0
+
+
+#adds the complete messages in a peer's receive buffer to the message queue, partial messages stay in the buffer
+#see continueRead for decodeFrame
+def queueMessages(networkEntry, messageQueue, decodeFrame = None):
+    for frame in networkEntry['buffer'].messages():
+        networkEntry['statistics']['received'] += 1
+        if decodeFrame != None:
+            decoded = decodeFrame(networkEntry, frame)
+            if decoded == None:
+                continue
+            message, keptFrame = decoded
         else:
-            return False
+            message = bytes(frame)
+            keptFrame = None
+
+        #associate message with sender
+        messageWithPeer = (networkEntry, message, keptFrame)
+        messageQueue.put(messageWithPeer)
 
 
 #read helper used for communication with registry server
@@ -133,16 +321,92 @@ def silentFailureClose(connection):
 
 #builds dictionary representing a p2p network connection. Contains:
 #a socket and its associated lock
-#the current data that has been read from the socket
-#the header-indicated length of the current message
-def buildNetworkEntry(connection):
+#the data that has been read from the socket but not yet handled (see ReceiveBuffer)
+#the messages waiting to be written to the socket (see OutboundQueue)
+#the asyncio transport that owns the socket, if the asyncio engine is enabled (see PeerProtocol)
+#the per-link clock encoding state (see shared/delta_clock.py), set once the link has negotiated delta clocks
+#the per-link process id encoding state (see shared/process_ids.py), set once the link has negotiated interned process ids
+#the codec broadcasts are sent with (see shared/codec.py), set once the link has negotiated the binary codec (json otherwise)
+#the optional protocol features both ends of the link support, once negotiated
+#the link's place in the broadcast tree (see shared/plumtree.py), set once the link has negotiated plumtree (flooded otherwise)
+#the process id of the peer, once known from its HELLO/HELLO_RESPONSE
+#statistics about the link: when it connected, and how many messages have been queued for and received from the peer
+#the link's impairment state (see shared/impairment.py), set once the first broadcast arrives if network impairment is enabled
+def buildNetworkEntry(connection, highWatermark = 4194304, lowWatermark = 1048576):
     return {
         'connection': connection,
-        'contentLength': None,
-        'buffer': b'',
-        'lock': Lock()
+        'processId': None,
+        'buffer': ReceiveBuffer(),
+        'outbound': OutboundQueue(highWatermark, lowWatermark),
+        'transport': None,
+        'lock': Lock(),
+        'clockEncoder': None,
+        'clockDecoder': None,
+        'idEncoder': None,
+        'idDecoder': None,
+        'codec': None,
+        'features': set(),
+        'treeLink': None,
+        'statistics': {'connected': time.monotonic(), 'sent': 0, 'received': 0},
+        'impairment': None
     }
-        
+
+
+#************************************************************
+#asyncio engine
+
+#protocol for a p2p connection owned by an asyncio event loop, used instead of the read workers and
+#OutboundQueue.flush when the asyncio engine is enabled
+#reads go straight into the connection's ReceiveBuffer (asyncio calls get_buffer, reads into it, then calls buffer_updated),
+#and complete messages are decoded and queued exactly as continueRead does
+#writes are handed over from the OutboundQueue by the event loop, and the transport's write buffer limits are set to the
+#queue's watermarks, so the queue is marked as congested while the transport has paused writing
+#onConnectionLost(networkEntry) is called from the event loop once the connection closes or fails
+class PeerProtocol(asyncio.BufferedProtocol):
+    def __init__(self, networkEntry, messageQueue, decodeFrame, onConnectionLost):
+        self.networkEntry = networkEntry
+        self.messageQueue = messageQueue
+        self.decodeFrame = decodeFrame
+        self.onConnectionLost = onConnectionLost
+        self.readView = None
+        self.writingPaused = False
+
+    def connection_made(self, transport):
+        outbound = self.networkEntry['outbound']
+        transport.set_write_buffer_limits(outbound.highWatermark, outbound.lowWatermark)
+        self.networkEntry['transport'] = transport
+
+    def get_buffer(self, sizeHint):
+        #a failed read doesn't call buffer_updated, so the previous view may still be held
+        self.releaseReadView()
+        self.readView = self.networkEntry['buffer'].readBuffer()
+        return self.readView
+
+    def buffer_updated(self, received):
+        self.releaseReadView()
+        with self.networkEntry['lock']:
+            self.networkEntry['buffer'].commitRead(received)
+            queueMessages(self.networkEntry, self.messageQueue, self.decodeFrame)
+
+    #the buffer can't grow while a view into it exists
+    def releaseReadView(self):
+        if self.readView != None:
+            self.readView.release()
+            self.readView = None
+
+    #only called while the event loop is writing to the transport, which it does while holding the link's lock
+    def pause_writing(self):
+        self.writingPaused = True
+        self.networkEntry['outbound'].congested = True
+
+    def resume_writing(self):
+        self.writingPaused = False
+        self.networkEntry['outbound'].congested = False
+
+    def connection_lost(self, exc):
+        self.releaseReadView()
+        self.onConnectionLost(self.networkEntry)
+
 '''
 Bibliography
 [1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
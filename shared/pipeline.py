@@ -0,0 +1,135 @@
+from queue import SimpleQueue, Empty
+from collections import deque
+from threading import Lock
+import time
+
+#Staged message pipeline
+#
+#Messages pass through four stages, each served by its own threads and connected by queues:
+#
+#- parse: read workers decode frames and drop duplicate broadcasts (see decodeFrame), in parallel, one link at a time
+#- handle: handler workers handle control messages and pass broadcasts on to be relayed and delivered, in parallel
+#- deliver: a single delivery worker owns causal delivery, and stamps our own messages with our clock
+#- send: broadcast workers encode messages and queue them for peers, in parallel
+#
+#Every handler thread used to take vectorClockLock to deliver a broadcast, so delivery was serialised behind the lock
+#and the extra handler threads only contended for it, as did broadcast workers stamping our own messages. With a
+#single owner, the lock is only taken on the message path by one thread, once per batch of messages, and otherwise only
+#by rarely sent control messages (HELLO, departures, state transfers) and snapshots. Our own messages are stamped by
+#the delivery worker between batches, so sending never waits for the handler threads.
+#
+#The queues are queue.SimpleQueue, which is implemented in C without the Python level lock and condition variables of
+#queue.Queue. Each stage records how deep its queue is and how long it takes to service each message.
+#
+#Workers wait on their stage's queue indefinitely, and are stopped by queueing a stopWorker sentinel for each of them
+#(see PipelineStage.stop), which they take after everything that was queued before it.
+
+#number of recent service times kept per stage for percentiles
+serviceTimeSamples = 4096
+
+#queued to stop a stage's worker
+stopWorker = object()
+
+class PipelineStage:
+    #queued is False for a stage that is fed straight from sockets instead of a queue (the parse stage)
+    def __init__(self, name, queued = True):
+        self.name = name
+        self.queue = SimpleQueue() if queued else None
+        self.lock = Lock()
+        self.handled = 0
+        #total time (in seconds) spent servicing messages
+        self.busy = 0
+        #per message service times (in seconds) of the most recent batches
+        self.serviceTimes = deque(maxlen=serviceTimeSamples)
+        self.maxDepth = 0
+
+    def put(self, item):
+        self.queue.put(item)
+
+    #waits for the next item
+    def get(self):
+        return self.queue.get()
+
+    #waits for an item, then takes up to limit items that are already queued without waiting
+    #a batch stops at a stopWorker sentinel, which is then its last item
+    def getBatch(self, limit):
+        batch = [self.queue.get()]
+        try:
+            while len(batch) < limit and batch[-1] is not stopWorker:
+                batch.append(self.queue.get_nowait())
+        except Empty:
+            pass
+        return batch
+
+    #stops the stage's workers, once they have taken everything queued before now
+    def stop(self, workers):
+        for i in range(workers):
+            self.queue.put(stopWorker)
+
+    def depth(self):
+        return 0 if self.queue == None else self.queue.qsize()
+
+    #records that count messages were serviced, starting at started (a time.perf_counter() value)
+    def serviced(self, started, count = 1):
+        elapsed = time.perf_counter() - started
+        depth = self.depth()
+        with self.lock:
+            self.handled += count
+            self.busy += elapsed
+            self.serviceTimes.append(elapsed / count)
+            self.maxDepth = max(self.maxDepth, depth)
+
+    #returns the given percentile (0-100) of recent per message service times in seconds, or None if nothing was serviced
+    def serviceTimePercentile(self, percentile):
+        with self.lock:
+            serviceTimes = sorted(self.serviceTimes)
+        if len(serviceTimes) == 0:
+            return None
+        return serviceTimes[min(len(serviceTimes) - 1, int(len(serviceTimes) * percentile / 100))]
+
+    #returns a one line summary of the stage
+    def report(self):
+        queued = '' if self.queue == None else ', {0} queued (max {1})'.format(self.depth(), self.maxDepth)
+        if self.handled == 0:
+            return '{0}: nothing serviced{1}'.format(self.name, queued)
+        return '{0}: {1} serviced, {2:.1f}us mean, p50 {3:.1f}us, p99 {4:.1f}us{5}'.format(
+            self.name, self.handled, self.busy / self.handled * 1e6, self.serviceTimePercentile(50) * 1e6,
+            self.serviceTimePercentile(99) * 1e6, queued)
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
@@ -0,0 +1,129 @@
+from threading import Lock
+import time
+
+#Epidemic broadcast trees (Plumtree, Leitao et al.)
+#
+#Flooding sends every broadcast over every link, so each process receives a copy from each of its peers. On links
+#where both peers advertise the feature in HELLO/HELLO_RESPONSE, broadcasts are instead pushed along a spanning tree
+#that builds and repairs itself:
+#
+#- every link starts out eager (in the tree), and broadcasts are pushed over eager links as they are today
+#- a process that receives a copy of a broadcast it already has over an eager link makes the link lazy, and sends
+#  a PRUNE so the peer does the same
+#- broadcasts aren't pushed over lazy links, their [sender, seq] ids are announced in periodic IHAVEs instead
+#- a process that is announced a broadcast it doesn't receive within the graft timeout sends a GRAFT to the
+#  announcing peer, which makes the link eager at both ends (repairing the tree) and has the peer send the broadcast
+#
+#Every link still carries either the broadcast or its id, so a process learns of every broadcast from every peer, as
+#with flooding, and the reliability guarantee is unchanged as long as announced broadcasts are kept until they can
+#no longer be grafted. Grafts are served from the retained log (see shared/anti_entropy.py).
+
+#************************************************************
+#per-link state
+
+class PlumtreeLink:
+    def __init__(self):
+        #whether broadcasts are pushed over the link (it's in the tree), or only announced
+        self.eager = True
+        #[sender, seq] ids of broadcasts to announce in the next IHAVE
+        self.announcements = []
+
+
+#************************************************************
+#node-wide state
+
+class PlumtreeState:
+    def __init__(self, graftTimeout):
+        self.graftTimeout = graftTimeout
+        #(sender, seq) --> [graft deadline, links that announced it], broadcasts we have been announced but haven't received
+        self.missing = {}
+        self.lock = Lock()
+        #ids announced to lazy links, ids grafted, and links pruned by this process
+        self.statistics = {'announced': 0, 'grafted': 0, 'pruned': 0}
+
+    #records that link announced a broadcast we haven't received
+    def announced(self, sender, sequence, link):
+        with self.lock:
+            entry = self.missing.get((sender, sequence), None)
+            if entry == None:
+                self.missing[(sender, sequence)] = [time.monotonic() + self.graftTimeout, [link]]
+            elif not any(announcer is link for announcer in entry[1]):
+                entry[1].append(link)
+
+    #records that a broadcast has been received, so it no longer needs to be grafted
+    def received(self, sender, sequence):
+        if len(self.missing) == 0:
+            return
+        with self.lock:
+            self.missing.pop((sender, sequence), None)
+
+    #returns [link, [[sender, seq], ...]] for each link that missing broadcasts should be grafted from
+    #each broadcast is grafted from the first live link that announced it, and from the next one if it still
+    #hasn't arrived after another graft timeout
+    #isLive(link) tells if a link is still connected, and isReceived(sender, seq) if a broadcast has arrived since
+    def dueGrafts(self, isLive, isReceived):
+        now = time.monotonic()
+        grafts = {}
+        with self.lock:
+            for broadcastId, entry in list(self.missing.items()):
+                deadline, announcers = entry
+                if deadline > now:
+                    continue
+                while len(announcers) > 0 and not isLive(announcers[0]):
+                    announcers.pop(0)
+                if len(announcers) == 0 or isReceived(*broadcastId):
+                    del self.missing[broadcastId]
+                    continue
+                link = announcers.pop(0)
+                grafts.setdefault(id(link), [link, []])[1].append(list(broadcastId))
+                entry[0] = now + self.graftTimeout
+        return list(grafts.values())
+
+    #drops the missing broadcasts of a retired process
+    def forget(self, sender):
+        with self.lock:
+            for broadcastId in [broadcastId for broadcastId in self.missing if broadcastId[0] == sender]:
+                del self.missing[broadcastId]
+
+    #number of broadcasts announced but not received
+    def size(self):
+        with self.lock:
+            return len(self.missing)
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
@@ -0,0 +1,154 @@
+from threading import Lock
+import sys
+
+#Session-scoped process id interning
+#
+#Clock entries and senders are identified by 36 character uuids. On links where both peers advertise the
+#feature in HELLO/HELLO_RESPONSE, broadcasts are sent with each uuid replaced by a small integer instead.
+#Every process numbers the uuids it knows about in the order it first sees them, and sends the
+#(integer, uuid) pair for a number the first time a message on a link uses that number ('processIds'), so each
+#uuid crosses each link once per session, and only if it appears on the link. The receiver keeps the pairs for
+#the link and restores the uuids. Retired processes are dropped from the numbering.
+#
+#Like delta clocks, this relies on both ends seeing the link's messages in the same order.
+#
+#Restored uuids are interned (sys.intern), so every clock holds the same string object for a process,
+#and clock lookups can match on identity rather than comparing strings.
+
+#************************************************************
+#process id table
+
+#node-wide uuid <--> integer mapping
+#numbers aren't reused once a retired process is forgotten, so a peer never has a stale meaning for one
+class ProcessIdTable:
+    def __init__(self):
+        self.ids = {}
+        #integer --> uuid, for the processes that haven't been forgotten
+        self.uuids = {}
+        self.nextNumber = 0
+        #counts forget calls, so encoders can tell when to drop the numbers they have announced for forgotten processes
+        self.forgotten = 0
+        self.lock = Lock()
+
+    #returns the integer for uuid, numbering it if it hasn't been seen before
+    def intern(self, uuid):
+        processNumber = self.ids.get(uuid, None)
+        if processNumber != None:
+            return processNumber
+        with self.lock:
+            processNumber = self.ids.get(uuid, None)
+            if processNumber == None:
+                processNumber = self.nextNumber
+                self.nextNumber += 1
+                self.uuids[processNumber] = uuid
+                self.ids[uuid] = processNumber
+            return processNumber
+
+    #drops a retired process, if it comes back it is given a new number
+    def forget(self, uuid):
+        with self.lock:
+            processNumber = self.ids.pop(uuid, None)
+            if processNumber != None:
+                del self.uuids[processNumber]
+                self.forgotten += 1
+
+
+#************************************************************
+#per-link process id encoders
+
+#sender side state for a single link
+class ProcessIdEncoder:
+    def __init__(self, table):
+        self.table = table
+        #numbers that have already been sent on this link
+        self.announced = set()
+        self.forgotten = 0
+
+    #returns the integer for uuid, adding the (integer, uuid) pair to announcements if the peer hasn't been sent it yet
+    def internProcess(self, uuid, announcements):
+        processNumber = self.table.intern(uuid)
+        if processNumber not in self.announced:
+            self.announced.add(processNumber)
+            announcements.append([processNumber, uuid])
+        return processNumber
+
+    #returns a copy of a broadcast message with its sender and clock entries replaced by integers
+    #along with the (integer, uuid) pairs it uses that the peer hasn't been sent yet
+    def encodeMessage(self, message):
+        if self.table.forgotten != self.forgotten:
+            self.forgotten = self.table.forgotten
+            with self.table.lock:
+                self.announced.intersection_update(self.table.uuids.keys())
+
+        announcements = []
+        encodedMessage = dict(message)
+        encodedMessage['sender'] = self.internProcess(message['sender'], announcements)
+        for clockField in ['clock', 'clockDelta']:
+            if clockField in encodedMessage:
+                encodedMessage[clockField] = [[self.internProcess(uuid, announcements), counter] for uuid, counter in encodedMessage[clockField]]
+        if len(announcements) > 0:
+            encodedMessage['processIds'] = announcements
+        return encodedMessage
+
+
+#receiver side state for a single link
+class ProcessIdDecoder:
+    def __init__(self):
+        #the peer's integer --> uuid
+        self.uuids = {}
+
+    def restoreClock(self, clock):
+        return [[self.uuids[processNumber], counter] for processNumber, counter in clock]
+
+    #restores the uuids in a broadcast message encoded by the peer's ProcessIdEncoder
+    #returns None if the message uses a number the peer hasn't sent us
+    def decodeMessage(self, message):
+        for processNumber, uuid in message.pop('processIds', []):
+            self.uuids[processNumber] = sys.intern(uuid)
+        try:
+            message['sender'] = self.uuids[message['sender']]
+            for clockField in ['clock', 'clockDelta']:
+                if clockField in message:
+                    message[clockField] = self.restoreClock(message[clockField])
+        except KeyError:
+            print('[ERR] Received message with an unknown process number')
+            return None
+        return message
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
@@ -0,0 +1,177 @@
+from threading import Lock
+import time
+
+#Chunked state transfer for joining processes
+#
+#A joining process clones the state of the first peer that answers its HELLO. Sent in a single HELLO_RESPONSE, the
+#peer's undelivered messages could make for a frame of many megabytes, that had to be encoded and parsed in one go.
+#On links where both peers advertise the feature in HELLO/HELLO_RESPONSE, the HELLO_RESPONSE is instead a snapshot
+#(the clock, retired processes and departures) followed by STATE_CHUNKs of the undelivered messages, each around
+#chunkBytes long:
+#
+#- the joining process initialises from the snapshot, and adds each chunk's messages to its causal buffer as it
+#  arrives, so delivery starts before the transfer completes
+#- flow control is credit based: the joining process acknowledges how many chunks it has handled (STATE_ACK), and the
+#  peer keeps at most window chunks in flight. Nothing is streamed until the first acknowledgement, so the peers
+#  whose HELLO_RESPONSE wasn't used never send their chunks
+#- if the connection to the peer fails before the transfer completes, the joining process asks another peer to
+#  resume it (STATE_REQUEST, with its clock), which sends the messages it holds or has retained that the clock
+#  doesn't cover (a failed connection is treated as its process leaving, so the same peer can't be reconnected to)
+
+#time (in seconds) a transfer is kept without being acknowledged, before it is abandoned
+transferTimeout = 60
+
+#returns the approximate encoded size of a broadcast, used to split transfers into chunks without encoding them twice
+def estimatedSize(message):
+    return 160 + len(message.get('text', '')) + 48 * len(message.get('clock', []))
+
+
+#************************************************************
+#sending side
+
+#splits messages into chunks of around chunkBytes each
+def splitIntoChunks(messages, chunkBytes):
+    chunks = []
+    chunk = []
+    chunkSize = 0
+    for message in messages:
+        size = estimatedSize(message)
+        if len(chunk) > 0 and chunkSize + size > chunkBytes:
+            chunks.append(chunk)
+            chunk = []
+            chunkSize = 0
+        chunk.append(message)
+        chunkSize += size
+    if len(chunk) > 0:
+        chunks.append(chunk)
+    return chunks
+
+
+class TransferSender:
+    def __init__(self, chunkBytes, window):
+        self.chunkBytes = chunkBytes
+        self.window = window
+        #transfer id --> [chunks, number of chunks sent, number acknowledged, time of last acknowledgement]
+        self.transfers = {}
+        self.lock = Lock()
+
+    #starts a transfer of messages, returning its number of chunks
+    def start(self, transferId, messages):
+        chunks = splitIntoChunks(messages, self.chunkBytes)
+        now = time.monotonic()
+        with self.lock:
+            for expiredId in [expiredId for expiredId, transfer in self.transfers.items() if now - transfer[3] > transferTimeout]:
+                del self.transfers[expiredId]
+            if len(chunks) > 0:
+                self.transfers[transferId] = [chunks, 0, 0, now]
+        return len(chunks)
+
+    #records that the receiver has handled received chunks
+    #returns the transfer's number of chunks, and the (index, messages) chunks that can now be sent
+    def acknowledge(self, transferId, received):
+        with self.lock:
+            transfer = self.transfers.get(transferId, None)
+            if transfer == None:
+                return (0, [])
+            chunks = transfer[0]
+            transfer[2] = max(transfer[2], received)
+            transfer[3] = time.monotonic()
+            if transfer[2] >= len(chunks):
+                del self.transfers[transferId]
+                return (len(chunks), [])
+            first = transfer[1]
+            transfer[1] = max(first, min(len(chunks), transfer[2] + self.window))
+            return (len(chunks), [(index, chunks[index]) for index in range(first, transfer[1])])
+
+    #number of transfers in progress
+    def size(self):
+        with self.lock:
+            return len(self.transfers)
+
+
+#************************************************************
+#receiving side
+
+#the transfer a joining process is receiving, if any
+class TransferReceiver:
+    def __init__(self):
+        #transfer id, the link it arrives on, number of chunks, chunks handled, or None while no transfer is in progress
+        self.transfer = None
+        self.lock = Lock()
+        #when we said HELLO, initialised from a snapshot, and finished the transfer, with the chunks and messages received
+        self.statistics = {'helloSent': None, 'initialised': None, 'completed': None, 'chunks': 0, 'messages': 0, 'resumed': 0}
+
+    #records that we initialised from a snapshot, and starts receiving its transfer of chunks over link
+    def start(self, transferId, link, chunks):
+        with self.lock:
+            self.statistics['initialised'] = time.monotonic()
+            self.transfer = [transferId, link, chunks, 0] if chunks > 0 else None
+            if chunks == 0:
+                self.statistics['completed'] = self.statistics['initialised']
+
+    #records a chunk (one of chunks) as handled, returning the number of chunks handled so far, or None if it isn't
+    #part of the transfer in progress
+    def chunkHandled(self, transferId, chunks, messages):
+        with self.lock:
+            if self.transfer == None or self.transfer[0] != transferId:
+                return None
+            #a resumed transfer's size isn't known until its first chunk arrives
+            if self.transfer[2] == None:
+                self.transfer[2] = chunks
+            self.transfer[3] += 1
+            self.statistics['chunks'] += 1
+            self.statistics['messages'] += messages
+            received = self.transfer[3]
+            if received >= self.transfer[2]:
+                self.transfer = None
+                self.statistics['completed'] = time.monotonic()
+            return received
+
+    #returns True if the transfer in progress is arriving over link
+    def isArrivingOver(self, link):
+        with self.lock:
+            return self.transfer != None and self.transfer[1] is link
+
+    #moves the transfer in progress to a new id and link, after the link it was arriving over failed
+    def resume(self, transferId, link):
+        with self.lock:
+            self.transfer = [transferId, link, None, 0]
+            self.statistics['resumed'] += 1
+
+'''
+Bibliography
+[1] N. Meghanathan. Module 6.2.3 Matrix Algorithm Causal Delivery of Messages. (Nov. 12, 2013). Accessed: Mar. 13, 2024. [Online video]. Available: https://www.youtube.com/watch?v=WgTx7BHWzts.
+[2] T. Landes. "Dynamic Vector Clocks for Consistent Ordering of Events in Dynamic Distributed Applications." in International Conference on Parallel and Distributed Processing Techniques and Applications, Las Vegas, Nevada, USA, 2006, pp.1-7.
+[3] L. Lafayette. (2021). The Spartan HPC System at the University of Melbourne [PDF]. Available: https://canvas.lms.unimelb.edu.au/courses/105440/files/7018506/download?download_frd=1.
+[4] L. Dalcin. "Tutorial". MPI for Python. https://mpi4py.readthedocs.io/en/stable/tutorial.html (accessed Mar. 13, 2024).
+[5] Jurudocs. "Format a datetime into a string with milliseconds". Stack Overflow. https://stackoverflow.com/questions/7588511/format-a-datetime-into-a-string-with-milliseconds (accessed Mar. 13, 2024).
+[6] M. Toboggan. "How to get a random number between a float range?". Stack Overflow. https://stackoverflow.com/questions/6088077/how-to-get-a-random-number-between-a-float-range (accessed Mar. 15, 2024).
+[7] NumPy Developers. "numpy.zeros". NumPy. https://numpy.org/doc/stable/reference/generated/numpy.zeros.html (accessed Mar. 16, 2024).
+[8] New York University. "Non-blocking Communication". GitHub Pages. https://nyu-cds.github.io/python-mpi/03-nonblocking/ (accessed Mar. 24, 2024).
+[9] L. Dalcin. "mpi4py.MPI.Message". MPI for Python. https://mpi4py.readthedocs.io/en/stable/reference/mpi4py.MPI.Message.html (accessed Mar. 30, 2024).
+[10] W3Schools. "Python String split() Method". W3Schools. https://www.w3schools.com/python/ref_string_split.asp (accessed Mar. 30, 2024).
+[11] C. Kolade. "Python Switch Statement - Switch Case Example". freeCodeCamp. https://www.freecodecamp.org/news/python-switch-statement-switch-case-example/ (accessed Mar. 30, 2024).
+[12] spiderman. "How to find string that start with one letter then numbers". FME Community. https://community.safe.com/general-10/how-to-find-string-that-start-with-one-letter-then-numbers-23880?tid=23880&fid=10 (accessed Mar. 30, 2024).
+[13] TutorialsTeacher. "Grouping in Regex". TutorialsTeacher. https://www.tutorialsteacher.com/regex/grouping (accessed Mar. 30, 2024).
+[14] hoju. "Extract part of a regex match". Stack Overflow. https://stackoverflow.com/questions/1327369/extract-part-of-a-regex-match (accessed Mar. 30, 2024).
+[15] M. Breuss. "How to Check if a Python String Contains a Substring". Real Python. https://realpython.com/python-string-contains-substring/ (accessed Mar. 30, 2024).
+[16] Python Principles. "How to convert a string to int in Python". Python Principles. https://pythonprinciples.com/blog/python-convert-string-to-int/ (accessed Mar. 30, 2024).
+[17] TransparenTech LLC. "Generate a UUID in Python". UUID Generator. https://www.uuidgenerator.net/dev-corner/python/ (accessed Mar. 30, 2024).
+[18] W3Schools. "Python - List Comprehension". W3Schools. https://www.w3schools.com/python/python_lists_comprehension.asp (accessed Mar. 30, 2024).
+[19] greye. "Get loop count inside a for-loop [duplicate]". Stack Overflow. https://stackoverflow.com/questions/3162271/get-loop-count-inside-a-for-loop (accessed Mar. 30, 2024).
+[20] G. Ramuglia. "Using Bash to Count Lines in a File: A File Handling Tutorial". I/O Flood. https://ioflood.com/blog/bash-count-lines/ (accessed Mar. 30, 2024).
+[21] H. Sundaray. "How to Use Bash Getopts With Examples". KodeKloud. https://kodekloud.com/blog/bash-getopts/ (accessed Mar. 30, 2024).
+[22] Linuxize. "Bash Functions". Linuxize. https://linuxize.com/post/bash-functions/ (accessed Mar. 30, 2024).
+[23] Nick. "How can I add numbers in a Bash script?". Stack Overflow. https://stackoverflow.com/questions/6348902/how-can-i-add-numbers-in-a-bash-script (accessed Mar. 30, 2024).
+[24] GeeksForGeeks. "Command Line Arguments in Python". GeeksForGeeks. https://www.geeksforgeeks.org/command-line-arguments-in-python/ (accessed Mar. 30, 2024).
+[25] V. Hule. "Generate Random Float numbers in Python using random() and Uniform()". PYnative. https://pynative.com/python-get-random-float-numbers/ (accessed Apr. 1, 2024).
+[26] bhaskarc. "Iterating over a 2 dimensional python list [duplicate]". Stack Overflow. https://stackoverflow.com/questions/16548668/iterating-over-a-2-dimensional-python-list (accessed Apr. 1, 2024).
+[27] note.nkmk.me. "How to return multiple values from a function in Python". note.nkmk.me. https://note.nkmk.me/en/python-function-return-multiple-values/ (accessed Apr. 2, 2024).
+[28] A. Luiz. "How do you extract a column from a multi-dimensional array?". Stack Overflow. https://stackoverflow.com/questions/903853/how-do-you-extract-a-column-from-a-multi-dimensional-array (accessed Apr. 2, 2024).
+[29] W3Schools. "Python Remove Array Item". W3Schools. https://www.w3schools.com/python/gloss_python_array_remove.asp (accessed Apr. 2, 2024).
+[30] nobody. "Python regular expressions return true/false". Stack Overflow. https://stackoverflow.com/questions/6576962/python-regular-expressions-return-true-false (accessed May. 6, 2024).
+[31] A. Jalli. "Python Switch Case -- Comprehensive Guide". Medium. https://medium.com/@artturi-jalli/python-switch-case-9cd0014759e4 (accessed May. 4, 2024).
+[32] Linuxize. "Bash if..else Statement". Linuxize. https://stackoverflow.com/questions/67428689/how-to-pass-multiple-flag-and-multiple-arguments-in-getopts-in-shell-script (accessed May. 4, 2024).
+[33] Kivy. "Kivy: The Open Source Python App Development Framework.". Kivy. https://kivy.org/ (accessed May. 4, 2024).
+[34] R. Strahl. "Getting Images into Markdown Documents and Weblog Posts with Markdown Monster". Medium. https://medium.com/markdown-monster-blog/getting-images-into-markdown-documents-and-weblog-posts-with-markdown-monster-9ec6f353d8ec (accessed May. 5, 2024).
+'''
@@ -1,41 +1,177 @@
+from enum import IntEnum
+from collections import deque
+import time
+
+#numpy is optional, and only used to check large batches of held messages at once (see CausalBuffer.addBatch)
+#without it, every message is checked individually
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#************************************************************
+#clock comparison results
+class ClockOrdering(IntEnum):
+    EQUAL = 0
+    BEFORE = 1
+    AFTER = 2
+    CONCURRENT = 3
+
+#************************************************************
+#dynamic vector clock
+
+#vector clock whose set of processes can grow (and shrink) at runtime
+#entries are kept as [uuid, counter] pairs (the wire format), alongside a uuid --> slot index
+#so lookups and increments are O(1) and merges/comparisons are linear in the clock size
+#
+#processes that have left the network are retired: their entry is removed, and entries for them in
+#other clocks are ignored, so that they aren't re-added by merges or treated as delivery dependencies
+#a retired process that comes back (restarting from a snapshot) is reinstated with the counter it was retired at
+class DynamicVectorClock:
+    #retired is a list of uuids, or of [uuid, counter] pairs (see retiredList)
+    def __init__(self, entries = None, retired = None):
+        self.entries = []
+        self.index = {}
+        #retired uuid --> its counter when it was retired
+        self.retired = {}
+        for uuid in retired or []:
+            if isinstance(uuid, list):
+                self.retired[uuid[0]] = uuid[1]
+            else:
+                self.retire(uuid)
+        if entries != None:
+            self.merge(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, uuid):
+        return uuid in self.index
+
+    def __repr__(self):
+        return repr(self.entries)
+
+    #returns the counter for uuid, processes we haven't seen yet are implicitly 0
+    def get(self, uuid):
+        slot = self.index.get(uuid, None)
+        if slot == None:
+            return 0
+        return self.entries[slot][1]
+
+    #sets the counter for uuid, adding a new entry if the process hasn't been seen before
+    def set(self, uuid, counter):
+        slot = self.index.get(uuid, None)
+        if slot == None:
+            self.index[uuid] = len(self.entries)
+            self.entries.append([uuid, counter])
+        else:
+            self.entries[slot][1] = counter
+
+    def increment(self, uuid):
+        self.set(uuid, self.get(uuid) + 1)
+        return self
+
+    #removes a departed process's entry from the clock
+    #only safe once every live process has delivered all of the departed process's messages
+    def retire(self, uuid):
+        self.retired[uuid] = self.get(uuid)
+        slot = self.index.pop(uuid, None)
+        if slot == None:
+            return
+        self.entries.pop(slot)
+        for laterSlot in range(slot, len(self.entries)):
+            self.index[self.entries[laterSlot][0]] = laterSlot
+
+    def isRetired(self, uuid):
+        return uuid in self.retired
+
+    #returns the counter a retired process was retired at, or None if it isn't retired
+    def retiredSequence(self, uuid):
+        return self.retired.get(uuid, None)
+
+    #adds a retired process's entry back, at counter or the counter it was retired at (whichever is higher)
+    def reinstate(self, uuid, counter = 0):
+        self.set(uuid, max(self.retired.pop(uuid, 0), counter, self.get(uuid)))
+
+    #[uuid, counter] pairs of the retired processes, with the counters they were retired at
+    def retiredList(self):
+        return [[uuid, counter] for uuid, counter in self.retired.items()]
+
+    #pairwise max with another clock (either a DynamicVectorClock or a list of [uuid, counter] pairs)
+    #entries we haven't seen before are appended
+    def merge(self, other):
+        otherEntries = other.entries if isinstance(other, DynamicVectorClock) else other
+        for uuid, counter in otherEntries:
+            slot = self.index.get(uuid, None)
+            if slot == None:
+                if uuid in self.retired:
+                    continue
+                self.index[uuid] = len(self.entries)
+                self.entries.append([uuid, counter])
+            elif counter > self.entries[slot][1]:
+                self.entries[slot][1] = counter
+        return self
+
+    #compares against another clock (either a DynamicVectorClock or a list of [uuid, counter] pairs)
+    #missing entries are treated as 0
+    def compare(self, other):
+        if not isinstance(other, DynamicVectorClock):
+            other = DynamicVectorClock(other)
+
+        anyLess = False
+        anyGreater = False
+        for uuid, counter in self.entries:
+            otherCounter = other.get(uuid)
+            anyLess = anyLess or counter < otherCounter
+            anyGreater = anyGreater or counter > otherCounter
+        for uuid, counter in other.entries:
+            if uuid not in self.index and counter > 0:
+                anyLess = True
+
+        if anyLess and anyGreater:
+            return ClockOrdering.CONCURRENT
+        if anyLess:
+            return ClockOrdering.BEFORE
+        if anyGreater:
+            return ClockOrdering.AFTER
+        return ClockOrdering.EQUAL
+
+    #causal delivery condition for a message stamped with messageClock by senderUuid:
+    #the sender's entry must be exactly one more than ours (if we haven't seen the sender, the message must be their first)
+    #and every other entry must be <= ours (entries for retired processes are already satisfied)
+    #single pass over the message clock, each lookup into our clock is O(1)
+    def canDeliver(self, messageClock, senderUuid):
+        senderIndexValid = False
+        for uuid, counter in messageClock:
+            if uuid == senderUuid:
+                senderIndexValid = counter == self.get(uuid) + 1
+            elif counter > self.get(uuid) and uuid not in self.retired:
+                return False
+        return senderIndexValid and senderUuid not in self.retired
+
+    #returns the first (uuid, counter) our clock must reach before the message becomes deliverable
+    #or None if the message can be delivered now
+    def missingDependency(self, messageClock, senderUuid):
+        for uuid, counter in messageClock:
+            if uuid == senderUuid:
+                counter -= 1
+            if counter > self.get(uuid) and uuid not in self.retired:
+                return (uuid, counter)
+        return None
+
+    #list of [uuid, counter] pairs, matching the json shape used on the wire
+    def toList(self):
+        return [[uuid, counter] for uuid, counter in self.entries]
+
+
+#************************************************************
+#clock helpers
+
 def incrementVectorClock(processVectorClock, processId):
-    revisedVectorClock = processVectorClock
-    for clock in processVectorClock:
-        if clock[0] == processId:  # Obtain this process's clock within the vector clock (first index)
-            clock[1] += 1           # Increment by 1
-            break                   # Exit the loop
-    return revisedVectorClock
-
-def mergeClocks(processVectorClock, messageVectorClock): 
-    # Create a new process DVC that will mutate based on what it has seen before, or append with the ones it hasn't seen
-    newProcessVectorClock = processVectorClock
-    # For each row in the message DVC
-    for row_m in messageVectorClock:
-        seen_row_m = False                          # Seen message row boolean
-        for row_p in newProcessVectorClock:         # For each row in the process DVC
-            if row_m[0] == row_p[0]:                # If the message's row is a index that the receiver process has seen
-                row_p[1] = max(row_m[1], row_p[1])  # Update row_p in new_process_dvc with max(msg, p)
-                seen_row_m = True                   # The process has seen it now, break off
-                break
-        if not seen_row_m:                          # If the message DVC's row is new to the receiver
-            newProcessVectorClock.append(row_m)     # Add this row to new_process_dvc
-    return newProcessVectorClock
+    return processVectorClock.increment(processId)
 
-def seenSender(processVectorClock, senderUuid):
-    seenSender = False
-    for row_p in processVectorClock:            # Seen message row boolean
-        if row_p[0] == senderUuid:              # If the message's row is a index that the receiver process has seen
-            seenSender = True                   # The process has seen it now, break off
-            break
-    return seenSender
-
-def obtainIndexOfUuid(clock, uuid):
-    index = 0
-    for idx in range(len(clock)):
-        if clock[idx][0] == uuid:
-            index = idx
-            break
-    return index
+def mergeClocks(processVectorClock, messageVectorClock):
+    return processVectorClock.merge(messageVectorClock)
 
 def deliverMessage(processVectorClock, message, processId, uiUpdater):
     # Print out the message
@@ -48,61 +184,259 @@ def deliverMessage(processVectorClock, message, processId, uiUpdater):
     return newProcessVectorClock
 
 def canDeliver(processVectorClock, message):
+    return processVectorClock.canDeliver(message['clock'], message['sender'])
 
-    delivarable = False
-    # Variable setup
-    messageVectorClock = message["clock"]                       # Message DVC
-    senderUuid = message["sender"]                              # Sender UUID
-
-
-
-    hasSeenSender = seenSender(processVectorClock, senderUuid)
-    mVectorClockSenderIdx = obtainIndexOfUuid(messageVectorClock, senderUuid)
-    
-    if hasSeenSender:
-        # Lets obtain the index of the sender in the process and message VCs
-        pVectorClockSenderIdx = obtainIndexOfUuid(processVectorClock, senderUuid)
-        # Check if the message's sender index in the message VC is 1 greater than the index in the process's DVC
-        senderIndexValid = messageVectorClock[mVectorClockSenderIdx][1] == processVectorClock[pVectorClockSenderIdx][1] + 1 
-    else:
-        #if haven't seen sender, message must be their first
-        senderIndexValid = messageVectorClock[mVectorClockSenderIdx][1] == 1
-
-    # Check other indexes on the message clock are <= the process's clock
-    otherIndexesValid = True                                # Initially, set other_msg_index_valid True (all other known index DC)
-    for row in messageVectorClock:                          # For each known process in the message clock
-        if not row[0] == senderUuid:     
-            pVectorClockOtherUIdx = obtainIndexOfUuid(processVectorClock, row[0])        # Find the row of the other UUID in the process's VC
-            if not row[1] <= processVectorClock[pVectorClockOtherUIdx][1]:
-                otherIndexesValid = False
-                break
-
-    # Set deliverable upon the sender index valid (message > by 1) and each other index in the message VC is <= process's index
-    delivarable = senderIndexValid and otherIndexesValid  
-
-    return delivarable
-
-def handleMessageQueue(processVectorClock, queue, message, uiUpdater):
-    currentVectorClock = processVectorClock
-    firstPass = True
-    iterator = 0
-
-    # Iterate over until we can't deliver any messages/nothing in the queue
-    while True:
-        if len(queue) >= 1:
-            if iterator == len(queue): break                                # Break - queue is exhausted
-            elif queue[iterator] == message and firstPass: iterator += 1    # Iterate to next message in the queue
-            else:
-                queuedMessage = queue[iterator]                             # Grab the next message
-                if canDeliver(currentVectorClock, queuedMessage):           # Can the message be delivered?
-                    currentVectorClock = deliverMessage(currentVectorClock, queuedMessage, message['sender'], uiUpdater)     # Deliver the message if it can be delivered
-                    queue.pop(iterator)                                     # Pop the message from the queue
-                    iterator = 0                                            # Reset iterator to 0
-                    firstPass = False                                       # Not the first pass anymore
-                else:                                                       # If the the message can't be delivered?
-                    iterator += 1                                           # Move to the next iteration
-        else: break
-    return currentVectorClock
+#returns the sender's own entry in a message's clock (the message's sequence number for that sender)
+#messages built by constructMessage also carry it as 'seq'
+def messageSequence(message):
+    if 'seq' in message:
+        return message['seq']
+    for uuid, counter in message['clock']:
+        if uuid == message['sender']:
+            return counter
+    return 0
+
+
+#************************************************************
+#vectorised deliverability
+
+#batches smaller than this are checked one message at a time, as building the matrix costs more than it saves
+vectorisedBatchThreshold = 64
+#maximum number of messages checked per matrix, bounds memory use to rows * clock size counters
+vectorisedChunkRows = 1024
+#number of recent blocked times kept for percentiles (see CausalBuffer.blockedTimePercentile)
+blockedTimeSamples = 10000
+
+#lays out message clocks as rows of a dense matrix, with columns taken from the process clock's slot index
+#processes our clock hasn't seen get extra columns (counting as 0, or as satisfied if retired)
+#returns (uuids, clockRow, matrix, senderCols): the uuid of each column, our clock as a row,
+#the message clocks, and each message's sender column
+def buildClockMatrix(processVectorClock, messages):
+    columns = dict(processVectorClock.index)
+    uuids = [uuid for uuid, counter in processVectorClock.entries]
+    clockRow = [counter for uuid, counter in processVectorClock.entries]
+
+    #flatten the message clocks so the matrix can be filled with a single scatter
+    flatUuids = [uuid for message in messages for uuid, counter in message['clock']]
+    flatCounters = [counter for message in messages for uuid, counter in message['clock']]
+    rowLengths = [len(message['clock']) for message in messages]
+
+    for uuid in set(flatUuids).difference(columns):
+        columns[uuid] = len(uuids)
+        uuids.append(uuid)
+        clockRow.append(numpy.iinfo(numpy.int64).max if processVectorClock.isRetired(uuid) else 0)
+
+    matrix = numpy.zeros((len(messages), len(uuids)), dtype=numpy.int64)
+    matrix[numpy.repeat(numpy.arange(len(messages)), rowLengths), [columns[uuid] for uuid in flatUuids]] = flatCounters
+    senderCols = numpy.array([columns[message['sender']] for message in messages], dtype=numpy.int64)
+    return uuids, numpy.array(clockRow, dtype=numpy.int64), matrix, senderCols
+
+
+#returns how many messages at the start of the batch can be delivered one after another, in batch order
+#the clock before each message is the running max of our clock and the earlier messages' clocks,
+#so a batch that is already in causal order (e.g. a backlog relayed by a single peer) is checked in one pass
+def deliverablePrefix(processVectorClock, messages):
+    uuids, clockRow, matrix, senderCols = buildClockMatrix(processVectorClock, messages)
+    rowIndices = numpy.arange(len(messages))
+    before = numpy.maximum.accumulate(numpy.vstack([clockRow, matrix]), axis=0)[:-1]
+
+    #the sender's entry must be exactly one more than the clock before the message, every other entry <= it
+    sequences = matrix[rowIndices, senderCols]
+    matrix[rowIndices, senderCols] -= 1
+    deliverable = (matrix <= before).all(axis=1) & (sequences > before[rowIndices, senderCols])
+    if deliverable.all():
+        return len(messages)
+    return int(deliverable.argmin())
+
+
+#returns the missing dependency (see DynamicVectorClock.missingDependency) of every message against our current clock,
+#or None for messages that can be delivered now
+#assumes every message's sequence number is > our entry for its sender
+def vectorisedDependencies(processVectorClock, messages):
+    uuids, clockRow, matrix, senderCols = buildClockMatrix(processVectorClock, messages)
+    matrix[numpy.arange(len(messages)), senderCols] -= 1
+    unmet = matrix > clockRow
+    blocked = unmet.any(axis=1)
+    firstUnmet = unmet.argmax(axis=1)
+
+    dependencies = []
+    for row in range(len(messages)):
+        if blocked[row]:
+            column = int(firstUnmet[row])
+            dependencies.append((uuids[column], int(matrix[row, column])))
+        else:
+            dependencies.append(None)
+    return dependencies
+
+
+#************************************************************
+#causal delivery buffer
+
+#holds messages that can't be delivered yet, indexed by the exact (uuid, counter) each one is waiting on
+#delivering a message only re-checks the messages that were waiting on it, so draining a backlog of k
+#messages costs O(k) dependency checks instead of a full rescan of the queue after every delivery
+class CausalBuffer:
+    #vectorised enables the numpy batch checks below for large batches (ignored if numpy isn't installed)
+    def __init__(self, vectorised = False):
+        self.vectorised = vectorised and numpy != None
+        #message id --> [message, dependency, blockedSince], insertion ordered so the oldest is first
+        self.pending = {}
+        #(uuid, counter) --> ids of messages waiting for our clock to reach that counter
+        self.waiting = {}
+        #how long (in seconds) recently delivered messages were held back for
+        self.blockedTimes = deque(maxlen=blockedTimeSamples)
+
+    def pendingDepth(self):
+        return len(self.pending)
+
+    #returns ((uuid, counter), blockedSince) for the longest waiting message, or None if nothing is pending
+    def oldestBlockedDependency(self):
+        for message, dependency, blockedSince in self.pending.values():
+            return (dependency, blockedSince)
+        return None
+
+    #returns the gaps that have held messages back for longer than timeout seconds, as uuid --> the highest counter a
+    #blocked message needs from that process (everything from our clock's entry up to it is missing)
+    def gapsOlderThan(self, timeout):
+        cutoff = time.monotonic() - timeout
+        gaps = {}
+        for message, dependency, blockedSince in self.pending.values():
+            if blockedSince <= cutoff and dependency[1] > gaps.get(dependency[0], 0):
+                gaps[dependency[0]] = dependency[1]
+        return gaps
+
+    #returns the given percentile (0-100) of recent blocked times in seconds, or None if no message has been held back
+    def blockedTimePercentile(self, percentile):
+        if len(self.blockedTimes) == 0:
+            return None
+        blockedTimes = sorted(self.blockedTimes)
+        return blockedTimes[min(len(blockedTimes) - 1, int(len(blockedTimes) * percentile / 100))]
+
+    #undelivered messages, oldest first
+    def pendingMessages(self):
+        return [entry[0] for entry in self.pending.values()]
+
+    #delivers the message if possible (along with anything it unblocks), otherwise holds it back
+    #deliver(message) must merge the message into processVectorClock
+    #messages the clock has already moved past are dropped, as they have already been delivered
+    #as are messages from retired processes, as every live process had delivered all of their messages
+    #heldSince is when the message was first held back, if it is being re-added (see rescan)
+    def add(self, processVectorClock, message, deliver, heldSince = None):
+        if message['id'] in self.pending:
+            return
+        if messageSequence(message) <= processVectorClock.get(message['sender']) or processVectorClock.isRetired(message['sender']):
+            return
+
+        dependency = processVectorClock.missingDependency(message['clock'], message['sender'])
+        if dependency != None:
+            self.park(message, dependency, time.monotonic())
+            return
+
+        deliver(message)
+        if heldSince != None:
+            self.blockedTimes.append(time.monotonic() - heldSince)
+        self.release(processVectorClock, message['sender'], messageSequence(message), deliver)
+
+    def addAll(self, processVectorClock, messages, deliver):
+        now = time.monotonic()
+        self.addBatch(processVectorClock, [(message, now) for message in messages], deliver)
+
+    #adds a batch of (message, blockedSince) pairs, in order
+    #held is True if the messages were already being held back (so their blocked time is recorded when delivered)
+    #large batches are checked with vectorised comparisons if enabled
+    def addBatch(self, processVectorClock, batch, deliver, held = False):
+        if not self.vectorised or len(batch) < vectorisedBatchThreshold:
+            for message, blockedSince in batch:
+                self.add(processVectorClock, message, deliver, blockedSince if held else None)
+                if message['id'] in self.pending:
+                    self.pending[message['id']][2] = blockedSince
+            return
+
+        for start in range(0, len(batch), vectorisedChunkRows):
+            self.addChunk(processVectorClock, batch[start:start + vectorisedChunkRows], deliver, held)
+
+    def addChunk(self, processVectorClock, chunk, deliver, held):
+        candidates = self.newCandidates(processVectorClock, chunk)
+        if len(candidates) == 0:
+            return
+
+        #deliver the causally ordered prefix of the chunk (if it has one, the first message must be deliverable now)
+        prefixLength = 0
+        if processVectorClock.missingDependency(candidates[0][0]['clock'], candidates[0][0]['sender']) == None:
+            prefixLength = deliverablePrefix(processVectorClock, [message for message, blockedSince in candidates])
+        for message, blockedSince in candidates[:prefixLength]:
+            deliver(message)
+            if held:
+                self.blockedTimes.append(time.monotonic() - blockedSince)
+            self.release(processVectorClock, message['sender'], messageSequence(message), deliver)
+
+        #check everything after it against the clock we've now reached
+        candidates = self.newCandidates(processVectorClock, candidates[prefixLength:])
+        if len(candidates) == 0:
+            return
+        dependencies = vectorisedDependencies(processVectorClock, [message for message, blockedSince in candidates])
+
+        #park blocked messages first, so that the deliveries below can release them
+        for (message, blockedSince), dependency in zip(candidates, dependencies):
+            if dependency != None:
+                self.park(message, dependency, blockedSince)
+
+        #every unblocked message was deliverable against the clock before these deliveries, and stays deliverable
+        #as deliveries only raise the clock (a sender's entry is only raised by delivering that sender's next message)
+        #the sequence check skips copies of a message that were already delivered under a different id
+        for (message, blockedSince), dependency in zip(candidates, dependencies):
+            if dependency != None or messageSequence(message) <= processVectorClock.get(message['sender']):
+                continue
+            deliver(message)
+            if held:
+                self.blockedTimes.append(time.monotonic() - blockedSince)
+            self.release(processVectorClock, message['sender'], messageSequence(message), deliver)
+
+    #(message, blockedSince) pairs that aren't already held, already delivered, or from retired processes
+    def newCandidates(self, processVectorClock, batch):
+        candidates = []
+        for message, blockedSince in batch:
+            if message['id'] in self.pending:
+                continue
+            if messageSequence(message) <= processVectorClock.get(message['sender']) or processVectorClock.isRetired(message['sender']):
+                continue
+            candidates.append((message, blockedSince))
+        return candidates
+
+    #called once processVectorClock has reached counter for uuid
+    #re-checks only the messages waiting on that entry, and follows any chain of deliveries it causes
+    def release(self, processVectorClock, uuid, counter, deliver):
+        released = [(uuid, counter)]
+        while len(released) > 0:
+            for messageId in self.waiting.pop(released.pop(), []):
+                entry = self.pending.get(messageId, None)
+                if entry == None:
+                    continue
+                message = entry[0]
+                if messageSequence(message) <= processVectorClock.get(message['sender']) or processVectorClock.isRetired(message['sender']):
+                    del self.pending[messageId]
+                    continue
+
+                dependency = processVectorClock.missingDependency(message['clock'], message['sender'])
+                if dependency != None:
+                    self.park(message, dependency, entry[2])
+                    continue
+
+                del self.pending[messageId]
+                deliver(message)
+                self.blockedTimes.append(time.monotonic() - entry[2])
+                released.append((message['sender'], messageSequence(message)))
+
+    #re-checks every held message, used after the clock changes by more than a single delivery
+    def rescan(self, processVectorClock, deliver):
+        held = list(self.pending.values())
+        self.pending = {}
+        self.waiting = {}
+        self.addBatch(processVectorClock, [(message, blockedSince) for message, dependency, blockedSince in held], deliver, True)
+
+    def park(self, message, dependency, blockedSince):
+        self.pending[message['id']] = [message, dependency, blockedSince]
+        self.waiting.setdefault(dependency, []).append(message['id'])
 
 '''
 Bibliography
@@ -0,0 +1,105 @@
+import unittest
+import uuid
+from shared.client_message import MessageType, constructMessage, constructHello
+from shared.codec import jsonCodec, binaryCodec, codecForFrame, encodeMessage
+from shared.delta_clock import DeltaClockEncoder, DeltaClockDecoder
+from shared.process_ids import ProcessIdTable, ProcessIdEncoder, ProcessIdDecoder
+from shared.vector_clock import messageSequence
+
+#decodes a frame the way a read worker does, with the codec it says it was encoded with
+def decodeFrame(frame):
+    return codecForFrame(frame).decode(frame)
+
+
+class CodecTest(unittest.TestCase):
+    def setUp(self):
+        self.sender = str(uuid.uuid4())
+        self.other = str(uuid.uuid4())
+        self.clock = [[self.sender, 7], [self.other, 3]]
+
+    def broadcast(self, text = 'hello'):
+        return constructMessage(MessageType.BROADCAST_MESSAGE, self.clock, text, self.sender, '127.0.0.1')
+
+    def testRoundTripWithSeq(self):
+        message = self.broadcast()
+        for codec in [jsonCodec, binaryCodec]:
+            decoded = decodeFrame(bytes(codec.encode(message)))
+            self.assertEqual(decoded, message)
+
+    def testRoundTripWithoutSeq(self):
+        message = self.broadcast()
+        del message['seq']
+        for codec in [jsonCodec, binaryCodec]:
+            decoded = decodeFrame(bytes(codec.encode(message)))
+            self.assertEqual(decoded['clock'], self.clock)
+            self.assertEqual(messageSequence(decoded), 7)
+        self.assertEqual(binaryCodec.peekEnvelope(bytes(binaryCodec.encode(message))), (self.sender, 7))
+
+    def testDeltaClockWithoutSeqFallsBackToJson(self):
+        message = self.broadcast()
+        del message['seq']
+        encoded = DeltaClockEncoder().encodeMessage(message)
+        self.assertIsNone(binaryCodec.encode(encoded))
+        self.assertIs(codecForFrame(bytes(encodeMessage(binaryCodec, encoded))), jsonCodec)
+
+    def testBinaryDecodeRejectsOtherTypes(self):
+        frame = bytearray(binaryCodec.encode(self.broadcast()))
+        for messageType in [MessageType.HELLO, 99]:
+            frame[2] = messageType
+            self.assertIsNone(binaryCodec.decode(bytes(frame)))
+            self.assertIsNone(binaryCodec.peekEnvelope(bytes(frame)))
+
+    def testControlMessagesAreSentAsJson(self):
+        hello = constructHello(self.sender, '127.0.0.1')
+        self.assertIsNone(binaryCodec.encode(hello))
+        self.assertEqual(decodeFrame(bytes(encodeMessage(binaryCodec, hello))), hello)
+
+    def testTruncatedBinaryFrameIsRejected(self):
+        frame = bytes(binaryCodec.encode(self.broadcast()))
+        for length in range(len(frame) - 1):
+            self.assertIsNone(binaryCodec.decode(frame[:length]))
+
+
+#a link's delta clock and process id state, applied in the same order client.py does
+class LinkEncodingTest(unittest.TestCase):
+    def setUp(self):
+        self.processes = [str(uuid.uuid4()) for i in range(4)]
+        self.clockEncoder = DeltaClockEncoder()
+        self.idEncoder = ProcessIdEncoder(ProcessIdTable())
+        self.clockDecoder = DeltaClockDecoder()
+        self.idDecoder = ProcessIdDecoder()
+
+    def send(self, codec, message):
+        encoded = self.idEncoder.encodeMessage(self.clockEncoder.encodeMessage(message))
+        return bytes(encodeMessage(codec, encoded))
+
+    def receive(self, frame):
+        message = self.idDecoder.decodeMessage(decodeFrame(frame))
+        message['clock'] = self.clockDecoder.decode(message.pop('clockDelta'))
+        return message
+
+    def testDeltaAndInternedRoundTrip(self):
+        counters = {process: 0 for process in self.processes}
+        for step in range(20):
+            sender = self.processes[step % len(self.processes)]
+            counters[sender] += 1
+            clock = [[process, counter] for process, counter in counters.items() if counter > 0]
+            message = constructMessage(MessageType.BROADCAST_MESSAGE, clock, 'message {0}'.format(step), sender, '127.0.0.1')
+            codec = binaryCodec if step % 2 == 0 else jsonCodec
+            received = self.receive(self.send(codec, message))
+            self.assertEqual(received['sender'], sender)
+            self.assertEqual(sorted(received['clock']), sorted(clock))
+            self.assertEqual(messageSequence(received), counters[sender])
+
+    def testOnlyUsedProcessNumbersAreAnnounced(self):
+        for process in self.processes:
+            self.idEncoder.table.intern(process)
+        first, second = self.processes[:2]
+        encoded = self.idEncoder.encodeMessage({'sender': first, 'clock': [[first, 1]]})
+        self.assertEqual(encoded['processIds'], [[0, first]])
+        encoded = self.idEncoder.encodeMessage({'sender': second, 'clock': [[first, 1], [second, 1]]})
+        self.assertEqual(encoded['processIds'], [[1, second]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+from unittest import mock
+import unittest
+import random
+import shared.impairment
+from shared.impairment import TimerWheel
+
+#drives a TimerWheel from a fake clock, in ticks, so idle gaps don't take real time
+class FakeClock:
+    def __init__(self):
+        self.time = 0
+
+    def monotonic(self):
+        return self.time
+
+
+class TimerWheelTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(shared.impairment.time, 'monotonic', self.clock.monotonic)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    #a small wheel (4 levels of 4 slots, 256 ticks) so gaps longer than its range are cheap to test
+    def smallWheel(self):
+        return TimerWheel(1, slotBits = 2, levels = 4)
+
+    #advances the wheel the way NetworkImpairment.run does, returning the tick each item fired at
+    def runUntilEmpty(self, wheel, fired):
+        while wheel.size > 0:
+            self.clock.time = max(self.clock.time, wheel.nextTick())
+            for item in wheel.advance(wheel.now()):
+                fired[item] = wheel.now()
+
+    def testTimerAfterIdleGapLongerThanRangeFiresOnTime(self):
+        wheel = self.smallWheel()
+        fired = {}
+        wheel.add(3, 'first')
+        self.runUntilEmpty(wheel, fired)
+
+        self.clock.time += 100000
+        due = wheel.add(5, 'second')
+        self.assertEqual(due, self.clock.time + 5)
+        self.assertEqual(wheel.advance(wheel.now()), [])
+        self.runUntilEmpty(wheel, fired)
+        self.assertEqual(fired['second'], due)
+
+    def testEmptyWheelCatchesUpBeforeAddingTimer(self):
+        wheel = TimerWheel(1)
+        self.clock.time = 10 ** 7
+        wheel.add(10, 'timer')
+        #so advance doesn't have to step through the idle ticks one at a time
+        self.assertEqual(wheel.current, self.clock.time)
+        self.clock.time += 10
+        self.assertEqual(wheel.advance(wheel.now()), ['timer'])
+
+    def testRandomTimersAndIdleGapsNeverFireEarlyOrLate(self):
+        generator = random.Random(1)
+        wheel = self.smallWheel()
+        expected = {}
+        fired = {}
+        for item in range(20000):
+            if wheel.size == 0 and generator.random() < 0.1:
+                self.clock.time += generator.randint(0, 100000)
+            elif wheel.size > 0 and generator.random() < 0.3:
+                #let the scheduler catch up to some point before the next timer is added
+                for firedItem in wheel.advance(wheel.now()):
+                    fired[firedItem] = wheel.now()
+                self.clock.time = generator.randint(self.clock.time, wheel.nextTick())
+            expected[item] = wheel.add(generator.randint(0, 250), item)
+        self.runUntilEmpty(wheel, fired)
+        self.assertEqual(fired, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+import unittest
+import tempfile
+import os
+import uuid
+from shared.message_log import MessageLog
+
+#a small log: segments of 4KB, of which 4 are kept
+def openLog(directory):
+    return MessageLog(directory, 4096, 4, False)
+
+def body(sender, sequence):
+    return '{0}:{1}'.format(sender, sequence).encode('utf-8')
+
+
+class MessageLogTest(unittest.TestCase):
+    def setUp(self):
+        temporary = tempfile.TemporaryDirectory()
+        self.addCleanup(temporary.cleanup)
+        self.directory = temporary.name
+        self.sender = str(uuid.uuid4())
+
+    def appendAll(self, log, sequences):
+        for sequence in sequences:
+            log.append(self.sender, sequence, body(self.sender, sequence))
+        log.commit()
+
+    #the path of the segment being appended to
+    def activeSegmentPath(self):
+        numbers = sorted(int(name[:-4]) for name in os.listdir(self.directory) if name.endswith('.log'))
+        return os.path.join(self.directory, '{0:08d}.log'.format(numbers[-1]))
+
+    def testLookupAfterReopen(self):
+        log = openLog(self.directory)
+        self.appendAll(log, range(1, 101))
+        log.close()
+
+        log = openLog(self.directory)
+        self.addCleanup(log.close)
+        self.assertEqual(log.statistics['recovered'], 100)
+        self.assertGreater(log.size()[0], 1)
+        for sequence in range(1, 101):
+            self.assertEqual(log.lookup(self.sender, sequence), body(self.sender, sequence))
+        self.assertIsNone(log.lookup(self.sender, 101))
+        self.assertTrue(log.isLogged(self.sender, 100))
+
+    def testTornTailIsTruncatedOnReopen(self):
+        log = openLog(self.directory)
+        self.appendAll(log, range(1, 6))
+        log.close()
+        path = self.activeSegmentPath()
+        intactSize = os.path.getsize(path)
+
+        #the first part of a record that was being written when the process died
+        log = openLog(self.directory)
+        log.append(self.sender, 6, body(self.sender, 6))
+        log.close()
+        with open(path, 'r+b') as segmentFile:
+            segmentFile.truncate(os.path.getsize(path) - 3)
+
+        log = openLog(self.directory)
+        self.addCleanup(log.close)
+        self.assertEqual(os.path.getsize(path), intactSize)
+        self.assertIsNone(log.lookup(self.sender, 6))
+        for sequence in range(1, 6):
+            self.assertEqual(log.lookup(self.sender, sequence), body(self.sender, sequence))
+
+        #the dropped record's index slot is reused by the broadcast when it is logged again
+        self.appendAll(log, range(6, 9))
+        for sequence in range(1, 9):
+            self.assertEqual(log.lookup(self.sender, sequence), body(self.sender, sequence))
+        self.assertEqual(len(log.page(None, 100)), 8)
+
+    def testCorruptTailIsTruncatedOnReopen(self):
+        log = openLog(self.directory)
+        self.appendAll(log, range(1, 4))
+        log.close()
+        path = self.activeSegmentPath()
+        intactSize = os.path.getsize(path)
+        with open(path, 'ab') as segmentFile:
+            segmentFile.write(os.urandom(100))
+
+        log = openLog(self.directory)
+        self.addCleanup(log.close)
+        self.assertEqual(os.path.getsize(path), intactSize)
+        self.assertEqual(log.statistics['recovered'], 3)
+        self.appendAll(log, [4])
+        self.assertEqual(log.lookup(self.sender, 4), body(self.sender, 4))
+
+    def testSequenceZeroIsRejected(self):
+        log = openLog(self.directory)
+        self.addCleanup(log.close)
+        self.assertIsNone(log.append(self.sender, 0, body(self.sender, 0)))
+        log.commit()
+        self.assertEqual(log.size()[1:], (0, 0))
+        self.assertIsNone(log.lookup(self.sender, 0))
+
+    def testNewerThanLimit(self):
+        other = str(uuid.uuid4())
+        log = openLog(self.directory)
+        self.addCleanup(log.close)
+        self.appendAll(log, range(1, 11))
+        log.append(other, 1, body(other, 1))
+        log.commit()
+        clock = [[self.sender, 2]]
+        newer = log.newerThan(clock, float('inf'), lambda sender: True)
+        self.assertEqual(len(newer), 9)
+        self.assertEqual(newer[:3], [body(other, 1), body(self.sender, 3), body(self.sender, 4)])
+        limited = log.newerThan(clock, float('inf'), lambda sender: True, limit = 3)
+        self.assertEqual(limited, newer[:3])
+        self.assertEqual(log.newerThan(clock, float('inf'), lambda sender: sender != other), newer[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()